@@ -0,0 +1,284 @@
+import argparse
+import difflib
+import os
+import resource
+import time
+import tracemalloc
+import cv2
+import numpy as np
+import pandas as pd
+from crop_functions import *
+
+# stages in the order the crop pipeline runs them
+STAGES = ["get_contours", "contour_df", "main_bbox", "check_for_marginalia", "remove_child_marginalia", "crop_round2"]
+
+
+def synthetic_page(seed, width=2400, height=3600):
+    """
+    This function draws a synthetic statute page with a known layout: a justified text block, a running header,
+    marginal notes on the left or right, a scan shadow along one edge and a faint library stamp.
+
+    Parameters:
+    seed (int): The random seed, the same seed always draws the same page.
+    width (int): The page width in pixels. Default is 2400.
+    height (int): The page height in pixels. Default is 3600.
+
+    Returns:
+    tuple: The page as a BGR image and a dict with the text block box (text_x1, text_y1, text_x2, text_y2)
+           and the side of the marginalia ('left', 'right' or None).
+    """
+    rng = np.random.default_rng(seed)
+    img = np.full((height, width, 3), 238, np.uint8)
+    img = cv2.add(img, rng.integers(0, 12, img.shape, dtype=np.uint8))
+    scale = width / 2400
+
+    # text block with a little jitter between pages, as scans never line up exactly
+    text_x1 = int(width * 0.17) + int(rng.integers(-30, 30) * scale)
+    text_x2 = int(width * 0.83) + int(rng.integers(-30, 30) * scale)
+    text_y1 = int(height * 0.09) + int(rng.integers(-20, 20) * scale)
+    text_y2 = int(height * 0.90) + int(rng.integers(-20, 20) * scale)
+    line_height = int(44 * scale)
+    word_height = int(22 * scale)
+    for y in range(text_y1, text_y2 - word_height, line_height):
+        x = text_x1 + (int(60 * scale) if rng.random() < 0.15 else 0)
+        while x < text_x2:
+            word = int(rng.integers(30, 180) * scale)
+            cv2.rectangle(img, (x, y), (min(x + word, text_x2), y + word_height), (25, 25, 25), -1)
+            x += word + int(24 * scale)
+    text_y2 = y + word_height
+
+    # running header centred above the text block
+    header_y = text_y1 - int(110 * scale)
+    cv2.putText(img, f"{1900 + seed % 60} ACTS OF ASSEMBLY {seed + 1}", (int(width * 0.33), header_y),
+                cv2.FONT_HERSHEY_COMPLEX, 1.6 * scale, (30, 30, 30), max(1, int(3 * scale)))
+
+    # marginal notes beside some of the paragraphs
+    side = rng.choice(["left", "right", None])
+    if side is not None:
+        note_width = int(rng.integers(120, 200) * scale)
+        for y in range(text_y1 + int(200 * scale), text_y2 - int(200 * scale), int(rng.integers(500, 900) * scale)):
+            for line in range(int(rng.integers(2, 5))):
+                yy = y + line * int(30 * scale)
+                if side == "left":
+                    x2 = text_x1 - int(60 * scale)
+                    cv2.rectangle(img, (x2 - note_width, yy), (x2, yy + int(16 * scale)), (45, 45, 45), -1)
+                else:
+                    x1 = text_x2 + int(60 * scale)
+                    cv2.rectangle(img, (x1, yy), (x1 + note_width, yy + int(16 * scale)), (45, 45, 45), -1)
+
+    # scan shadow darkening towards the gutter
+    shadow = int(rng.integers(20, 60) * scale)
+    ramp = np.linspace(1.0, 0.3, shadow)[None, :, None]
+    if rng.random() < 0.5:
+        img[:, width - shadow:] = (img[:, width - shadow:] * ramp).astype(np.uint8)
+    else:
+        img[:, :shadow] = (img[:, :shadow] * ramp[:, ::-1]).astype(np.uint8)
+
+    # faint round library stamp in a top corner
+    cx = int(width * (0.08 if rng.random() < 0.5 else 0.92))
+    cv2.circle(img, (cx, int(height * 0.04)), int(70 * scale), (170, 170, 170), max(1, int(6 * scale)))
+
+    layout = {'text_x1': text_x1, 'text_y1': text_y1, 'text_x2': text_x2, 'text_y2': text_y2, 'marginalia': side}
+    return img, layout
+
+
+def timed_bbox(img, dil_iter, x_buffer, y_buffer, timings, shared=True):
+    """
+    This function runs the crop stages on a page, adding the time spent in each stage to timings.
+    It follows crop.page_bbox, but any failed stage is raised instead of being reported.
+
+    Parameters:
+    img (ndarray): The page image.
+    dil_iter (int): Number of dilation iterations.
+    x_buffer (int): Horizontal buffer for the bounding box.
+    y_buffer (int): Vertical buffer for the bounding box.
+    timings (dict): Seconds per stage, updated in place.
+    shared (bool): Share one PageAnalysis between the stages as the crop pipeline does. With False every stage
+                   converts, thresholds and dilates its own input and contour_df builds a DataFrame. Default is True.
+
+    Returns:
+    tuple: The x1, y1, x2, y2 coordinates of the crop box.
+    """
+    def clock(stage, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        timings[stage] += time.perf_counter() - start
+        return result
+
+    if shared:
+        page = clock("get_contours", PageAnalysis, img, dil_iter)
+        contours, hierarchy = clock("get_contours", page.contours)
+        c_df = clock("contour_df", contour_table, img, contours, hierarchy)
+    else:
+        contours, hierarchy = clock("get_contours", get_contours, img, dil_iter)
+        c_df = clock("contour_df", contour_df, img, contours, hierarchy)
+    x1, x2, y1, y2 = clock("main_bbox", main_bbox, img, c_df, x_buffer, y_buffer)
+    cropped = img[y1:y2, x1:x2]
+    if clock("check_for_marginalia", check_for_marginalia, cropped):
+        region = page.region(y1, y2, x1, x2) if shared else None
+        x1 = x1 + clock("remove_child_marginalia", remove_child_marginalia, cropped, dil_iter, region)
+    cropped = img[y1:y2, x1:x2]
+    region = page.region(y1, y2, x1, x2) if shared else None
+    top_diff, bottom_diff = clock("crop_round2", crop_round2, cropped, dil_iter, region)
+    return x1, y1 + top_diff, x2, y2 - bottom_diff
+
+
+def check_box(box, layout, x_buffer, tolerance):
+    """
+    This function compares a crop box with the known layout of a synthetic page.
+
+    Parameters:
+    box (tuple): The x1, y1, x2, y2 coordinates of the crop box.
+    layout (dict): The layout returned by synthetic_page.
+    x_buffer (int): The horizontal buffer the box was found with.
+    tolerance (int): The largest distance in pixels between a box edge and the expected edge.
+
+    Returns:
+    dict: The distance of each edge from the text block (with x_buffer), whether the box keeps all of the
+          text, and whether every edge is within the tolerance.
+    """
+    expected = (layout['text_x1'] - x_buffer, layout['text_y1'], layout['text_x2'] + x_buffer, layout['text_y2'])
+    errors = {f"err_{coord}": int(box[i] - expected[i]) for i, coord in enumerate(["x1", "y1", "x2", "y2"])}
+    keeps_text = (box[0] <= layout['text_x1'] and box[1] <= layout['text_y1']
+                  and box[2] >= layout['text_x2'] and box[3] >= layout['text_y2'])
+    return dict(errors, keeps_text=keeps_text, correct=all(abs(e) <= tolerance for e in errors.values()))
+
+
+def run_benchmark(pages=20, width=2400, height=3600, dil_iter=27, x_buffer=20, y_buffer=20, tolerance=40, seed=0, shared=True):
+    """
+    This function times the crop stages on synthetic pages and checks the boxes against their known layout.
+    The pages are generated before timing starts, so only the crop stages are measured.
+
+    Parameters:
+    pages (int): The number of synthetic pages. Default is 20.
+    width, height (int): The page size in pixels. Default is 2400 x 3600, about a 300 dpi scan.
+    dil_iter, x_buffer, y_buffer (int): The crop parameters. Default is 27, 20, 20 as in crop_all_volumes.
+    tolerance (int): The largest edge distance in pixels for a box to count as correct. Default is 40.
+    seed (int): The seed of the first page. Default is 0.
+    shared (bool): Share one PageAnalysis between stages, see timed_bbox. Default is True.
+
+    Returns:
+    tuple: A DataFrame with one row per page and a dict with the summary that is printed.
+    """
+    samples = [synthetic_page(seed + i, width, height) for i in range(pages)]
+    timings = {stage: 0.0 for stage in STAGES}
+    rows = []
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    for i, (img, layout) in enumerate(samples):
+        try:
+            box = timed_bbox(img, dil_iter, x_buffer, y_buffer, timings, shared)
+            row = dict({'page': seed + i, 'error': False}, **check_box(box, layout, x_buffer, tolerance))
+        except Exception as e:
+            row = {'page': seed + i, 'error': True, 'keeps_text': False, 'correct': False}
+            print(f"page {seed + i} failed: {e}")
+        rows.append(row)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    df = pd.DataFrame(rows)
+    summary = {
+        'pages': pages,
+        'pages_per_sec': pages / elapsed,
+        'peak_traced_mb': peak / 2**20,
+        'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'correct': df['correct'].mean(),
+        'keeps_text': df['keeps_text'].mean(),
+    }
+    print(f"{pages} pages of {width}x{height} in {elapsed:.2f}s, {summary['pages_per_sec']:.2f} pages/sec")
+    for stage in STAGES:
+        print(f"  {stage:<24} {timings[stage] / pages * 1000:8.1f} ms/page  {timings[stage] / elapsed:6.1%}")
+    print(f"peak traced memory {summary['peak_traced_mb']:.1f} MB, max RSS {summary['max_rss_mb']:.1f} MB")
+    print(f"{summary['correct']:.1%} of boxes within {tolerance}px of the layout, {summary['keeps_text']:.1%} keep all of the text")
+    return df, summary
+
+
+def char_diff(reference, text):
+    """
+    This function compares two OCR texts character by character.
+
+    Parameters:
+    reference (str): The text of the current OCR path.
+    text (str): The text to compare with it.
+
+    Returns:
+    tuple: The number of characters inserted, deleted or replaced to turn reference into text, and that number as
+           a share of the length of reference (the character error rate against reference).
+    """
+    matcher = difflib.SequenceMatcher(None, reference, text, autojunk=False)
+    changed = sum(max(i2 - i1, j2 - j1) for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal')
+    return changed, changed / max(len(reference), 1)
+
+def ocr_input_benchmark(volume, sample=20, dpi=300, source_dpi=300, dir='cropped', virtual=False, backend='auto', seed=0):
+    """
+    This function compares the OCR input modes of ocr.prepare_input on a sample of pages from a volume: the time
+    Tesseract takes per page with each, and how far the text of the 'binary' pages is from the current 'color' 
+    path. The results are saved to {volume}_ocrinput.csv. Run it from the directory that holds images/.
+
+    Parameters:
+    volume (str): The volume to sample pages from.
+    sample (int): The number of pages. Default is 20.
+    dpi (int): The resolution of the 'binary' pages. Default is 300.
+    source_dpi (int): The resolution the volume was scanned at. Default is 300.
+    dir (str): The name of the directory containing cropped images. Default is 'cropped'.
+    virtual (bool): Crop the original images in memory, see ocr.ocr_cropped_volume. Default is False.
+    backend (str): The OCR backend, see ocr.start_backend. Default is 'auto'.
+    seed (int): The random seed for the sample. Default is 0.
+
+    Returns:
+    DataFrame: One row per page with the seconds taken by each mode and the character difference.
+    """
+    import random
+    from ocr import list_pages, load_page, prepare_input, start_backend
+
+    content = list_pages(volume, dir, virtual)
+    content = sorted(random.Random(seed).sample(content, min(sample, len(content))), key=lambda page: page[0])
+    engine = start_backend(backend)
+    rows = []
+    for name, page in content:
+        img = load_page(volume, page)
+        row = {'filename': name}
+        texts = {}
+        for mode in ('color', 'binary'):
+            start = time.perf_counter()
+            prepared, _ = prepare_input(img, mode, dpi, source_dpi)
+            texts[mode] = engine.image_to_string(prepared)
+            row[f"{mode}_sec"] = time.perf_counter() - start
+        row['chars'] = len(texts['color'])
+        row['chars_changed'], row['char_error_rate'] = char_diff(texts['color'], texts['binary'])
+        print(f"{name}: {row['color_sec']:.2f}s color, {row['binary_sec']:.2f}s binary, {row['char_error_rate']:.2%} of characters changed")
+        rows.append(row)
+
+    df = pd.DataFrame(rows)
+    if len(df) == 0:
+        print(f"No pages found for Volume {volume}")
+        return df
+    print(f"{len(df)} pages with {engine.name}: {df['color_sec'].mean():.2f}s per page color, {df['binary_sec'].mean():.2f}s per page "
+          f"binary at {dpi} dpi ({df['color_sec'].sum() / df['binary_sec'].sum():.2f}x), "
+          f"{df['chars_changed'].sum() / max(df['chars'].sum(), 1):.2%} of characters changed")
+    df.to_csv(os.path.join(os.getcwd(), "images", str(volume), f"{volume}_ocrinput.csv"), index=False)
+    return df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the crop stages on synthetic pages.")
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--width", type=int, default=2400)
+    parser.add_argument("--height", type=int, default=3600)
+    parser.add_argument("--dil-iter", type=int, default=27)
+    parser.add_argument("--x-buffer", type=int, default=20)
+    parser.add_argument("--y-buffer", type=int, default=20)
+    parser.add_argument("--tolerance", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--standalone", action="store_true", help="run each stage on its own input instead of sharing one page analysis")
+    parser.add_argument("--ocr-volume", help="compare the OCR input modes on a sample of this volume instead")
+    parser.add_argument("--dpi", type=int, default=300)
+    parser.add_argument("--source-dpi", type=int, default=300)
+    args = parser.parse_args()
+    if args.ocr_volume:
+        ocr_input_benchmark(args.ocr_volume, args.pages, args.dpi, args.source_dpi, seed=args.seed)
+    else:
+        run_benchmark(args.pages, args.width, args.height, args.dil_iter, args.x_buffer, args.y_buffer,
+                      args.tolerance, args.seed, not args.standalone)
@@ -0,0 +1,239 @@
+import csv
+import importlib.util
+import os
+import shutil
+import pandas as pd
+
+# the corpus can be moved by setting CORPUS_DIR, it holds one folder per volume, volume=<volume>/part-0.parquet,
+# which pandas and pyarrow read as a dataset partitioned by volume
+CORPUS_DIR = os.environ.get('CORPUS_DIR', os.path.join(os.getcwd(), "corpus"))
+CORPUS_CSV = os.path.join(os.getcwd(), "aggregate_laws.csv")
+COLUMNS = ['filename', 'volume', 'lawnumber', 'lawtext']
+
+def has_pyarrow():
+    """
+    This function checks whether the optional pyarrow package is installed, without loading it.
+
+    Returns:
+        bool: True if pyarrow can be imported.
+    """
+    return importlib.util.find_spec('pyarrow') is not None
+
+def law_files(volume):
+    """
+    This function lists the law files of a volume in law number order, leaving out the material before the first law.
+
+    PARAMETERS:
+        volume (str): The volume id.
+
+    Returns:
+        list: (filename, law number, path) for each law.
+    """
+    laws_dir = os.path.join(os.getcwd(), "images", str(volume), "laws")
+    laws = []
+    for filename in os.listdir(laws_dir):
+        if filename.endswith('.txt') and not filename.startswith("preceeding"):
+            start = filename.index("law") + len("law")
+            end = filename.index(".", start)
+            laws.append((filename, int(filename[start:end]), os.path.join(laws_dir, filename)))
+    return sorted(laws, key=lambda law: law[1])
+
+def read_law(path):
+    """
+    This function reads the text of a law file.
+    """
+    with open(path, 'r', encoding="utf-8") as law:
+        return law.read()
+
+def law_volumes():
+    """
+    This function lists the volumes that have been split into laws, in the order they are kept in the corpus.
+    """
+    images = os.path.join(os.getcwd(), "images")
+    return sorted(volume for volume in os.listdir(images) if os.path.isdir(os.path.join(images, volume, "laws")))
+
+def partition_path(volume, corpus_dir=None):
+    """
+    This function returns the file that holds the laws of a volume in the corpus.
+    """
+    return os.path.join(corpus_dir or CORPUS_DIR, f"volume={volume}", "part-0.parquet")
+
+def partition_current(volume, corpus_dir=None):
+    """
+    This function checks whether the corpus partition of a volume holds the laws as they are in its law files. The
+    law files are the source of truth, a partition older than the laws folder or any law file was written before 
+    the laws were broken again or corrected by hand.
+
+    PARAMETERS:
+        volume (str): The volume id.
+        corpus_dir (str): The corpus directory (default is CORPUS_DIR).
+
+    Returns:
+        bool: True if the partition can be read instead of the law files, always False without pyarrow.
+    """
+    path = partition_path(volume, corpus_dir)
+    if not has_pyarrow() or not os.path.exists(path):
+        return False
+    laws_dir = os.path.join(os.getcwd(), "images", str(volume), "laws")
+    if not os.path.isdir(laws_dir):
+        return True
+    written = os.path.getmtime(path)
+    #the folder changes when law files are added, removed or swapped in by break_laws 
+    return os.path.getmtime(laws_dir) <= written and all(os.path.getmtime(law) <= written for _, _, law in law_files(volume))
+
+def volume_table(volume):
+    """
+    This function reads the laws of one volume into an Arrow table with compact typed columns.
+
+    PARAMETERS:
+        volume (str): The volume id.
+
+    Returns:
+        pyarrow.Table: filename, lawnumber (int32) and lawtext columns, one row per law in law number order.
+    """
+    import pyarrow as pa
+    laws = law_files(volume)
+    texts = [read_law(path) for _, _, path in laws]
+    return pa.table({'filename': pa.array([law[0] for law in laws], pa.string()),
+                     'lawnumber': pa.array([law[1] for law in laws], pa.int32()),
+                     'lawtext': pa.array(texts, pa.large_string())})
+
+def write_volume(volume, corpus_dir=None):
+    """
+    This function writes the laws of one volume to its corpus partition, replacing it in one step.
+
+    PARAMETERS:
+        volume (str): The volume id.
+        corpus_dir (str): The corpus directory (default is CORPUS_DIR).
+
+    Returns:
+        pyarrow.Table: The laws written, see volume_table.
+    """
+    import pyarrow.parquet as pq
+    table = volume_table(volume)
+    path = partition_path(volume, corpus_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pq.write_table(table, f"{path}.tmp", compression='zstd')
+    os.replace(f"{path}.tmp", path)
+    return table
+
+def write_corpus(volumes=None, corpus_dir=None, csv_path=None):
+    """
+    This function builds the corpus one volume at a time, so only the laws of one volume are held in memory.
+    Partitions of volumes that no longer have laws are removed when every volume is written.
+
+    PARAMETERS:
+        volumes (list): The volumes to write (default is None, every volume with laws).
+        corpus_dir (str): The corpus directory (default is CORPUS_DIR).
+        csv_path (str): Also write the laws of these volumes to one CSV file, as aggregate_laws.csv used to be
+                        (default is None, no CSV). Without pyarrow only the CSV is written, to CORPUS_CSV if not given.
+
+    Returns:
+        int: The number of laws written.
+    """
+    corpus_dir = corpus_dir or CORPUS_DIR
+    arrow = has_pyarrow()
+    if not arrow:
+        print("pyarrow is not installed, writing the corpus to CSV only")
+        csv_path = csv_path or CORPUS_CSV
+    selected = law_volumes() if volumes is None else sorted(str(volume) for volume in volumes)
+
+    total = 0
+    outfile = open(f"{csv_path}.tmp", 'w', newline='', encoding="utf-8") if csv_path else None
+    try:
+        if outfile:
+            writer = csv.writer(outfile, lineterminator='\n')
+            writer.writerow(COLUMNS)
+        for volume in selected:
+            if arrow:
+                table = write_volume(volume, corpus_dir)
+                total += table.num_rows
+                rows = zip(*(table[column].to_pylist() for column in ['filename', 'lawnumber', 'lawtext']))
+            else:
+                laws = law_files(volume)
+                total += len(laws)
+                rows = ((filename, lawnumber, read_law(path)) for filename, lawnumber, path in laws)
+            if outfile:
+                for filename, lawnumber, lawtext in rows:
+                    writer.writerow([filename, volume, lawnumber, lawtext])
+    finally:
+        if outfile:
+            outfile.close()
+    if csv_path:
+        os.replace(f"{csv_path}.tmp", csv_path)
+
+    if arrow and volumes is None and os.path.isdir(corpus_dir):
+        for partition in os.listdir(corpus_dir):
+            if partition.startswith("volume=") and partition[len("volume="):] not in selected:
+                shutil.rmtree(os.path.join(corpus_dir, partition))
+    print(f"Gathered {total} laws from {len(selected)} volumes")
+    return total
+
+def corpus_volumes(corpus_dir=None):
+    """
+    This function lists the volumes in the corpus.
+    """
+    corpus_dir = corpus_dir or CORPUS_DIR
+    if not os.path.isdir(corpus_dir):
+        return []
+    return sorted(partition[len("volume="):] for partition in os.listdir(corpus_dir)
+                  if partition.startswith("volume=") and os.path.exists(os.path.join(corpus_dir, partition, "part-0.parquet")))
+
+def iter_corpus(volumes=None, columns=None, corpus_dir=None):
+    """
+    This function reads the corpus one volume at a time. Only the partitions of the volumes asked for are opened
+    and only the columns asked for are read from them.
+
+    PARAMETERS:
+        volumes (list): The volumes to read (default is None, every volume).
+        columns (list): The columns to read, from COLUMNS (default is None, every column).
+        corpus_dir (str): The corpus directory (default is CORPUS_DIR).
+
+    Returns:
+        generator: A DataFrame of the laws of each volume, in volume and law number order.
+    """
+    columns = columns or COLUMNS
+    if not has_pyarrow():
+        #the CSV is read in chunks and filtered, it has to be parsed in full
+        selected = None if volumes is None else {str(volume) for volume in volumes}
+        frames = {}
+        for chunk in pd.read_csv(CORPUS_CSV, usecols=lambda column: column in columns or column == 'volume',
+                                 dtype={'volume': str}, chunksize=10000):
+            if selected is not None:
+                chunk = chunk[chunk['volume'].isin(selected)]
+            for volume, df in chunk.groupby('volume', sort=False):
+                frames.setdefault(volume, []).append(df)
+        for volume in sorted(frames):
+            yield pd.concat(frames[volume], ignore_index=True)[columns]
+        return
+
+    import pyarrow.parquet as pq
+    available = corpus_volumes(corpus_dir)
+    selected = available if volumes is None else [volume for volume in available if volume in {str(v) for v in volumes}]
+    for volume in selected:
+        table = pq.read_table(partition_path(volume, corpus_dir), columns=[column for column in columns if column != 'volume'])
+        df = table.to_pandas()
+        if 'volume' in columns:
+            df['volume'] = pd.Categorical([volume] * len(df))
+        yield df[columns]
+
+def read_corpus(volumes=None, columns=None, corpus_dir=None):
+    """
+    This function reads the laws of some or all volumes from the corpus, see iter_corpus.
+
+    PARAMETERS:
+        volumes (list): The volumes to read (default is None, every volume).
+        columns (list): The columns to read, from COLUMNS (default is None, every column).
+        corpus_dir (str): The corpus directory (default is CORPUS_DIR).
+
+    Returns:
+        DataFrame: One row per law.
+    """
+    frames = list(iter_corpus(volumes, columns, corpus_dir))
+    if not frames:
+        return pd.DataFrame(columns=columns or COLUMNS)
+    if 'volume' in (columns or COLUMNS):
+        categories = [str(df['volume'].iloc[0]) for df in frames if len(df)]
+        for df in frames:
+            df['volume'] = pd.Categorical(df['volume'].astype(str), categories=categories)
+    return pd.concat(frames, ignore_index=True)
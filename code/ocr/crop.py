@@ -1,5 +1,7 @@
 import pathlib
 import shutil
+import hashlib
+import bisect
 import cv2
 import os, sys, csv
 import traceback
@@ -12,8 +14,9 @@ import pytesseract
 import importlib
 import crop_functions
 from crop_functions import get_contours
-from crop_functions import contour_df
+from crop_functions import contour_table
 from crop_functions import *
+from parallel import map_pages
 importlib.reload(crop_functions)
 
 def volList(volume):
@@ -42,103 +45,569 @@ def volList(volume):
     file_list.sort()
     return file_list, volume
 
-def crop(volume, path_list, dil_iter=30, x_buffer=20, y_buffer=5):
+def page_bbox(img, path, dil_iter=30, x_buffer=20, y_buffer=5, page=None):
     """
-    This function crops images based on bounding boxes determined from contours and save the cropped images.
+    This function finds the crop box of a single page by running the main bounding box, marginalia and 
+    second round cropping steps.
 
     Parameters:
-    volume (str): The volume number used to locate images and save output.
-    path_list (list): List of image file paths to process.
+    img (ndarray): The page image as read by cv2.imread.
+    path (str): The path of the page, used in error messages.
     dil_iter (int, optional): Number of dilation iterations for contour detection. Default is 30.
     x_buffer (int, optional): Horizontal buffer for bounding box. Default is 20.
     y_buffer (int, optional): Vertical buffer for bounding box. Default is 5.
-    
-    Returns: 
+    page (PageAnalysis, optional): The analysis of img at dil_iter iterations, computed when not given.
+
+    Returns:
+    tuple: The x1, y1, x2, y2 coordinates of the crop box and a flag that is True if any step failed.
     """
-    imgs_dict = {}
-    imgs_df = pd.DataFrame(columns=["id", "path", "bbox_x1", "bbox_y1", "bbox_y1", "bbox_y2"])
-    path_list.sort()
     y1 = 0
     y2 = 0
     x1 = 0
     x2 = 0
-    for i, path in enumerate(path_list):
-        img = cv2.imread(path)
+    #grayscale, threshold and dilation are computed once and shared by every step
+    if page is None:
+        page = PageAnalysis(img, dil_iter)
+    contours, hierarchy = page.contours()
 
-        filename = os.path.basename(path)
-        contours, hierarchy = get_contours(img, dil_iter)
+    c_df = contour_table(img, contours, hierarchy)
+
+    error = False
+    try:
+        x1, x2, y1, y2 = main_bbox(img, c_df, x_buffer, y_buffer)
+    except:
+        print(f"There was an issue finding the main bounding box with {path}")
+        print(f"{path} looks like this:")
+        error = True
+    x1, y1, x2, y2, refine_error = refine_bbox(page, path, x1, y1, x2, y2)
+    return x1, y1, x2, y2, error or refine_error
 
-        c_df = contour_df(img, contours, hierarchy)
+def refine_bbox(page, path, x1, y1, x2, y2):
+    """
+    This function runs the marginalia and second round cropping steps on a main bounding box.
+
+    Parameters:
+    page (PageAnalysis): The analysis of the page.
+    path (str): The path of the page, used in error messages.
+    x1, y1, x2, y2 (int): The main bounding box with its buffer applied.
+
+    Returns:
+    tuple: The x1, y1, x2, y2 coordinates of the crop box and a flag that is True if any step failed.
+    """
+    img = page.img
+    dil_iter = page.dil_iter
+    error = False
+    #crop the image 
+    cropped = img[y1:y2, x1:x2]
 
-        error = False
+    check = check_for_marginalia(cropped)
+    #check for marginalia 
+    if check == True:
         try:
-            x1, x2, y1, y2 = main_bbox(img, c_df, x_buffer, y_buffer)
+            diff = remove_child_marginalia(cropped, dil_iter, page.region(y1, y2, x1, x2))
+            x1 = x1 + diff
         except:
-            print(f"There was an issue finding the main bounding box with {path}")
-            print(f"{path} looks like this:")
+            print(f"There was an issue removing child marginalia with {path}")
             error = True
-        #crop the image 
-        cropped = img[y1:y2, x1:x2]
 
-        check = check_for_marginalia(cropped)
-        #check for marginalia 
-        if check == True:
+    cropped = img[y1:y2, x1:x2]
+    #more cropping based on contour
+    try:
+        top_diff, bottom_diff = crop_round2(cropped, dil_iter, page.region(y1, y2, x1, x2))
+        y1 = y1+top_diff
+        y2 = y2 - bottom_diff
+    except:
+        print(f"There was an issue in the second round of cropping with {path}")
+        error = True
+    return x1, y1, x2, y2, error
+
+def scaled_bbox(path, dil_iter=30, x_buffer=20, y_buffer=5, scale=2):
+    """
+    This function finds the crop box of a page from a grayscale decode at 1/scale of its size. The dilation 
+    iterations and buffers are scaled down to match and the box is mapped back to full resolution coordinates.
+
+    Parameters:
+    path (str): The image file path to process.
+    dil_iter (int, optional): Number of dilation iterations at full resolution. Default is 30.
+    x_buffer (int, optional): Horizontal buffer for bounding box at full resolution. Default is 20.
+    y_buffer (int, optional): Vertical buffer for bounding box at full resolution. Default is 5.
+    scale (int, optional): The reduction factor, 2, 4 or 8. Default is 2.
+
+    Returns:
+    tuple: The x1, y1, x2, y2 coordinates of the crop box at full resolution and a flag that is True if any step failed.
+    """
+    img = read_page(path, scale)
+    x1, y1, x2, y2, error = page_bbox(img, path, max(1, round(dil_iter / scale)), round(x_buffer / scale), round(y_buffer / scale))
+    return x1 * scale, y1 * scale, x2 * scale, y2 * scale, error
+
+def crop_page(volume, path, dil_iter=30, x_buffer=20, y_buffer=5, scale=1, write_crops=True, img=None, page=None):
+    """
+    This function crops a single page and saves the cropped image, or saves the original to the issues 
+    folder if any cropping step failed. With write_crops=False only the crop box is recorded and the 
+    crop is cut from the original when it is needed, see load_crop.
+
+    Parameters:
+    volume (str): The volume number used to save output.
+    path (str): The image file path to process.
+    dil_iter (int, optional): Number of dilation iterations for contour detection. Default is 30.
+    x_buffer (int, optional): Horizontal buffer for bounding box. Default is 20.
+    y_buffer (int, optional): Vertical buffer for bounding box. Default is 5.
+    scale (int, optional): Detect the box on a page decoded at 1/scale of its size, see scaled_bbox. Default is 1.
+    write_crops (bool, optional): Save the cropped image to the cropped folder. Default is True.
+    img (ndarray, optional): The page as read by cv2.imread, if it has already been read. Default is None.
+    page (PageAnalysis, optional): The analysis of img at dil_iter iterations, if it has already been made. Default is None.
+
+    Returns:
+    dict: The contour report row for the page.
+    """
+    filename = os.path.basename(path)
+    if scale > 1:
+        x1, y1, x2, y2, error = scaled_bbox(path, dil_iter, x_buffer, y_buffer, scale)
+        #the full resolution page is only read if an image has to be written 
+    else:
+        if img is None:
+            img = cv2.imread(path)
+        x1, y1, x2, y2, error = page_bbox(img, path, dil_iter, x_buffer, y_buffer, page)
+    cwd = os.getcwd()
+    crop_path = f"{cwd}/images/{volume}/cropped/" + filename.replace('.jpg', '') + '_crop.jpg'
+
+    if error is True:
+        dir = f"{cwd}/images/{volume}/issues/" #save cropped images 
+        os.makedirs(dir, exist_ok=True)
+        if img is None:
+            img = cv2.imread(path)
+        plt.imsave(dir + filename, img)
+        print('image with issues saved to issues folder')
+    elif write_crops:
+        os.makedirs(os.path.dirname(crop_path), exist_ok=True)
+        if img is None:
+            img = cv2.imread(path)
+        plt.imsave(crop_path, img[y1:y2, x1:x2])
+    if (error is True or not write_crops) and os.path.exists(crop_path):
+        #a crop from an earlier run no longer matches the page, OCR would read it as if it did 
+        os.remove(crop_path)
+    dir = f"{cwd}/images/{volume}/originals/"
+    os.makedirs(dir, exist_ok=True)
+    try:
+        shutil.move(filename, f"{dir}{filename}")
+    except OSError:
+        pass
+    plt.close()
+
+    return {
+        'path': path,
+        'filename': filename,
+        'bbox_x1': x1,
+        'bbox_y1': y1,
+        'bbox_x2': x2,
+        'bbox_y2': y2,
+        'error': error,
+            }
+
+def _crop_page_task(task):
+    """
+    This function unpacks a task tuple for crop_page so it can be sent to a worker process.
+    """
+    return crop_page(*task)
+
+# columns of the crop manifest, the crop parameters come after the content hash so any change reprocesses the page
+MANIFEST_FIELDS = ['filename', 'sha1', 'dil_iter', 'x_buffer', 'y_buffer', 'scale',
+                   'path', 'bbox_x1', 'bbox_y1', 'bbox_x2', 'bbox_y2', 'error', 'outlier', 'bbox_x1_z', 'bbox_x2_z']
+REPORT_FIELDS = ['path', 'filename', 'bbox_x1', 'bbox_y1', 'bbox_x2', 'bbox_y2', 'error', 'outlier', 'bbox_x1_z', 'bbox_x2_z']
+
+def page_hash(path):
+    """
+    This function hashes the content of an image file.
+
+    Parameters:
+    path (str): The image file path.
+
+    Returns:
+    str: The hex SHA-1 digest of the file.
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def read_manifest(manifest_path):
+    """
+    This function reads a crop manifest. Rows that were cut short by an interrupted run are skipped and 
+    when a page appears more than once its latest row is kept.
+
+    Parameters:
+    manifest_path (str): The path of the {volume}_cropmanifest.csv file.
+
+    Returns:
+    dict: The manifest rows keyed by filename.
+    """
+    entries = {}
+    if not os.path.exists(manifest_path):
+        return entries
+    with open(manifest_path, newline='') as f:
+        for row in csv.DictReader(f):
             try:
-                diff = remove_child_marginalia(cropped, dil_iter)
-                x1 = x1 + diff
-            except:
-                print(f"There was an issue removing child marginalia with {path}")
-                error = True
-
-        cropped = img[y1:y2, x1:x2]
-        #more cropping based on contour
-        try:
-            top_diff, bottom_diff = crop_round2(cropped, dil_iter)
-            y1 = y1+top_diff
-            y2 = y2 - bottom_diff
-        except:
-            print(f"There was an issue in the second round of cropping with {path}")
-            error = True
-        #update dict with image data 
-        imgs_dict[i] = {
-            'path': path,
-            'filename': filename,
-            'bbox_x1': x1,
-            'bbox_y1': y1,
-            'bbox_x2': x2,
-            'bbox_y2': y2,
-                }
-        cwd = os.getcwd()
-
-        if error is True:
-            dir = f"{cwd}/images/{volume}/issues/" #save cropped images 
-            if not os.path.exists(dir):
-                os.makedirs(dir, exist_ok=False)
-            plt.imsave(dir + filename, img)
-            print('image with issues saved to issues folder')
-        else:
-            dir = f"{cwd}/images/{volume}/cropped/"
-            if not os.path.exists(dir):
-                os.makedirs(dir, exist_ok=False)
-            name = filename.replace('.jpg', '')
-            plt.imsave(dir + name + '_crop.jpg', img[y1:y2, x1:x2])
-        dir = f"{cwd}/images/{volume}/originals/"
-        if not os.path.exists(dir):
-            os.makedirs(dir, exist_ok=False)
-        try:
-            shutil.move(filename, f"{dir}{filename}")
-        except OSError:
-            pass
-        plt.close()
+                for field in ['dil_iter', 'x_buffer', 'y_buffer', 'scale', 'bbox_x1', 'bbox_y1', 'bbox_x2', 'bbox_y2']:
+                    row[field] = int(row[field])
+                if row['error'] not in ('True', 'False'):
+                    continue
+                row['error'] = row['error'] == 'True'
+                row['outlier'] = row.get('outlier') == 'True'
+            except (TypeError, ValueError):
+                continue
+            entries[row['filename']] = row
+    return entries
+
+def is_current(entry, sha1, params, crop_path=None):
+    """
+    This function checks if a manifest row is still valid for a page, meaning the page content and the crop 
+    parameters are unchanged and, if crops are written, the cropped image is still there.
+
+    Parameters:
+    entry (dict): The manifest row of the page, or None.
+    sha1 (str): The current content hash of the page.
+    params (dict): The crop parameters of this run.
+    crop_path (str, optional): The cropped image the page should have, if crops are written.
+
+    Returns:
+    bool: True if the page does not need to be cropped again.
+    """
+    if entry is None or entry['sha1'] != sha1:
+        return False
+    if any(entry[key] != value for key, value in params.items()):
+        return False
+    if crop_path is not None and not (entry['error'] or entry['outlier']) and not os.path.exists(crop_path):
+        return False
+    return True
+
+class StreamingOutliers:
+    """
+    This class flags pages whose crop box is far from the rest of the volume while the volume is still being 
+    cropped. It keeps the values seen for each coordinate sorted and scores a page with the robust z-score 
+    |value - median| / (1.4826 * MAD), where MAD is the median absolute deviation. Unlike the z-score of 
+    process_outliers this is not pulled towards the outliers themselves, so it can be used before all pages are in.
+    The median is read from the sorted values; the MAD takes a pass over them, so it is only computed again every
+    refresh pages.
+
+    Attributes:
+    coords (list): The box coordinates that are checked.
+    threshold (float): The robust z-score above which a page is an outlier.
+    warmup (int): The number of pages to see before pages are scored.
+    refresh (int): The number of pages added before the MAD is computed again.
+    """
+
+    def __init__(self, coords=("x1", "x2"), threshold=3.5, warmup=20, refresh=25):
+        self.coords = list(coords)
+        self.threshold = threshold
+        self.warmup = warmup
+        self.refresh = refresh
+        self.values = {coord: [] for coord in self.coords}
+        #the MAD of each coordinate and the number of values it was computed from 
+        self.spreads = {}
+
+    def add(self, row):
+        """
+        This function adds the box of a page to the running statistics.
+        """
+        for coord in self.coords:
+            bisect.insort(self.values[coord], row[f"bbox_{coord}"])
+
+    def median(self, coord):
+        """
+        This function returns the median of the values seen for a coordinate.
+        """
+        values = self.values[coord]
+        mid = len(values) // 2
+        return values[mid] if len(values) % 2 else (values[mid - 1] + values[mid]) / 2
+
+    def spread(self, coord):
+        """
+        This function returns 1.4826 times the MAD of a coordinate, computed again once refresh pages were added.
+        """
+        count = len(self.values[coord])
+        cached = self.spreads.get(coord)
+        if cached is None or count - cached[1] >= self.refresh:
+            values = np.asarray(self.values[coord])
+            cached = (1.4826 * np.median(np.abs(values - self.median(coord))), count)
+            self.spreads[coord] = cached
+        return cached[0]
+
+    def ready(self):
+        """
+        This function checks if enough pages have been seen to score pages.
+        """
+        return len(self.values[self.coords[0]]) >= self.warmup
+
+    def scores(self, row):
+        """
+        This function scores the box of a page against the pages seen so far.
+
+        Parameters:
+        row (dict): A contour report row.
+
+        Returns:
+        dict: The robust z-score of each coordinate, keyed bbox_{coord}_z.
+        """
+        z = {}
+        for coord in self.coords:
+            #a floor of one pixel keeps a volume of identical boxes from flagging every 1px difference 
+            spread = max(self.spread(coord), 1.0)
+            z[f"bbox_{coord}_z"] = abs(row[f"bbox_{coord}"] - self.median(coord)) / spread
+        return z
+
+    def is_outlier(self, z):
+        """
+        This function checks scores from scores() against the threshold.
+        """
+        return any(value > self.threshold for value in z.values())
 
+def flag_outlier(volume, row):
+    """
+    This function moves an outlier page to review by copying its original to the issues folder and removing its crop.
+
+    Parameters:
+    volume (str): The volume number used to locate images.
+    row (dict): The contour report row of the page.
+
+    Returns:
+    None
+    """
+    cwd = os.getcwd()
+    filename = row['filename']
+    dir = f"{cwd}/images/{volume}/issues/"
+    os.makedirs(dir, exist_ok=True)
+    try:
+        shutil.copy(original_path(volume, row), dir + filename)
+    except OSError:
+        pass
+    target = f"{cwd}/images/{volume}/cropped/{filename.replace('.jpg', '')}_crop.jpg"
+    if os.path.exists(target):
+        os.remove(target)
+    print(f"{filename} crop box is an outlier, original copied to issues folder")
 
+def crop(volume, path_list, dil_iter=30, x_buffer=20, y_buffer=5, jobs=1, scale=1, write_crops=True, resume=True, outliers=False):
+    """
+    This function crops images based on bounding boxes determined from contours and save the cropped images.
 
-    imgs_df = pd.DataFrame(columns=["id", "path", "filename", "bbox_x1", "bbox_y1", "bbox_y1", "bbox_y2"])
+    Every finished page is recorded in {volume}_cropmanifest.csv with its content hash and the crop parameters, 
+    so a run that is interrupted or repeated only crops pages that are new, changed, or were cropped with 
+    different parameters. The contour report covers every page in the manifest.
 
-    imgs_df = pd.DataFrame.from_dict(imgs_dict, orient="index")
+    Parameters:
+    volume (str): The volume number used to locate images and save output.
+    path_list (list): List of image file paths to process.
+    dil_iter (int, optional): Number of dilation iterations for contour detection. Default is 30.
+    x_buffer (int, optional): Horizontal buffer for bounding box. Default is 20.
+    y_buffer (int, optional): Vertical buffer for bounding box. Default is 5.
+    jobs (int, optional): Number of worker processes the pages are spread across. Default is 1.
+    scale (int, optional): Detect boxes on pages decoded at 1/scale of their size, 2, 4 or 8. Check the volume 
+                           with scale_report first. Default is 1, full resolution.
+    write_crops (bool, optional): Save cropped images to the cropped folder. With False only the boxes in the 
+                                  contour report are kept and OCR crops the originals in memory. Default is True.
+    resume (bool, optional): Skip pages the manifest shows are already cropped. With False the manifest is 
+                             cleared and every page is cropped again. Default is True.
+    outliers (bool, optional): Check each crop box against the volume as pages are cropped and send outliers to 
+                               the issues folder straight away, see StreamingOutliers. Default is False.
+    
+    Returns: 
+    """
+    cwd = os.getcwd()
+    path_list.sort()
+    params = {'dil_iter': dil_iter, 'x_buffer': x_buffer, 'y_buffer': y_buffer, 'scale': scale}
+    manifest_path = f"{cwd}/images/{volume}/{volume}_cropmanifest.csv"
+    if not resume and os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    done = read_manifest(manifest_path)
+
+    hashes = {}
+    tasks = []
+    for path in path_list:
+        filename = os.path.basename(path)
+        hashes[path] = page_hash(path)
+        crop_path = f"{cwd}/images/{volume}/cropped/{filename.replace('.jpg', '')}_crop.jpg" if write_crops else None
+        if not is_current(done.get(filename), hashes[path], params, crop_path):
+            tasks.append((volume, path, dil_iter, x_buffer, y_buffer, scale, write_crops))
+    print(f"Cropping {len(tasks)} of {len(path_list)} pages, {len(path_list) - len(tasks)} are unchanged since the last run")
+
+    #pages kept from earlier runs are part of the volume statistics but are not flagged again 
+    stats = StreamingOutliers() if outliers else None
+    if stats is not None:
+        redo = {os.path.basename(task[1]) for task in tasks}
+        for filename in sorted(done):
+            if filename not in redo and not done[filename]['error']:
+                stats.add(done[filename])
+
+    #rows come back in page order whatever the number of workers, each is saved as soon as its outlier check is done 
+    with open(manifest_path, 'a', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=MANIFEST_FIELDS)
+        if f.tell() == 0:
+            writer.writeheader()
+
+        def record(row):
+            if stats is not None and not row['error']:
+                z = stats.scores(row)
+                row.update(z, outlier=stats.is_outlier(z))
+                if row['outlier']:
+                    flag_outlier(volume, row)
+            writer.writerow(row)
+            f.flush()
+            done[row['filename']] = row
+
+        waiting = []
+        for row in map_pages(_crop_page_task, tasks, jobs):
+            row = dict(row, sha1=hashes[row['path']], outlier=False, **params)
+            if stats is None or row['error']:
+                record(row)
+                continue
+            stats.add(row)
+            waiting.append(row)
+            if stats.ready():
+                for page in waiting:
+                    record(page)
+                waiting = []
+        #volumes smaller than the warm up are scored against all of their pages 
+        for page in waiting:
+            record(page)
+
+    save_manifest(volume, done)
+
+def save_manifest(volume, done):
+    """
+    This function rewrites the crop manifest of a volume with one row per page, so reruns do not grow it, and 
+    writes the contour report from it. Both files are replaced in one step so readers never see a partial file.
+
+    Parameters:
+    volume (str): The volume number used to save output.
+    done (dict): The manifest rows keyed by filename, see read_manifest.
+
+    Returns:
+    None
+    """
+    cwd = os.getcwd()
+    manifest_path = f"{cwd}/images/{volume}/{volume}_cropmanifest.csv"
+    with open(f"{manifest_path}.tmp", 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=MANIFEST_FIELDS)
+        writer.writeheader()
+        for filename in sorted(done):
+            writer.writerow(done[filename])
+    os.replace(f"{manifest_path}.tmp", manifest_path)
+
+    imgs_df = pd.DataFrame([done[filename] for filename in sorted(done)], columns=REPORT_FIELDS)
     csv_path = f"{cwd}/images/{volume}/{volume}_contourreport.csv"
     print(f"Saving CSV to: {csv_path}")
-    imgs_df.to_csv(csv_path, index_label="ID")
+    imgs_df.to_csv(f"{csv_path}.tmp", index_label="ID")
+    os.replace(f"{csv_path}.tmp", csv_path)
+
+def original_path(volume, row):
+    """
+    This function finds the original image of a contour report row, looking in the originals folder if
+    the page is no longer at the path it was cropped from.
+
+    Parameters:
+    volume (str): The volume number used to locate images.
+    row (dict or Series): A contour report row.
+
+    Returns:
+    str: The path of the original image.
+    """
+    if os.path.exists(row['path']):
+        return row['path']
+    return f"{os.getcwd()}/images/{volume}/originals/{row['filename']}"
+
+def load_crop(volume, row):
+    """
+    This function cuts the crop of a page out of its original image using the box in the contour report, 
+    so pages cropped with write_crops=False can be OCR'd or reviewed without a cropped image on disk.
+
+    Parameters:
+    volume (str): The volume number used to locate images.
+    row (dict or Series): A contour report row.
+
+    Returns:
+    ndarray: The cropped page in BGR channel order, as read by cv2.imread.
+    """
+    img = cv2.imread(original_path(volume, row))
+    return img[int(row['bbox_y1']):int(row['bbox_y2']), int(row['bbox_x1']):int(row['bbox_x2'])]
+
+def virtual_crops(volume):
+    """
+    This function lists the pages of a volume that have a crop box, leaving out pages that failed to crop, 
+    were flagged as outliers or were moved to the issues folder.
+
+    Parameters:
+    volume (str): The volume number used to locate the contour report.
+
+    Returns:
+    DataFrame: The contour report rows of the cropped pages, in page order.
+    """
+    cwd = os.getcwd()
+    df = pd.read_csv(f"{cwd}/images/{volume}/{volume}_contourreport.csv")
+    issues_dir = f"{cwd}/images/{volume}/issues"
+    issues = set(os.listdir(issues_dir)) if os.path.exists(issues_dir) else set()
+    if 'error' in df.columns:
+        df = df[~df['error'].astype(bool)]
+    if 'outlier' in df.columns:
+        df = df[~df['outlier'].astype(bool)]
+    df = df[~df['filename'].isin(issues)]
+    return df.sort_values('filename')
+
+def _compare_scales_task(task):
+    """
+    This function finds the crop box of a page at full resolution and at a reduced scale for scale_report.
+    """
+    path, dil_iter, x_buffer, y_buffer, scale = task
+    full = page_bbox(cv2.imread(path), path, dil_iter, x_buffer, y_buffer)
+    reduced = scaled_bbox(path, dil_iter, x_buffer, y_buffer, scale)
+    return full, reduced
+
+def scale_report(volume, path_list, dil_iter=30, x_buffer=20, y_buffer=5, scale=2, jobs=1):
+    """
+    This function validates reduced scale detection for a volume. It finds every crop box both at full resolution
+    and at 1/scale, saves the boxes and their differences to {volume}_scalereport_{scale}.csv and prints a summary.
+
+    Parameters:
+    volume (str): The volume number used to save the report.
+    path_list (list): List of image file paths to compare.
+    dil_iter (int, optional): Number of dilation iterations for contour detection. Default is 30.
+    x_buffer (int, optional): Horizontal buffer for bounding box. Default is 20.
+    y_buffer (int, optional): Vertical buffer for bounding box. Default is 5.
+    scale (int, optional): The reduction factor to validate, 2, 4 or 8. Default is 2.
+    jobs (int, optional): Number of worker processes the pages are spread across. Default is 1.
+
+    Returns:
+    DataFrame: The per page boxes and differences.
+    """
+    coords = ["x1", "y1", "x2", "y2"]
+    path_list.sort()
+    tasks = [(path, dil_iter, x_buffer, y_buffer, scale) for path in path_list]
+    rows = []
+    for path, (full, reduced) in zip(path_list, map_pages(_compare_scales_task, tasks, jobs)):
+        row = {'path': path, 'filename': os.path.basename(path)}
+        for i, coord in enumerate(coords):
+            row[f"bbox_{coord}"] = full[i]
+            row[f"scaled_{coord}"] = reduced[i]
+            row[f"diff_{coord}"] = reduced[i] - full[i]
+        row['error'] = full[4]
+        row['scaled_error'] = reduced[4]
+        rows.append(row)
+    df = pd.DataFrame(rows)
+
+    cwd = os.getcwd()
+    csv_path = f"{cwd}/images/{volume}/{volume}_scalereport_{scale}.csv"
+    print(f"Saving CSV to: {csv_path}")
+    df.to_csv(csv_path, index_label="ID")
+
+    if len(df) > 0:
+        both = df[~df['error'] & ~df['scaled_error']]
+        print(f"Volume {volume} at 1/{scale} scale: {len(df)} pages, {len(both)} cropped at both scales, "
+              f"{int((df['error'] != df['scaled_error']).sum())} with an error at only one scale")
+        for coord in coords:
+            diff = np.abs(both[f"diff_{coord}"])
+            if len(diff) > 0:
+                print(f"  {coord}: mean difference {diff.mean():.1f}px, max {diff.max()}px, "
+                      f"{(diff <= 5 * scale).mean():.1%} within {5 * scale}px")
+    return df
 
 def get_stats(volume):
     """
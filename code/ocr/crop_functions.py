@@ -8,6 +8,138 @@ from matplotlib import pyplot as plt
 
 ### FUNCTIONS ###
 
+# structuring element used for every dilation
+CROSS_KERNEL = cv2.getStructuringElement(cv2.MORPH_CROSS,(3,3)) 
+
+
+def dilate(binary, dil_iter=24):
+    """
+    This function dilates a binary image with a 3x3 cross kernel. 
+    
+    PARAMETERS: 
+    binary (ndarray): The thresholded image
+    dil_iter: The number of iterations for dilation. The default is 24. 
+    
+    RETURNS: 
+    ndarray: The dilated image 
+    """
+    return cv2.dilate(binary,CROSS_KERNEL,iterations = dil_iter) 
+
+
+class PageAnalysis:
+    """
+    This class holds the grayscale, binary and dilated planes of a page so they are computed once and 
+    shared by every crop stage. Stages that work on part of the page read a region of it instead of 
+    converting, thresholding and dilating the crop again. 
+
+    ATTRIBUTES:
+    img (cv2 image): The page, or the part of the page this analysis covers
+    gray (ndarray): The grayscale plane
+    binary (ndarray): The inverted binary threshold of the grayscale plane. Pixals less than or equal to 140 are 255. 
+    dilated (ndarray): The binary plane dilated dil_iter times with a 3x3 cross kernel
+    dil_iter (int): The number of dilation iterations
+    """
+
+    def __init__(self, img, dil_iter=24, gray=None, binary=None, dilated=None):
+        self.img = img
+        self.dil_iter = dil_iter
+        if gray is None:
+            gray = img if img.ndim == 2 else cv2.cvtColor(img,cv2.COLOR_BGR2GRAY) 
+        self.gray = gray
+        if binary is None:
+            _,binary = cv2.threshold(gray,140, 255,cv2.THRESH_BINARY_INV) 
+        self.binary = binary
+        if dilated is None:
+            dilated = dilate(binary, dil_iter)
+        self.dilated = dilated
+
+    def contours(self, mode=cv2.RETR_CCOMP):
+        """
+        This function finds the contours of the dilated plane. 
+
+        PARAMETERS: 
+        mode: The OpenCV contour retrieval mode, the default is cv2.RETR_CCOMP
+
+        RETURNS: 
+        tuple: The contours and hierarchy found by cv2.findContours
+        """
+        return cv2.findContours(self.dilated,mode,cv2.CHAIN_APPROX_NONE) 
+
+    def dilated_to(self, dil_iter):
+        """
+        This function returns the analysis of the same image at more dilation iterations. The dilated plane 
+        is carried on from this one, so only the extra iterations are computed. 
+
+        PARAMETERS: 
+        dil_iter (int): The number of iterations, at least the current dil_iter
+
+        RETURNS: 
+        PageAnalysis: The analysis at dil_iter iterations 
+        """
+        if dil_iter < self.dil_iter:
+            raise ValueError(f"cannot go back from {self.dil_iter} to {dil_iter} dilation iterations")
+        dilated = self.dilated if dil_iter == self.dil_iter else dilate(self.dilated, dil_iter - self.dil_iter)
+        return PageAnalysis(self.img, dil_iter, self.gray, self.binary, dilated)
+
+    def region(self, y1, y2, x1, x2):
+        """
+        This function returns the analysis of a rectangular part of the page, with the same result as running 
+        PageAnalysis on img[y1:y2, x1:x2]. The image, grayscale and binary planes are views into this analysis. 
+        The dilated plane is copied from this analysis except for a band of dil_iter pixels along each cut edge, 
+        where pixels outside the region would have spread into it, and only those bands are dilated again. 
+
+        PARAMETERS: 
+        y1, y2, x1, x2 (int): The region bounds, with the same meaning as slicing the image
+
+        RETURNS: 
+        PageAnalysis: The analysis of the region 
+        """
+        height, width = self.binary.shape
+        y1, y2, _ = slice(y1, y2).indices(height)
+        x1, x2, _ = slice(x1, x2).indices(width)
+        if y2 <= y1 or x2 <= x1:
+            raise ValueError(f"empty page region {y1}:{y2}, {x1}:{x2}")
+        binary = self.binary[y1:y2, x1:x2]
+        dilated = self.dilated[y1:y2, x1:x2].copy()
+        band = self.dil_iter
+        reach = 2 * band
+        if band == 0:
+            return PageAnalysis(self.img[y1:y2, x1:x2], 0, self.gray[y1:y2, x1:x2], binary, dilated)
+        if y1 > 0:
+            dilated[:band] = dilate(binary[:reach], band)[:band]
+        if y2 < height:
+            dilated[-band:] = dilate(binary[-reach:], band)[-band:]
+        if x1 > 0:
+            dilated[:, :band] = dilate(binary[:, :reach], band)[:, :band]
+        if x2 < width:
+            dilated[:, -band:] = dilate(binary[:, -reach:], band)[:, -band:]
+        return PageAnalysis(self.img[y1:y2, x1:x2], self.dil_iter, self.gray[y1:y2, x1:x2], binary, dilated)
+
+
+# cv2.imread flags that let libjpeg decode a page at a fraction of its size
+REDUCED_GRAYSCALE = {2: cv2.IMREAD_REDUCED_GRAYSCALE_2, 4: cv2.IMREAD_REDUCED_GRAYSCALE_4, 8: cv2.IMREAD_REDUCED_GRAYSCALE_8}
+
+
+def read_page(path, scale=1):
+    """
+    This function reads a page image. At scale 1 the page is read at full resolution in color. At scale 2, 4 or 8 
+    it is read in grayscale at 1/scale of its size, and for JPEG files libjpeg scales the DCT while decoding 
+    so the full resolution pixels are never produced. 
+
+    PARAMETERS: 
+    path (str): The path of the image
+    scale (int): The reduction factor, 1, 2, 4 or 8. The default is 1. 
+
+    RETURNS: 
+    cv2 img: The page image 
+    """
+    if scale == 1:
+        return cv2.imread(path)
+    if scale not in REDUCED_GRAYSCALE:
+        raise ValueError(f"scale must be 1, 2, 4 or 8, not {scale}")
+    return cv2.imread(path, REDUCED_GRAYSCALE[scale])
+
+
 def get_contours(img, dil_iter=24):
     """
     This function finds the contours in a binary image. 
@@ -19,15 +151,9 @@ def get_contours(img, dil_iter=24):
     RETURNS: 
     contours(list): A list of contours found in the image. Each contour is a list of points. 
     """
-    gray = cv2.cvtColor(img,cv2.COLOR_BGR2GRAY) 
-    # converts image to grayscale
-    _,thresh = cv2.threshold(gray,140, 255,cv2.THRESH_BINARY_INV) 
-    # apply a binary threshold. Pixals greater than 140 are set to 0 and pixals less than or equal to 140 are set to 255. 
-    kernel = cv2.getStructuringElement(cv2.MORPH_CROSS,(3,3)) 
-    # create a structuring element of size 3x3 
-    dilated = cv2.dilate(thresh,kernel,iterations = dil_iter) 
-    # dialates the thresholded image. The dil_iter parameter specifies how many times the operation is applied. 
-    contours, hierarchy = cv2.findContours(dilated,cv2.RETR_CCOMP,cv2.CHAIN_APPROX_NONE) 
+    # converts image to grayscale, applies a binary threshold and dilates it dil_iter times
+    page = PageAnalysis(img, dil_iter)
+    contours, hierarchy = page.contours()
     #finds contours using OpenCV's findCountours function
 
     return contours, hierarchy 
@@ -35,6 +161,97 @@ def get_contours(img, dil_iter=24):
 
 
 
+# column layout of the contour table built by contour_table
+CONTOUR_DTYPE = np.dtype([("index", np.int64), ("width", np.int64), ("height", np.int64), ("x", np.int64),
+                          ("y", np.int64), ("area", np.float64), ("wh_ratio", np.float64),
+                          ("is_child", np.int64), ("parent_contour", np.int64)])
+
+
+def contour_table(img, cl, hr, round=1):
+   """
+   This function builds an array-backed table from the contour and hierarchy objects extracted from an image in 
+   get_contours. The measurements are computed in bulk for all contours and the filters for each round are 
+   applied as boolean masks, so no DataFrame is built. 
+
+   PARAMETERS:
+   img (cv2 image): The image the contours were detected in 
+   cl (list of ndarray): A list of contours found in the image represented as a numpy array of points 
+   hr (ndarray): A hierarchy array with contour relationships within the image 
+   round (int): The filtering round to apply, the default is 1. dditional filtering is 
+                performed to exclude small particles, watermarks, edge artifacts, and shadows.
+
+   RETURNS:
+   table: A numpy structured array with the CONTOUR_DTYPE columns where each row represents a contour
+   """
+   img_height, img_width = img.shape[:2]
+   img_area = img_height * img_width
+   if len(cl) == 0:
+        return np.zeros(0, dtype=CONTOUR_DTYPE)
+
+   # minAreaRect has no bulk form, everything after it is computed over all contours at once
+   rects = [cv2.minAreaRect(c) for c in cl]
+   center = np.array([r[0] for r in rects], dtype=np.float32)
+   size = np.array([r[1] for r in rects], dtype=np.float32)
+   angle = np.array([r[2] for r in rects], dtype=np.float64) * np.pi / 180.
+
+   # corners of the rotated rectangles, in the same float32 arithmetic as cv2.boxPoints
+   b = np.cos(angle).astype(np.float32) * np.float32(0.5)
+   a = np.sin(angle).astype(np.float32) * np.float32(0.5)
+   cx, cy = center[:, 0], center[:, 1]
+   w, h = size[:, 0], size[:, 1]
+   p0x = cx - a*h - b*w
+   p0y = cy + b*h - a*w
+   p1x = cx + a*h - b*w
+   p1y = cy - b*h - a*w
+   box_x = np.stack([p0x, p1x, 2*cx - p0x, 2*cx - p1x], axis=1).astype(np.intp)
+   box_y = np.stack([p0y, p1y, 2*cy - p0y, 2*cy - p1y], axis=1).astype(np.intp)
+
+   # bounding rectangle of the integer box corners
+   cont_x = box_x.min(axis=1)
+   cont_y = box_y.min(axis=1)
+   cont_width = box_x.max(axis=1) - cont_x + 1
+   cont_height = box_y.max(axis=1) - cont_y + 1
+   cont_wh_ratio = cont_width / cont_height #ratio of width to height
+
+   # contour areas with the shoelace formula over all contour points at once
+   lengths = np.array([len(c) for c in cl])
+   starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+   pts = np.concatenate(cl).reshape(-1, 2).astype(np.int64)
+   nxt = np.arange(1, len(pts) + 1)
+   nxt[starts + lengths - 1] = starts
+   cross = pts[:, 0] * pts[nxt, 1] - pts[nxt, 0] * pts[:, 1]
+   cont_area = np.abs(np.add.reduceat(cross, starts)) * 0.5
+
+   index = np.arange(len(cl))
+   if round == 1:
+        small = (cont_area < img_area*0.1)
+        # remove small particles
+        particles = (cont_wh_ratio > 0.9) & (cont_wh_ratio < 1.5) & small
+        # removes watermark 
+        watermark = (index < 2) & small
+        # removes items too close to the edges
+        edges = ((cont_x < img_width * 0.01) | (cont_x > img_width * 0.99)) & (cont_area < img_area*0.2)
+        # remove shadows from scans
+        shadows = (cont_x > img_width * 0.97) & (cont_wh_ratio < 0.75)
+        keep = ~(particles | watermark | edges | shadows)
+   else: # filtering for different round values 
+        keep = ~(((cont_y > img_height*0.975) | (cont_y < img_height*0.025)) & (cont_area < img_area * 0.1))
+
+   table = np.zeros(int(keep.sum()), dtype=CONTOUR_DTYPE)
+   table["index"] = index[keep]
+   table["width"] = cont_width[keep]
+   table["height"] = cont_height[keep]
+   table["x"] = cont_x[keep]
+   table["y"] = cont_y[keep]
+   table["area"] = cont_area[keep]
+   table["wh_ratio"] = cont_wh_ratio[keep]
+   parents = hr[0][index[keep], 3]
+   table["is_child"] = parents != -1
+   table["parent_contour"] = parents
+
+   return table
+
+
 def contour_df(img, cl, hr, round=1):
    """
    This function creates a dataframe from the contour and hierarchy objects extracted from an image in 
@@ -51,52 +268,90 @@ def contour_df(img, cl, hr, round=1):
    c_df: A DataFrame where each row represents a contour
    
    """
-   c_list = []
-   img_height, img_width,_ = img.shape
-   img_area = img_height * img_width
-    
-   for i, c in enumerate(cl):
-        rect = cv2.minAreaRect(c)
-        box = cv2.boxPoints(rect)
-        box = np.int0(box)
-        cont_x,cont_y,cont_width,cont_height = cv2.boundingRect(box)
-        cont_area = cv2.contourArea(c)
-        cont_wh_ratio = cont_width/cont_height #ratio of width to height
-       
-        if round == 1:
-            # remove small particles
-            if ((cont_wh_ratio > 0.9) and (cont_wh_ratio < 1.5) and (cont_area < (img_area*0.1))):
-                continue
-            
-            # removes watermark 
-            elif (i == 0 or i == 1) and (cont_area < img_area * 0.1):
-                continue
-            
-            # removes items too close to the edges
-            elif (((cont_x < img_width * 0.01) or (cont_x > img_width *0.99)) and (cont_area < img_area*0.2)):
-                continue 
-            
-            # remove shadows from scans
-            elif ((cont_x > img_width *0.97) and (cont_wh_ratio < 0.75)):
-                continue
-            
-            else:
-                c_list.append([i, cont_width,cont_height,cont_x,cont_y, cont_area, cont_wh_ratio])
-        else: # filtering for different round values 
-            if ((cont_y > img_height*0.975) or (cont_y < img_height*0.025)) and (cont_area < img_area * 0.1):
-                continue
-            else:
-                c_list.append([i, cont_width,cont_height,cont_x,cont_y, cont_area, cont_wh_ratio])
-
-   #create the dataframe from collected contour data 
-   c_df = pd.DataFrame(c_list, columns=["index","width", "height", "x", "y", "area", "wh_ratio"])
-   c_df['is_child'] = c_df['index'].apply(lambda i: 0 if hr[0][i][3] == -1 else 1)
-   c_df['parent_contour'] = c_df['index'].apply(lambda i: hr[0][i][3] if hr[0][i][3] != -1 else -1)
+   return pd.DataFrame(contour_table(img, cl, hr, round))
+
+
+def as_contour_table(c_df):
+   """
+   This function returns contour data as a contour table, converting a DataFrame from contour_df if needed. 
+
+   PARAMETERS:
+   c_df (contour table or DataFrame): The contour data 
 
+   RETURNS:
+   table: A numpy structured array with the CONTOUR_DTYPE columns
+   """
+   if isinstance(c_df, pd.DataFrame):
+        return c_df.to_records(index=False)
    return c_df
 
 
 
+def vertical_extent(c_df):
+   """
+   This function finds the top of the highest contour and the bottom of the lowest contour. 
+
+   PARAMETERS:
+   c_df (contour table): A contour table with at least one row
+
+   RETURNS:
+   tuple: The minimum and maximum y-coordinates covered by the contours
+   """
+   bottom = c_df['y'] + c_df['height']
+   return int(np.min(c_df['y'])), int(np.max(bottom))
+
+
+def strip_sums(prefix, start, stop):
+   """
+   This function sums column strips of an image from the prefix sums of its column profile. Strip bounds 
+   follow python slicing, so negative or out of range bounds select the same columns as slicing the image would. 
+
+   PARAMETERS:
+   prefix (ndarray): Prefix sums of the column profile, with a leading 0
+   start (int or ndarray): The first column of each strip
+   stop (int or ndarray): The column after the last column of each strip
+
+   RETURNS:
+   tuple: Two arrays with the sum and the number of columns of each strip
+   """
+   width = len(prefix) - 1
+   start = np.atleast_1d(start)
+   stop = np.atleast_1d(stop)
+   start = np.where(start < 0, np.maximum(start + width, 0), np.minimum(start, width))
+   stop = np.where(stop < 0, np.maximum(stop + width, 0), np.minimum(stop, width))
+   cols = np.maximum(stop - start, 0)
+   return np.where(cols > 0, prefix[stop] - prefix[start], 0), cols
+
+
+def lighter_than(sums, cols, ref_sum, ref_cols):
+   """
+   This function compares the mean intensity of strips with a reference strip, using integer cross 
+   multiplication so no rounding is involved. Empty strips are never lighter. 
+
+   PARAMETERS:
+   sums, cols (ndarray): The sums and column counts of the strips from strip_sums
+   ref_sum, ref_cols (ndarray): The sum and column count of the reference strip
+
+   RETURNS:
+   ndarray: A boolean array that is True where the strip mean is greater than the reference mean
+   """
+   return (cols > 0) & (sums * ref_cols > ref_sum * cols)
+
+
+def first_false(mask):
+   """
+   This function finds the position of the first False value in a boolean array. 
+
+   PARAMETERS:
+   mask (ndarray): A boolean array
+
+   RETURNS:
+   int: The index of the first False value, or the last index if every value is True
+   """
+   stops = np.flatnonzero(~mask)
+   return stops[0] if len(stops) > 0 else len(mask) - 1
+
+
 def main_bbox(image, c_df, x_buffer=20, y_buffer=5, round=1):
    """
    This function finds the main bounding box fom an image based on the contour data using the largest contours. 
@@ -104,7 +359,7 @@ def main_bbox(image, c_df, x_buffer=20, y_buffer=5, round=1):
    
    PARAMETERS:
    img (cv2 image): The image the contours were detected in 
-   c_df (contour DataFrame): A DataFrame containing contour information
+   c_df (contour table): A contour table from contour_table, or a DataFrame from contour_df
    x_buffer (int): x-axis buffer to add to the left and right sides of the bounding box with a default of 20 pixels
    y_buffer (int): y-axis buffer to add to the top and bottom of the bounding box with a default is 5 pixels
    round (int): The processing stage or filtering round to apply with a default of 1
@@ -117,7 +372,7 @@ def main_bbox(image, c_df, x_buffer=20, y_buffer=5, round=1):
           max_y: Maximum y-coordinate
    """  
    #if there is only one contour, use its bounding box directly 
-   
+   c_df = as_contour_table(c_df)
    if len(c_df) == 1:
         min_x = c_df['x'][0]
         max_x = c_df['x'][0] + c_df['width'][0]
@@ -126,49 +381,34 @@ def main_bbox(image, c_df, x_buffer=20, y_buffer=5, round=1):
     
    else:
        #for multiple contours, find the largest contour 
-        largest_contour = c_df[c_df.area == max(c_df['area'])].head(1)# .head() is used to prevent having more than one result
-        x_width = largest_contour.width  # creates x-value boundaries based on the dimension of largest contour
-        min_x = int(largest_contour.x)
-        max_x = int(min_x + x_width)
+        largest = np.argmax(c_df['area']) # argmax returns the first row if more than one has the largest area
+        min_x = int(c_df['x'][largest]) # creates x-value boundaries based on the dimension of largest contour
+        max_x = int(min_x + c_df['width'][largest])
         
         #calculate the vertical bounding box 
-        
-        c_df["bottom"] = c_df.y+c_df.height
-        y_vals = np.array(c_df['y'])
-        highest_contour = c_df[c_df['y'] == min(y_vals)].head(1)
-        lowest_contour = c_df[c_df['bottom'] == c_df.bottom.max()]
-        min_y = int(highest_contour['y'].values)
-        max_y = int(lowest_contour['y'].values + lowest_contour['height'].values)
+        min_y, max_y = vertical_extent(c_df)
 
    if round == 1:
         # adjust the bounding box to remove excess whitespace or marginalia 
-        img_height,img_width,_ = image.shape
-        #calculate the median pixal value in the middle strip of the image 
-        mid_pixels = [np.mean(x) for x in np.array(image[min_y:max_y, int(min_x/2-5):int(max_x/2+5)])]
-        mid_pixels.sort()
-        mid_median = np.mean(mid_pixels)
-        #adjust the right boundry of the bounding box 
-        right_strip = np.array(image[min_y:max_y, max_x-5:max_x])
-        right_pixels = [np.mean(x) for x in right_strip]
-        right_pixels.sort()
-        right_median = np.mean(right_pixels)
-        
-        while (right_median > mid_median):
-            max_x = max_x - 5
-            right_strip = np.array(image[min_y:max_y, max_x-5:max_x])
-            right_pixels = [np.mean(x) for x in right_strip]
-            right_pixels.sort()
-            right_median = np.mean(right_pixels)
-        #adjust the left boundry of the bounding box     
-        left_pixels = [np.mean(x) for x in np.array(image[min_y:max_y, min_x:min_x+5])]
-        left_pixels.sort()
-        left_median = np.mean(left_pixels)
-        
-        while (left_median > mid_median):
-            min_x = min_x + 5
-            left_pixels = [np.mean(x) for x in np.array(image[min_y:max_y, min_x:min_x+5])]
-            left_pixels.sort()
-            left_median = np.mean(left_pixels)   
+        rows = image[min_y:max_y]
+        #per-column intensity of the text block rows as prefix sums, so the mean of any strip is two lookups 
+        profile = rows.sum(axis=0, dtype=np.int64)
+        if profile.ndim > 1:
+            profile = profile.sum(axis=1)
+        prefix = np.concatenate(([0], np.cumsum(profile)))
+        #calculate the mean pixal value in the middle strip of the image 
+        mid_sum, mid_cols = strip_sums(prefix, int(min_x/2-5), int(max_x/2+5))
+        if len(rows) > 0 and mid_cols[0] > 0:
+            #every 5 pixel step an edge can take before its strip runs out of the image 
+            steps = 5 * np.arange((abs(min_x) + abs(max_x) + len(profile)) // 5 + 2)
+            right_x = max_x - steps
+            right_sum, right_cols = strip_sums(prefix, right_x - 5, right_x)
+            #adjust the right boundry of the bounding box to the first strip that is not lighter than the middle 
+            max_x = right_x[first_false(lighter_than(right_sum, right_cols, mid_sum, mid_cols))]
+            #adjust the left boundry of the bounding box 
+            left_x = min_x + steps
+            left_sum, left_cols = strip_sums(prefix, left_x, left_x + 5)
+            min_x = left_x[first_false(lighter_than(left_sum, left_cols, mid_sum, mid_cols))]
 
     # returns values with the buffer applied to the x values 
    return min_x-x_buffer, max_x+x_buffer, min_y, max_y
@@ -187,7 +427,7 @@ def check_for_marginalia(img):
     RETURNS: 
     bool: returns true if marginalia is detected, otherwise returns false 
     """
-    img_height, img_width, _ = img.shape #retrieves the dimensions of the image 
+    img_height, img_width = img.shape[:2] #retrieves the dimensions of the image 
     try:
         left_strip = np.mean(np.array(img[:,0:int(img_width*0.05)])) #looks at the left strip
         right_strip = np.mean(np.array(img[:,img_width-int(img_width*0.05):img_width])) #looks at the right strip 
@@ -200,7 +440,7 @@ def check_for_marginalia(img):
         return False
    
   
-def remove_child_marginalia(img, dil_iter=24):  
+def remove_child_marginalia(img, dil_iter=24, page=None):  
    """
    This function removes marginalia from child contours of the largest contour in a cropped image. It uses 
    image processing techniques to identify and remove smaller, irrelevant contours that may be considered marginalia.
@@ -208,34 +448,31 @@ def remove_child_marginalia(img, dil_iter=24):
    PARAMETERS:
    img (cv2 image): The cropped image to be cleaned
    dil_iter (int, optional): The number of dilation iterations to apply during image processing with a default of 24 
+   page (PageAnalysis, optional): The analysis of img, for example a region of the page analysis. It is computed when not given. 
 
    RETURNS:
    int: The mean width of the child contours which is used to change x1 value in the main function 
    """
-   gray = cv2.cvtColor(img,cv2.COLOR_BGR2GRAY) # grayscale
-   _,thresh = cv2.threshold(gray,140, 255,cv2.THRESH_BINARY_INV) # threshold
-   kernel = cv2.getStructuringElement(cv2.MORPH_CROSS,(3,3)) 
-   dilated = cv2.dilate(thresh,kernel,iterations = dil_iter) # dilate
-   contours, hierarchy = cv2.findContours(dilated,cv2.RETR_CCOMP,cv2.CHAIN_APPROX_NONE)
-   c_df = contour_df(img, contours, hierarchy, round==2)
+   if page is None:
+        page = PageAnalysis(img, dil_iter) # grayscale, threshold and dilate
+   contours, hierarchy = page.contours()
+   c_df = contour_table(img, contours, hierarchy, round=2)
     
   # finds the largest contour 
-   max_area = np.max(c_df['area'])
-   largest_contour = c_df[c_df['area'] == max_area].reset_index()
+   largest = np.argmax(c_df['area'])
     
     #finds the child contours of the largest contour 
-   children_contours = c_df[c_df['x'] == largest_contour['x'][0]]
-   children_contours = children_contours[children_contours['index'] != largest_contour['index'][0]]
+   children = (c_df['x'] == c_df['x'][largest]) & (c_df['index'] != c_df['index'][largest])
     #returns the mean width of the child contours or 0 is none are found 
-   if len(children_contours) == 0:
+   if not children.any():
         return 0
    else:
-        mean_width= np.mean(children_contours['width'])
+        mean_width= np.mean(c_df['width'][children])
         return int(mean_width)
 
 
 
-def crop_round2(img, dil_iter=24):
+def crop_round2(img, dil_iter=24, page=None):
     """
     This function performs a second round of croppong on the left hand side of the image to remove other watermarks and headers 
     This function slices 10% of the width from the left side of the image to analyze and remove unwanted elements and converts it to grayscale, 
@@ -245,6 +482,7 @@ def crop_round2(img, dil_iter=24):
     PARAMETERS:
     img (cv2 image): The input image to be processed 
     dil_iter (int, optional): The number of dilation iterations to apply during image processing with a default of 24
+    page (PageAnalysis, optional): The analysis of img, for example a region of the page analysis. It is computed when not given. 
 
     RETURNS:
     A tuple containing two values:
@@ -252,26 +490,19 @@ def crop_round2(img, dil_iter=24):
         bottom_diff (int): The adjustment to the bottom boundary (maximum y-value)
     """
     strip_width = int(img.shape[1]*0.1)
-    strip = img[:,0:strip_width]
-    
-    gray = cv2.cvtColor(strip,cv2.COLOR_BGR2GRAY) # grayscale
-    _,thresh = cv2.threshold(gray,140, 255,cv2.THRESH_BINARY_INV) # threshold
-    kernel = cv2.getStructuringElement(cv2.MORPH_CROSS,(3,3))
-    dilated = cv2.dilate(thresh,kernel,iterations = dil_iter) # dilate
-    contours, hierarchy = cv2.findContours(dilated,cv2.RETR_EXTERNAL,cv2.CHAIN_APPROX_NONE)
-    c_df = contour_df(strip, contours, hierarchy, round==2)
+    if page is None:
+        strip = PageAnalysis(img[:,0:strip_width], dil_iter) # grayscale, threshold and dilate
+    else:
+        strip = page.region(0, None, 0, strip_width)
+    contours, hierarchy = strip.contours(cv2.RETR_EXTERNAL)
+    c_df = contour_table(strip.img, contours, hierarchy, round=2)
     
     if len(c_df) == 1:
         min_y = c_df['y'][0]
         max_y = c_df['y'][0] + c_df['height'][0]
     
     else:
-        c_df["bottom"] = c_df.y+c_df.height
-        y_vals = np.array(c_df['y'])
-        highest_contour = c_df[c_df['y'] == min(y_vals)].head(1)
-        lowest_contour = c_df[c_df['bottom'] == c_df.bottom.max()]
-        min_y = int(highest_contour['y'].values)
-        max_y = int(lowest_contour['y'].values + lowest_contour['height'].values)
+        min_y, max_y = vertical_extent(c_df)
 
     top_diff = min_y
     bottom_diff = img.shape[0] - max_y
@@ -302,7 +533,7 @@ def crop_report(path_list, dil_iter=30, x_buffer=20, y_buffer=5):
     for i, path in enumerate(path_list):
         img = cv2.imread(path)
         contours, hierarchy = get_contours(img, dil_iter)
-        c_df = contour_df(img, contours, hierarchy)
+        c_df = contour_table(img, contours, hierarchy)
         try:
             x1, x2, y1, y2 = main_bbox(img, c_df, x_buffer, y_buffer)
             results.append({
@@ -347,7 +578,7 @@ def crop2csv(path_list, dil_iter=30, x_buffer=20, y_buffer=5):
         print(filename)
         contours, hierarchy = get_contours(img, dil_iter)
         
-        c_df = contour_df(img, contours, hierarchy)
+        c_df = contour_table(img, contours, hierarchy)
 
         try:
             x1, x2, y1, y2 = main_bbox(img, c_df, x_buffer, y_buffer)
@@ -1,13 +1,22 @@
 from crop import *
 from text_tools import *
 from crop_functions import*
+from ocr import *
+import argparse
+import concurrent.futures
+import queue
+import threading
+import time
+import state
 
-def single(volume):
+def single(volume, jobs=1, scale=1):
     """
     This function processes a single volume/folder by cropping images within the volume.
     
     Parameters:
     volume (str): This is the identifier or path of the volume/folder to be processed.
+    jobs (int): The number of worker processes used for cropping pages. Default is 1.
+    scale (int): Find crop boxes on pages decoded at 1/scale of their size (2, 4 or 8). Default is 1.
     
     Returns:
     None
@@ -16,34 +25,46 @@ def single(volume):
     list, volume = volList(volume)
     if len(list) > 0:
         #crops images with specified parameters 
-        crop(volume, list, 18, 10, 30)
+        crop(volume, list, 18, 10, 30, jobs=jobs, scale=scale)
     else:
         print('no images files in root of volume directory')
 
-def crop_all_volumes():
+def crop_all_volumes(jobs=1, scale=1, write_crops=True):
     """
-    This function processes all volumes by cropping images within each volume.
+    This function processes all volumes by cropping images within each volume. Pages already cropped with the same 
+    parameters are skipped, so an interrupted run can simply be started again.
     
     Parameters:
-    None
+    jobs (int): The number of worker processes used for cropping the pages of each volume. Default is 1.
+    scale (int): Find crop boxes on pages decoded at 1/scale of their size (2, 4 or 8). Default is 1.
+    write_crops (bool): Save cropped images. With False only the crop boxes are recorded in the contour report. Default is True.
     
     Returns:
     None
     """
+    volumes = os.listdir('../../images/')
     volumes.sort()
     for volume in volumes:
-        if not os.path.exists(f"../../images/{volume}/cropped") and os.path.isdir(f"../../images/{volume}"):
+        # volumes cropped before crop manifests were kept are left as they are, the others resume from their manifest 
+        cropped = os.path.exists(f"../../images/{volume}/cropped") or os.path.exists(f"../../images/{volume}/{volume}_contourreport.csv")
+        legacy = cropped and not os.path.exists(f"../../images/{volume}/{volume}_cropmanifest.csv")
+        if not legacy and os.path.isdir(f"../../images/{volume}"):
             list, volume = volList(volume)
-            crop(volume, list, 27, 20, 20)
-            outliers = process_outliers(volume)
+            crop(volume, list, 27, 20, 20, jobs=jobs, scale=scale, write_crops=write_crops, outliers=True)
             print(volume + "done")
 
-def ocr_all_croppped_volumes():
+def ocr_all_croppped_volumes(virtual=False, jobs=1, shard=0, shards=1, backend='auto', words=False):
     """
-    This function runs OCR on all cropped volumes
+    This function runs OCR on all cropped volumes. To spread the volumes over several nodes, start one run per
+    node with the same shards and a different shard, e.g. from a SLURM array with shard=$SLURM_ARRAY_TASK_ID.
     
     Parameters:
-    None
+    virtual (bool): OCR volumes cropped with write_crops=False by cropping the originals in memory. Default is False.
+    jobs (int): The number of worker processes used for the pages of each volume. Default is 1.
+    shard (int): The share of the volumes processed by this run, from 0 to shards - 1. Default is 0.
+    shards (int): The number of runs the volumes are split between. Default is 1.
+    backend (str): The OCR backend, 'tesserocr', 'pytesseract' or 'auto'. Default is 'auto', see ocr.start_backend.
+    words (bool): Also save word boxes and confidences for each volume, see ocr.reocr_low_confidence. Default is False.
     
     Returns:
     None
@@ -51,15 +72,254 @@ def ocr_all_croppped_volumes():
 
     volumes = os.listdir('../../images/')
     volumes.sort()
-    for volume in volumes:
-        if os.path.exists(f"../../images/{volume}/cropped") and os.path.isdir(f"../../images/{volume}"):
-            ocr_cropped_volume(volume)
+    for volume in volumes[shard::shards]:
+        cropped = f"../../images/{volume}/{volume}_contourreport.csv" if virtual else f"../../images/{volume}/cropped"
+        if os.path.exists(cropped) and os.path.isdir(f"../../images/{volume}"):
+            ocr_cropped_volume(volume, virtual=virtual, jobs=jobs, backend=backend, words=words)
+
+
+def pipeline(volume, dil_iter=27, x_buffer=20, y_buffer=20, write_crops=False, backend='auto', ocr_threads=1, queue_size=8, cache=True,
+             input_mode='color', dpi=300, source_dpi=SOURCE_DPI, resume=True, outliers=False):
+    """
+    This function crops and OCRs a volume in one pass. Pages are read, cropped and read by OCR in three stages 
+    running side by side, connected by bounded queues, so the next pages are read from disk and cropped while 
+    OCR works on the current one. Each page is read from disk once: its bytes are hashed for the crop manifest 
+    and decoded once, and the cropped array goes straight to OCR without being written and read back as a JPEG.
+
+    The crop manifest and contour report are updated as crop() would, so status.py and later runs see the pages.
+    As in crop(), pages the manifest shows are already cropped with the same parameters, and that have their text,
+    are skipped, and crop boxes can be checked for outliers as the pages go by, see crop.StreamingOutliers. 
+    Outliers are sent to the issues folder instead of OCR. Until enough pages are in to score them, the pages 
+    wait in the crop stage.
+    
+    Parameters:
+    volume (str): The identifier of the volume to be processed.
+    dil_iter (int): Number of dilation iterations for contour detection. Default is 27.
+    x_buffer (int): Horizontal buffer for the bounding box. Default is 20.
+    y_buffer (int): Vertical buffer for the bounding box. Default is 20.
+    write_crops (bool): Also save the cropped images to the cropped folder. Default is False.
+    backend (str): The OCR backend, 'tesserocr', 'pytesseract' or 'auto'. Default is 'auto', see ocr.start_backend.
+    ocr_threads (int): The number of pages read by OCR at the same time, each with its own backend. With more 
+                       than one Tesseract is limited to one thread per page. Default is 1.
+    queue_size (int): The number of pages each queue holds, which bounds the memory used. Default is 8.
+    cache (bool): Use the OCR cache, see ocr_cache. Default is True.
+    input_mode (str): 'color' to OCR the cropped page as it is, or 'binary' to OCR the crop stage's own thresholded
+                      page resampled to dpi, see ocr.prepare_input. Default is 'color'.
+    dpi (int): The resolution of 'binary' pages. Default is 300.
+    source_dpi (int): The resolution the volume was scanned at. Default is ocr.SOURCE_DPI.
+    resume (bool): Skip pages that are unchanged since the last run, see crop.is_current. With False the manifest
+                   is cleared and every page is processed again. Default is True.
+    outliers (bool): Check each crop box against the volume as pages are cropped. Default is False.
+    
+    Returns:
+    None
+    """
+    path_list, volume = volList(volume)
+    path_list.sort()
+    if len(path_list) == 0:
+        print('no images files in root of volume directory')
+        return
+    #the OCR threads share this process, the limit is kept until they are done 
+    previous = limit_threads() if ocr_threads > 1 else os.environ.get('OMP_THREAD_LIMIT')
+    try:
+        engine = start_backend(backend)
+    except Exception:
+        restore_threads(previous)
+        raise
+    backend, version = engine.name, engine.version()
+    tesseract_cmd = getattr(engine, 'tesseract_cmd', None)
+    cache_dir = ocr_cache.CACHE_DIR if cache else None
+    output_dir = f"{os.getcwd()}/images/{volume}/text/"
+    os.makedirs(output_dir, exist_ok=True)
+    params = {'dil_iter': dil_iter, 'x_buffer': x_buffer, 'y_buffer': y_buffer, 'scale': 1}
+    manifest_path = f"{os.getcwd()}/images/{volume}/{volume}_cropmanifest.csv"
+    if not resume and os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    done = read_manifest(manifest_path)
+    stats = StreamingOutliers() if outliers else None
+
+    read_q = queue.Queue(queue_size)
+    ocr_q = queue.Queue(queue_size)
+    done_q = queue.Queue()
+    #OCR threads still running, and the end markers of the crop stage that have been taken 
+    ocr_state = {'running': ocr_threads, 'ended': 0}
+    ocr_lock = threading.Lock()
+
+    def read_pages():
+        try:
+            for path in path_list:
+                try:
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                    sha1 = hashlib.sha1(data).hexdigest()
+                    filename = os.path.basename(path)
+                    entry = done.get(filename)
+                    crop_path = f"{os.getcwd()}/images/{volume}/cropped/{filename.replace('.jpg', '')}_crop.jpg" if write_crops else None
+                    if is_current(entry, sha1, params, crop_path) and (entry['error'] or entry['outlier'] or 
+                                                                       os.path.exists(output_dir + filename.replace('.jpg', '.txt'))):
+                        #the page is not decoded, its row goes through the crop stage for the outlier statistics 
+                        read_q.put((path, sha1, None, entry))
+                        continue
+                    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+                    read_q.put((path, sha1, img, None))
+                except Exception as e:
+                    print(f"There was an issue reading {path}: {e}")
+                    read_q.put((path, None, None, None))
+        finally:
+            read_q.put(None)
+
+    #pages cropped before the outlier statistics are ready, with their crops 
+    waiting = []
 
+    def send(row, crop):
+        if stats is not None and not row['error']:
+            z = stats.scores(row)
+            row.update(z, outlier=stats.is_outlier(z))
+            if row['outlier']:
+                flag_outlier(volume, row)
+                done_q.put((row, 'outlier'))
+                return
+        ocr_q.put((row, crop))
+
+    def crop_pages():
+        try:
+            while True:
+                item = read_q.get()
+                if item is None:
+                    break
+                path, sha1, img, entry = item
+                if entry is not None:
+                    if stats is not None and not entry['error']:
+                        stats.add(entry)
+                    done_q.put((entry, 'unchanged'))
+                    continue
+                if img is None:
+                    done_q.put((None, 'issues'))
+                    continue
+                try:
+                    page = PageAnalysis(img, dil_iter)
+                    row = dict(crop_page(volume, path, write_crops=write_crops, img=img, page=page, **params), sha1=sha1, outlier=False, **params)
+                except Exception as e:
+                    print(f"There was an issue cropping {path}: {e}")
+                    done_q.put((None, 'issues'))
+                    continue
+                box = (slice(row['bbox_y1'], row['bbox_y2']), slice(row['bbox_x1'], row['bbox_x2']))
+                if row['error']:
+                    crop = None
+                elif input_mode == 'binary':
+                    #the crop stage's threshold has white text on black, OCR wants the reverse 
+                    crop = cv2.bitwise_not(page.binary[box])
+                else:
+                    crop = img[box]
+                if stats is None or row['error']:
+                    send(row, crop)
+                    continue
+                stats.add(row)
+                waiting.append((row, crop))
+                if stats.ready():
+                    while waiting:
+                        send(*waiting.pop(0))
+            #volumes smaller than the warm up are scored against all of their pages 
+            while waiting:
+                send(*waiting.pop(0))
+        except Exception as e:
+            print(f"Cropping stopped with an error: {e}")
+            for row, _ in waiting:
+                done_q.put((row, 'not read'))
+            #the reader would wait on a full queue, the pages left are not cropped 
+            while read_q.get() is not None:
+                pass
+        finally:
+            for _ in range(ocr_threads):
+                ocr_q.put(None)
+
+    def ocr_pages(shared):
+        engine = None
+        try:
+            #tesseract handles are not shared between threads, each thread but the first loads its own 
+            engine = shared or BACKENDS[backend](tesseract_cmd=tesseract_cmd)
+            while True:
+                item = ocr_q.get()
+                if item is None:
+                    break
+                row, crop = item
+                status = 'read'
+                if crop is not None:
+                    try:
+                        name = row['filename'].replace('.jpg', '.txt')
+                        improved = None
+                        if input_mode == 'binary':
+                            img, _ = resample_binary(crop, source_dpi, dpi, binarized=True)
+                        else:
+                            img = Image.fromarray(cv2.cvtColor(crop, cv2.COLOR_BGR2RGB))
+                            improved = reocr_cached(img, name, output_dir, cache_dir, version)
+                        if improved is None:
+                            _, hit, _ = ocr_image(engine, img, name, output_dir, cache_dir, version)
+                        status = 'cached' if improved is not None or hit else 'read'
+                    except Exception as e:
+                        print(f"There was an issue with OCR of {row['path']}: {e}")
+                        status = 'not read'
+                done_q.put((row, status))
+            with ocr_lock:
+                ocr_state['ended'] += 1
+                ocr_state['running'] -= 1
+        except Exception as e:
+            print(f"OCR stopped with an error: {e}")
+            with ocr_lock:
+                ocr_state['running'] -= 1
+                last = ocr_state['running'] == 0
+            #the last OCR thread takes the pages left without reading them, so the crop stage is not left waiting 
+            if last:
+                while ocr_state['ended'] < ocr_threads:
+                    item = ocr_q.get()
+                    if item is None:
+                        ocr_state['ended'] += 1
+                    else:
+                        done_q.put((item[0], 'not read'))
+        finally:
+            try:
+                if engine is not None and engine is not shared:
+                    engine.close()
+            finally:
+                done_q.put(None)
+
+    print(f"Cropping and reading {len(path_list)} pages of Volume {volume} with Tesseract {version} through {backend}")
+    start = time.time()
+    threads = [threading.Thread(target=read_pages), threading.Thread(target=crop_pages)]
+    #the first OCR thread uses the backend started above, the others start their own 
+    threads += [threading.Thread(target=ocr_pages, args=(engine if i == 0 else None,)) for i in range(ocr_threads)]
+    for thread in threads:
+        thread.start()
+
+    hits = 0
+    processed = 0
+    finished = 0
+    #every OCR thread posts None when it stops, whether or not all pages got through 
+    while finished < ocr_threads:
+        item = done_q.get()
+        if item is None:
+            finished += 1
+            continue
+        row, status = item
+        processed += 1
+        hits += status == 'cached'
+        if row is None:
+            continue
+        done[row['filename']] = row
+        status = 'issues' if row['error'] else status
+        print(f"Processed {row['filename'].replace('.jpg', '')} ({status}) ({processed}/{len(path_list)})")
+    for thread in threads:
+        thread.join()
+    stop_backend()
+    restore_threads(previous)
+
+    save_manifest(volume, done)
+    print(f"Finished Volume {volume} in {time.time() - start:.1f}s, {hits} pages from the OCR cache")
 
 def process_laws(volume):
     """
-    This function processes the laws from a given volume by running quality control, breaking down laws,
-    and extracting their titles.
+    This function processes the laws from a given volume by running quality control and breaking down laws,
+    which also extracts their titles.
     
     Parameters:
     volume (str): The identifier or path of the volume to be processed.
@@ -69,7 +329,6 @@ def process_laws(volume):
     """
     qc_process(volume)
     break_laws(volume)
-    extract_titles(volume)
 
 def build_corpus():
     """
@@ -83,5 +342,163 @@ def build_corpus():
     """
     gather_laws()
 
+def run_stage(conn, volume, stage, pages, paths, jobs=1, dil_iter=27, x_buffer=20, y_buffer=20, backend='auto'):
+    """
+    This function runs one stage on the pending pages of a volume and records the result of each page in the 
+    state store. Text stages that work on a whole volume are run on all of it and recorded for the pages given.
+    
+    Parameters:
+    conn (sqlite3.Connection): The state store.
+    volume (str): The identifier of the volume.
+    stage (str): The stage, one of state.STAGES except gather.
+    pages (list): The page ids the stage is pending for.
+    paths (dict): The image path of each page id.
+    jobs (int): The number of worker processes used for cropping and OCR. Default is 1.
+    dil_iter, x_buffer, y_buffer (int): The crop parameters. Default is 27, 20, 20.
+    backend (str): The OCR backend, see ocr.start_backend. Default is 'auto'.
+    
+    Returns:
+    None
+    """
+    cwd = os.getcwd()
+    if stage in ('crop', 'outliers'):
+        if stage == 'crop':
+            crop(volume, [paths[page] for page in pages if page in paths], dil_iter, x_buffer, y_buffer, jobs=jobs, outliers=True)
+        manifest = read_manifest(f"{cwd}/images/{volume}/{volume}_cropmanifest.csv")
+        rows = {state.page_id(filename): row for filename, row in manifest.items()}
+        for page in pages:
+            row = rows.get(page)
+            if row is None:
+                state.set_status(conn, volume, [page], stage, state.FAILED, 'not in the crop manifest')
+            elif stage == 'crop' and row['error']:
+                state.set_status(conn, volume, [page], 'crop', state.ISSUE, 'crop error')
+            else:
+                if stage == 'crop':
+                    state.set_status(conn, volume, [page], 'crop', state.DONE)
+                #the crop run checks for outliers as it goes 
+                state.set_status(conn, volume, [page], 'outliers', state.ISSUE if row['outlier'] else state.DONE,
+                                 'outlier' if row['outlier'] else None)
+    elif stage == 'ocr':
+        virtual = not os.path.isdir(f"{cwd}/images/{volume}/cropped")
+        results = ocr_cropped_volume(volume, virtual=virtual, jobs=jobs, backend=backend, only=[f"{page}.txt" for page in pages]) or []
+        read = {state.page_id(name) for name, _, _ in results}
+        state.set_status(conn, volume, [page for page in pages if page in read], 'ocr', state.DONE)
+        state.set_status(conn, volume, [page for page in pages if page not in read], 'ocr', state.FAILED, 'no cropped page to read')
+    elif stage == 'qc':
+        qc_process(volume, files=[f"{page}.txt" for page in pages])
+        state.set_status(conn, volume, pages, 'qc', state.DONE)
+    elif stage == 'break_laws':
+        #break_laws saves the titles as it splits the volume 
+        break_laws(volume)
+        state.set_status(conn, volume, pages, 'break_laws', state.DONE)
+        state.set_status(conn, volume, pages, 'titles', state.DONE)
+    elif stage == 'titles':
+        extract_titles(volume)
+        state.set_status(conn, volume, pages, 'titles', state.DONE)
+
+def run_volume(volume, stages=None, jobs=1, retries=2, dil_iter=27, x_buffer=20, y_buffer=20, backend='auto'):
+    """
+    This function runs the pending work of a volume, stage by stage, from the state store. Pages that failed are 
+    tried again up to retries more times. Stages that work on the whole volume wait until no page can still 
+    reach them. A volume that is not in the store yet is first recorded from the files it has, see state.import_volume.
+    
+    Parameters:
+    volume (str): The identifier of the volume.
+    stages (list): The stages to run, in any order. Default is None, every stage but gather, which covers 
+                   all volumes and is run by run_pipeline.
+    jobs (int): The number of worker processes used for cropping and OCR. Default is 1.
+    retries (int): The number of times a failed page is tried again. Default is 2.
+    dil_iter, x_buffer, y_buffer (int): The crop parameters. Default is 27, 20, 20.
+    backend (str): The OCR backend, see ocr.start_backend. Default is 'auto'.
+    
+    Returns:
+    str: The volume.
+    """
+    conn = state.connect()
+    volume = str(volume)
+    if volume not in state.volumes(conn):
+        state.import_volume(conn, volume)
+    path_list, volume = volList(volume)
+    paths = {state.page_id(path): path for path in path_list}
+    state.register_pages(conn, volume, sorted(paths))
+
+    stages = [stage for stage in state.STAGES if stage != 'gather' and (stages is None or stage in stages)]
+    for stage in stages:
+        if stage not in state.PAGE_STAGES and state.blocked(conn, volume, stage, retries + 1) > 0:
+            print(f"Volume {volume}: {stage} is waiting for pages in earlier stages")
+            break
+        for attempt in range(retries + 1):
+            pages = state.pending(conn, volume, stage, retries + 1)
+            if len(pages) == 0:
+                break
+            print(f"Volume {volume}: {stage} on {len(pages)} pages{f' (retry {attempt})' if attempt > 0 else ''}")
+            try:
+                run_stage(conn, volume, stage, pages, paths, jobs, dil_iter, x_buffer, y_buffer, backend)
+            except Exception as e:
+                traceback.print_exc()
+                state.set_status(conn, volume, pages, stage, state.FAILED, repr(e))
+    conn.close()
+    return volume
+
+def run_pipeline(volumes=None, stages=None, jobs=1, volume_jobs=1, retries=2, dil_iter=27, x_buffer=20, y_buffer=20, backend='auto'):
+    """
+    This function runs the pending work of every volume, with several volumes at once if volume_jobs is more than 
+    one, and then gathers the laws of all volumes once none of them can still add laws. Only work the state 
+    store shows is pending or failed is run, so the pipeline can be stopped and started again at any point.
+    
+    Parameters:
+    volumes (list): The volumes to run. Default is None, every volume in the images folder.
+    stages (list): The stages to run. Default is None, every stage, see state.STAGES.
+    jobs (int): The number of worker processes each volume uses for cropping and OCR. Default is 1.
+    volume_jobs (int): The number of volumes run at the same time, each in its own process. Default is 1.
+    retries (int): The number of times a failed page is tried again. Default is 2.
+    dil_iter, x_buffer, y_buffer (int): The crop parameters. Default is 27, 20, 20.
+    backend (str): The OCR backend, see ocr.start_backend. Default is 'auto'.
+    
+    Returns:
+    DataFrame: The summary of the state store, see state.volume_summary.
+    """
+    if volumes is None:
+        volumes = sorted(v for v in os.listdir(f"{os.getcwd()}/images") if os.path.isdir(f"{os.getcwd()}/images/{v}"))
+    args = (stages, jobs, retries, dil_iter, x_buffer, y_buffer, backend)
+    if volume_jobs > 1:
+        with concurrent.futures.ProcessPoolExecutor(volume_jobs) as executor:
+            futures = {executor.submit(run_volume, volume, *args): volume for volume in volumes}
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    print(f"Finished Volume {future.result()}")
+                except Exception:
+                    print(f"Volume {futures[future]} stopped with an error")
+                    traceback.print_exc()
+    else:
+        for volume in volumes:
+            run_volume(volume, *args)
+            print(f"Finished Volume {volume}")
+
+    conn = state.connect()
+    if stages is None or 'gather' in stages:
+        pages = {volume: state.pending(conn, volume, 'gather', retries + 1) for volume in state.volumes(conn)}
+        waiting = [volume for volume in pages if state.blocked(conn, volume, 'gather', retries + 1) > 0]
+        if any(pages.values()) and not waiting:
+            print(f"Gathering laws from {len(pages)} volumes")
+            gather_laws()
+            for volume, todo in pages.items():
+                state.set_status(conn, volume, todo, 'gather', state.DONE)
+        elif waiting:
+            print(f"Gathering laws is waiting for volumes {', '.join(waiting)}")
+    summary = state.volume_summary(conn)
+    conn.close()
+    print(summary.to_string())
+    return summary
+
 
-process_laws(1904)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the pending work of the pipeline recorded in the state store.")
+    parser.add_argument("volumes", nargs="*", help="the volumes to run, every volume by default")
+    parser.add_argument("--stages", nargs="+", choices=state.STAGES)
+    parser.add_argument("--jobs", type=int, default=1)
+    parser.add_argument("--volume-jobs", type=int, default=1)
+    parser.add_argument("--retries", type=int, default=2)
+    parser.add_argument("--backend", default='auto')
+    args = parser.parse_args()
+    run_pipeline(args.volumes or None, args.stages, args.jobs, args.volume_jobs, args.retries, backend=args.backend)
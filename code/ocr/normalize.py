@@ -0,0 +1,89 @@
+import hashlib
+import os
+import re
+
+import corpus
+import ocr_cache
+
+# the normalized text of a law is cached by the hash of its source text and NORMALIZE_VERSION, change the version
+# when normalize_text changes so the cache and the sentences split from it are made again
+NORMALIZE_VERSION = '1'
+NORMALIZED_DIR = os.environ.get('NORMALIZED_CACHE_DIR', os.path.join(os.getcwd(), "normalized"))
+# the size cap of the cache, the texts of laws that were broken again or corrected are removed least recently used first
+MAX_NORMALIZED_MB = 2000
+
+# a word broken with a hyphen at the end of a line or page, "pro-\nvided", is joined back together
+LINE_HYPHEN = re.compile(r"(\w)-[ \t]*\n\s*(\w)")
+WHITESPACE = re.compile(r"\s+")
+
+def normalize_text(text):
+    """
+    This function cleans the OCR text of a law the same way for every tool that reads it: words hyphenated across
+    a line break are joined, lines are joined with a space, and runs of whitespace, including the page breaks
+    Tesseract leaves, become one space.
+
+    PARAMETERS:
+        text (str): The text of a law file.
+
+    RETURNS:
+        str: The normalized text.
+    """
+    text = LINE_HYPHEN.sub(r"\1\2", text)
+    return WHITESPACE.sub(' ', text).strip()
+
+def source_key(text):
+    """
+    This function returns the cache key of the normalized text of a source text.
+    """
+    return hashlib.sha256(f"{NORMALIZE_VERSION}\n{text}".encode('utf-8')).hexdigest()
+
+def normalized(text, cache_dir=None):
+    """
+    This function returns the normalized text of a law, from the cache if the same source text was normalized
+    before, see normalize_text.
+
+    PARAMETERS:
+        text (str): The text of a law file.
+        cache_dir (str): The cache directory (default is NORMALIZED_DIR).
+
+    RETURNS:
+        str: The normalized text.
+    """
+    cache_dir = cache_dir or NORMALIZED_DIR
+    key = source_key(text)
+    cached = ocr_cache.get(cache_dir, key)
+    if cached is not None:
+        return cached
+    result = normalize_text(text)
+    ocr_cache.put(cache_dir, key, result)
+    return result
+
+def normalize_laws(volumes=None, cache_dir=None, max_mb=None):
+    """
+    This function normalizes the law files of some volumes into the cache, so the tools that read the laws
+    afterwards only look them up. The entries of the current laws are marked as used and the cache is then
+    pruned to its size cap, so the texts of old versions of the laws do not pile up.
+
+    PARAMETERS:
+        volumes (list): The volumes (default is None, every volume with laws).
+        cache_dir (str): The cache directory (default is NORMALIZED_DIR).
+        max_mb (float): The size cap of the cache in megabytes (default is None, which uses MAX_NORMALIZED_MB).
+
+    RETURNS:
+        tuple: The number of laws normalized and the number already in the cache.
+    """
+    cache_dir = cache_dir or NORMALIZED_DIR
+    made, found = 0, 0
+    for volume in corpus.law_volumes() if volumes is None else volumes:
+        for _, _, path in corpus.law_files(volume):
+            text = corpus.read_law(path)
+            entry = ocr_cache.entry_path(cache_dir, source_key(text))
+            if os.path.exists(entry):
+                os.utime(entry)
+                found += 1
+            else:
+                normalized(text, cache_dir)
+                made += 1
+    print(f"Normalized {made} laws, {found} already normalized")
+    ocr_cache.prune(cache_dir, max_mb or MAX_NORMALIZED_MB)
+    return made, found
@@ -1,9 +1,14 @@
+import importlib.util
 import subprocess
 import shutil
 import pytesseract
 import os
 import sys
+import time
+import pandas as pd
 from PIL import Image
+import ocr_cache
+import ocr_words
 
 def get_tesseract_version():
     """
@@ -23,61 +28,615 @@ def get_tesseract_version():
         print(f"Error detecting Tesseract version: {e}")
         return None
 
-def ocr_cropped_volume(volume, dir='cropped'):
+def load_page(volume, page):
     """
-    This function performs OCR on cropped images in a specified directory and saves the text output to files.
+    This function loads a page for OCR, either a cropped image file or a crop cut from the original image
+    using its row in the contour report.
+
+    PARAMETERS:
+        volume (int or str): The volume identifier for the image files.
+        page (str or dict): The path of a cropped image, or a contour report row for a virtual crop.
+
+    Returns:
+        PIL.Image: The page image.
+    """
+    if isinstance(page, str):
+        return Image.open(page)
+    import cv2
+    from crop import load_crop
+    return Image.fromarray(cv2.cvtColor(load_crop(volume, page), cv2.COLOR_BGR2RGB))
+
+def list_pages(volume, dir='cropped', virtual=False):
+    """
+    This function lists the pages of a volume to OCR with the name of the text file each one is saved to.
 
     PARAMETERS:
         volume (int or str): The volume identifier for the image files.
         dir (str): The name of the directory containing cropped images (default is 'cropped').
+        virtual (bool): List the crop boxes in the contour report instead of cropped images (default is False).
+
+    Returns:
+        list: (text file name, page) pairs in page order, where page is accepted by load_page.
+    """
+    cwd = os.getcwd()
+    if virtual:
+        from crop import virtual_crops
+        rows = virtual_crops(volume)
+        return [(row['filename'].replace('.jpg', '.txt'), row.to_dict()) for _, row in rows.iterrows()]
+
+    cropped = os.path.join(cwd, "images", volume, dir) #cropped = f"{cwd}/images/{volume}/{dir}/" 
+    content = [x for x in os.listdir(cropped) if '_crop.jpg' in x]
+    content.sort()
+    return [(filename.replace('_crop.jpg', '.txt'), os.path.join(cropped, filename)) for filename in content]
+
+def has_tesserocr():
+    """
+    This function checks whether the optional tesserocr package is installed, without loading it.
+
+    Returns:
+        bool: True if tesserocr can be imported.
+    """
+    return importlib.util.find_spec('tesserocr') is not None
+
+class PytesseractBackend:
+    """
+    This class runs OCR through pytesseract, which starts the tesseract binary for every page and passes the
+    image and text through temporary files. It works wherever the binary is installed. image_to_string returns 
+    the text of a page and image_to_data the text together with its words, see ocr_words.
+
+    PARAMETERS:
+        lang (str): The Tesseract language (default is 'eng').
+        psm (int): The Tesseract page segmentation mode (default is 3, Tesseract's own default).
+        tesseract_cmd (str): The path of the tesseract binary (default is None, which searches the PATH).
 
     Raises:
         EnvironmentError: If the Tesseract binary is not found.
     """
-    # Automatically find the Tesseract binary
-    tesseract_cmd = shutil.which('tesseract')
-    if tesseract_cmd:
-        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    name = 'pytesseract'
+
+    def __init__(self, lang='eng', psm=3, tesseract_cmd=None):
+        self.lang = lang
+        self.config = f"--psm {psm}"
+        self.settings = f"{self.name} lang={lang} psm={psm}"
+        self.tesseract_cmd = tesseract_cmd or shutil.which('tesseract')
+        if not self.tesseract_cmd:
+            raise EnvironmentError("Tesseract binary not found. Make sure Tesseract is installed and accessible in your system's PATH.")
+        pytesseract.pytesseract.tesseract_cmd = self.tesseract_cmd
+
+    def version(self):
+        return str(pytesseract.get_tesseract_version())
+
+    def page_config(self, img):
+        # images from prepare_input carry their resolution, which the PNG pytesseract writes would lose
+        if 'ocr_dpi' in img.info:
+            return f"{self.config} --dpi {img.info['ocr_dpi']}"
+        return self.config
+
+    def image_to_string(self, img):
+        return pytesseract.image_to_string(img, lang=self.lang, config=self.page_config(img))
+
+    def image_to_data(self, img):
+        # one tesseract run writes both the text and the TSV with the words
+        with pytesseract.pytesseract.save(img) as (temp_name, input_filename):
+            pytesseract.pytesseract.run_tesseract(input_filename, temp_name, 'txt', self.lang, f"{self.page_config(img)} -c tessedit_create_tsv=1")
+            with open(f"{temp_name}.txt", 'rb') as f:
+                text = f.read().decode('utf-8')
+            with open(f"{temp_name}.tsv", 'rb') as f:
+                words = ocr_words.parse_tesseract_tsv(f.read().decode('utf-8'))
+        return text, words
+
+    def close(self):
+        pass
+
+class TesserocrBackend:
+    """
+    This class runs OCR in this process through tesserocr, which links the Tesseract library directly. The
+    language model is loaded once when the backend is created and reused for every page, and images are passed
+    in memory, so no process is started and no temporary file is written per page.
+
+    PARAMETERS:
+        lang (str): The Tesseract language (default is 'eng').
+        psm (int): The Tesseract page segmentation mode (default is 3, Tesseract's own default).
+        tesseract_cmd (str): Not used, accepted so both backends are created the same way.
+    """
+    name = 'tesserocr'
+
+    def __init__(self, lang='eng', psm=3, tesseract_cmd=None):
+        import tesserocr
+        self.tesserocr = tesserocr
+        self.settings = f"{self.name} lang={lang} psm={psm}"
+        self.api = tesserocr.PyTessBaseAPI(lang=lang, psm=psm)
+
+    def version(self):
+        return self.tesserocr.tesseract_version().split()[1]
+
+    def image_to_string(self, img):
+        self.api.SetImage(img)
+        if 'ocr_dpi' in img.info:
+            self.api.SetSourceResolution(img.info['ocr_dpi'])
+        # the tesseract binary ends every page with a form feed, keep it so both backends write the same files
+        return self.api.GetUTF8Text() + '\f'
+
+    def image_to_data(self, img):
+        RIL = self.tesserocr.RIL
+        text = self.image_to_string(img)
+        words = ocr_words.empty_words()
+        line = -1
+        iterator = self.api.GetIterator()
+        if iterator is None:
+            return text, words
+        for word in self.tesserocr.iterate_level(iterator, RIL.WORD):
+            if word.IsAtBeginningOf(RIL.TEXTLINE):
+                line += 1
+            box = word.BoundingBox(RIL.WORD)
+            if box is None:
+                continue
+            x1, y1, x2, y2 = box
+            for column, value in zip(ocr_words.WORD_COLUMNS, [max(line, 0), x1, y1, x2 - x1, y2 - y1, 
+                                                              word.Confidence(RIL.WORD), word.GetUTF8Text(RIL.WORD) or '']):
+                words[column].append(value)
+        return text, words
+
+    def close(self):
+        self.api.End()
+
+BACKENDS = {'pytesseract': PytesseractBackend, 'tesserocr': TesserocrBackend}
+
+# the backend used by ocr_page, one per process
+engine = None
+
+def limit_threads():
+    """
+    This function caps Tesseract's OpenMP threading at one thread, so that N workers use N cores instead of each 
+    starting a thread per core. OpenMP reads the limit when the Tesseract library is loaded, so it must be called 
+    before the first backend is created in the process. The worker processes call it when they start, see 
+    start_backend; elsewhere the limit is put back with restore_threads once it is no longer needed.
+
+    Returns:
+        str: The limit it replaced, None if there was none.
+    """
+    previous = os.environ.get('OMP_THREAD_LIMIT')
+    os.environ['OMP_THREAD_LIMIT'] = '1'
+    return previous
+
+def restore_threads(previous):
+    """
+    This function puts back the thread limit that limit_threads replaced, so later runs with one job in the same
+    session use every core again.
+    """
+    if previous is None:
+        os.environ.pop('OMP_THREAD_LIMIT', None)
     else:
-        raise EnvironmentError("Tesseract binary not found. Make sure Tesseract is installed and accessible in your system's PATH.")
+        os.environ['OMP_THREAD_LIMIT'] = previous
+
+def start_backend(backend='auto', tesseract_cmd=None, limit=False):
+    """
+    This function creates the OCR backend used by ocr_page in this process, or keeps the one already loaded. 
+    It is also the initializer of the worker processes, so each worker loads the language model once.
+
+    PARAMETERS:
+        backend (str): 'tesserocr', 'pytesseract' or 'auto', which uses tesserocr when it is installed and can load
+                       its language model, and pytesseract otherwise (default is 'auto').
+        tesseract_cmd (str): The path of the tesseract binary for the pytesseract backend (default is None).
+        limit (bool): Call limit_threads first (default is False).
+
+    Returns:
+        object: The backend.
+    """
+    global engine
+    if limit:
+        limit_threads()
+    if backend == 'auto':
+        if not has_tesserocr():
+            return start_backend('pytesseract', tesseract_cmd)
+        try:
+            return start_backend('tesserocr', tesseract_cmd)
+        except RuntimeError as e:
+            print(f"Could not start tesserocr, using pytesseract: {e}")
+            return start_backend('pytesseract', tesseract_cmd)
+    if engine is not None and engine.name == backend:
+        return engine
+    if engine is not None:
+        engine.close()
+        engine = None
+    engine = BACKENDS[backend](tesseract_cmd=tesseract_cmd)
+    return engine
+
+def stop_backend():
+    """
+    This function closes the OCR backend of this process, if one is loaded.
+    """
+    global engine
+    if engine is not None:
+        engine.close()
+        engine = None
+
+def ocr_image(backend, img, name, output_dir, cache_dir=None, version=None, words=False):
+    """
+    This function runs OCR on a page image and saves the text. With a cache, a page whose pixels were already 
+    read with the same Tesseract version and settings is served from the cache instead.
+
+    PARAMETERS:
+        backend (object): The OCR backend, see start_backend.
+        img (PIL.Image): The page image.
+        name (str): The name of the text file.
+        output_dir (str): The directory the text file is saved to.
+        cache_dir (str): The cache directory (default is None, which does not use the cache).
+        version (str): The Tesseract version, part of the cache key (default is None).
+        words (bool): Also return the boxes and confidences of the words (default is False).
+
+    Returns:
+        tuple: The cache key (None without a cache), whether the page was a cache hit, and the word columns 
+               (None unless words is True).
+    """
+    key, text, data = None, None, None
+    if cache_dir is not None:
+        settings = backend.settings if 'ocr_dpi' not in img.info else f"{backend.settings} dpi={img.info['ocr_dpi']}"
+        key = ocr_cache.page_key(img, version, settings)
+        text = ocr_cache.get(cache_dir, key)
+        if words and text is not None:
+            tsv = ocr_cache.get(cache_dir, key, '.tsv')
+            text, data = (None, None) if tsv is None else (text, ocr_words.tsv_to_words(tsv))
+    hit = text is not None
+    if not hit:
+        if words:
+            text, data = backend.image_to_data(img)
+        else:
+            text = backend.image_to_string(img)
+        if cache_dir is not None:
+            if words:
+                ocr_cache.put(cache_dir, key, ocr_words.words_to_tsv(data), '.tsv')
+            ocr_cache.put(cache_dir, key, text)
+
+    with open(os.path.join(output_dir, name), mode='w') as ocrf:
+        ocrf.write(text)
+    return key, hit, data
+
+# resolution the volumes were scanned at, crops written by plt.imsave record matplotlib's 100 dpi instead
+SOURCE_DPI = 300
+INPUT_MODES = ('color', 'binary')
+# the settings the pages improved by re-OCR are cached under, keyed by the pixels of the page before any preparation
+REOCR_SETTINGS = 'reocr'
+
+def resample_binary(gray, source_dpi, dpi, binarized=False):
+    """
+    This function resamples a grayscale page to a target resolution and binarizes it.
+
+    PARAMETERS:
+        gray (ndarray): The single channel page, dark text on a light background.
+        source_dpi (int): The resolution of the page.
+        dpi (int): The resolution to resample to.
+        binarized (bool): The page is already binarized, it is only thresholded again if resampling added 
+                          gray levels (default is False).
 
-    # Get Tesseract version (optional, but useful for logging)
-    tesseract_version = get_tesseract_version()
+    Returns:
+        tuple: The page as a single channel PIL.Image that records dpi for the backends, and the factor its size 
+               was multiplied by.
+    """
+    import cv2
+    factor = dpi / source_dpi
+    if factor != 1:
+        gray = cv2.resize(gray, None, fx=factor, fy=factor, interpolation=cv2.INTER_AREA if factor < 1 else cv2.INTER_LINEAR)
+    if factor != 1 or not binarized:
+        # the threshold of the crop stage, see crop_functions.PageAnalysis
+        threshold = 127 if binarized else 140
+        _, gray = cv2.threshold(gray, threshold, 255, cv2.THRESH_BINARY)
+    img = Image.fromarray(gray)
+    img.info['ocr_dpi'] = int(dpi)
+    return img, factor
+
+def prepare_input(img, mode='color', dpi=300, source_dpi=SOURCE_DPI):
+    """
+    This function prepares a page image for OCR. 'color' sends the page as it is and Tesseract converts it to 
+    grayscale and binarizes it itself. 'binary' sends a single channel page thresholded as in the crop stage and
+    resampled to dpi, which is a third of the pixels to pass and leaves Tesseract less to do.
+
+    PARAMETERS:
+        img (PIL.Image): The page image.
+        mode (str): 'color' or 'binary' (default is 'color').
+        dpi (int): The resolution 'binary' pages are resampled to (default is 300).
+        source_dpi (int): The resolution the page was scanned at (default is SOURCE_DPI).
+
+    Returns:
+        tuple: The image to OCR and the factor its size was multiplied by.
+    """
+    import numpy as np
+    if mode == 'color':
+        return img, 1
+    if mode != 'binary':
+        raise ValueError(f"Unknown OCR input mode {mode}")
+    return resample_binary(np.asarray(img.convert('L')), source_dpi, dpi)
+
+def scale_words(words, factor):
+    """
+    This function maps word boxes found on a resampled page back to the coordinates of the page.
+    """
+    if factor != 1 and words is not None:
+        for column in ['left', 'top', 'width', 'height']:
+            words[column] = [int(round(v / factor)) for v in words[column]]
+    return words
+
+def reocr_cached(img, name, output_dir, cache_dir, version, words=False):
+    """
+    This function saves the text of a page improved by reocr_low_confidence from the cache, so reading the volume
+    again does not go back to the text of the usual settings.
+
+    PARAMETERS:
+        img (PIL.Image): The page image before it is prepared for OCR, see prepare_input.
+        name (str): The name of the text file.
+        output_dir (str): The directory the text file is saved to.
+        cache_dir (str): The cache directory (None without a cache).
+        version (str): The Tesseract version.
+        words (bool): Also return the boxes and confidences of the words (default is False).
+
+    Returns:
+        tuple: The cache key, True for a cache hit, and the word columns (None unless words is True), or None if
+               the page was not improved.
+    """
+    if cache_dir is None:
+        return None
+    key = ocr_cache.page_key(img, version, REOCR_SETTINGS)
+    text = ocr_cache.get(cache_dir, key)
+    tsv = ocr_cache.get(cache_dir, key, '.tsv') if words and text is not None else None
+    if text is None or (words and tsv is None):
+        return None
+    with open(os.path.join(output_dir, name), mode='w') as ocrf:
+        ocrf.write(text)
+    return key, True, ocr_words.tsv_to_words(tsv) if words else None
+
+def ocr_page(task):
+    """
+    This function runs OCR on one page with the backend of this process and saves the text, so pages can be 
+    sent to worker processes.
+
+    PARAMETERS:
+        task (tuple): The volume, the text file name, the page as accepted by load_page, the output directory,
+                      the cache directory and Tesseract version (the cache directory is None without a cache),
+                      whether to keep the words, and the input mode, resolution and source resolution, see prepare_input.
+
+    Returns:
+        tuple: The text file name, the cache key (None without a cache), whether the page was a cache hit, and
+               the word columns (None unless words are kept).
+    """
+    volume, name, page, output_dir, cache_dir, version, words, mode, dpi, source_dpi = task
+    page_img = load_page(volume, page)
+    improved = reocr_cached(page_img, name, output_dir, cache_dir, version, words)
+    if improved is not None:
+        return (name, *improved)
+    img, factor = prepare_input(page_img, mode, dpi, source_dpi)
+    key, hit, data = ocr_image(engine, img, name, output_dir, cache_dir, version, words)
+    return name, key, hit, scale_words(data, factor)
+
+def preprocess(img, method):
+    """
+    This function prepares a page image for another OCR attempt.
+
+    PARAMETERS:
+        img (PIL.Image): The page image.
+        method (str): 'none', 'binarize' for an Otsu threshold of the grayscale page, or 'upscale' to double its size.
+
+    Returns:
+        tuple: The prepared image and the factor its size was multiplied by.
+    """
+    import cv2
+    import numpy as np
+    if method == 'none':
+        return img, 1
+    gray = cv2.cvtColor(np.asarray(img.convert('RGB')), cv2.COLOR_RGB2GRAY)
+    if method == 'binarize':
+        _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        return Image.fromarray(binary), 1
+    if method == 'upscale':
+        return Image.fromarray(cv2.resize(gray, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)), 2
+    raise ValueError(f"Unknown preprocessing {method}")
+
+# backends with other page segmentation modes for re-OCR, created on first use in each process
+alternates = {}
+
+def reocr_page(task):
+    """
+    This function tries OCR settings other than the usual ones on a page and keeps the attempt with the highest
+    mean word confidence, so it can be sent to worker processes.
+
+    PARAMETERS:
+        task (tuple): The volume, the text file name, the page as accepted by load_page, the confidence of the 
+                      first OCR, the page segmentation modes and preprocessing methods to try, and the cache
+                      directory and Tesseract version the best attempt is saved under (the cache directory is 
+                      None without a cache).
+
+    Returns:
+        tuple: The text file name and the best attempt as a dict with its psm, preprocessing, confidence, text 
+               and words, or None if no attempt beat the first OCR.
+    """
+    volume, name, page, confidence, psms, methods, cache_dir, version = task
+    img = load_page(volume, page)
+    best = None
+    for method in methods:
+        prepared, factor = preprocess(img, method)
+        for psm in psms:
+            if psm not in alternates:
+                alternates[psm] = BACKENDS[engine.name](psm=psm, tesseract_cmd=getattr(engine, 'tesseract_cmd', None))
+            text, data = alternates[psm].image_to_data(prepared)
+            score = ocr_words.page_confidence(data)
+            if score > (confidence if best is None else best['conf']):
+                #word boxes are kept in the coordinates of the cropped page, rounded as in the first OCR
+                data = scale_words(data, factor)
+                best = {'psm': psm, 'preprocessing': method, 'conf': score, 'text': text, 'words': data}
+    if best is not None and cache_dir is not None:
+        key = ocr_cache.page_key(img, version, REOCR_SETTINGS)
+        ocr_cache.put(cache_dir, key, ocr_words.words_to_tsv(best['words']), '.tsv')
+        ocr_cache.put(cache_dir, key, best['text'])
+    return name, best
+
+def reocr_low_confidence(volume, threshold=70, psms=(6, 4, 11), methods=('none', 'binarize', 'upscale'), dir='cropped', 
+                         virtual=False, jobs=1, backend='auto', cache=True, cache_dir=None):
+    """
+    This function runs OCR again on the pages of a volume whose mean word confidence is below a threshold, trying
+    other page segmentation modes and preprocessing, and keeps any attempt that raises the confidence of the page.
+    Only the low confidence pages are read again, so trying new settings costs a fraction of a full OCR run.
+    The volume must have been read with words=True. The text files and {volume}_words.npz are updated and the 
+    attempts are saved to {volume}_reocr.csv. The improved pages are saved to the OCR cache, so a later 
+    ocr_cropped_volume with the cache keeps them instead of reading the pages the usual way again.
+
+    PARAMETERS:
+        volume (int or str): The volume identifier for the image files.
+        threshold (float): Pages with a mean word confidence below this are read again (default is 70).
+        psms (list): The page segmentation modes to try (default is 6, a single block, 4, a single column, 
+                     and 11, sparse text).
+        methods (list): The preprocessing methods to try, see preprocess (default is all of them).
+        dir (str): The name of the directory containing cropped images (default is 'cropped').
+        virtual (bool): Crop the original images in memory, see ocr_cropped_volume (default is False).
+        jobs (int): The number of worker processes pages are spread across (default is 1).
+        backend (str): The OCR backend, 'tesserocr', 'pytesseract' or 'auto' (default is 'auto').
+        cache (bool): Save the improved pages to the OCR cache (default is True).
+        cache_dir (str): The cache directory (default is None, which uses ocr_cache.CACHE_DIR).
+
+    Returns:
+        DataFrame: One row per page read again with its confidence before and after and the settings kept.
+    """
+    global engine
+    pages = ocr_words.load_words(volume)
+    if len(pages) == 0:
+        print(f"No word file for Volume {volume}, run ocr_cropped_volume with words=True first")
+        return None
+    scores = {name: ocr_words.page_confidence(words) for name, words in pages.items()}
+    content = dict(list_pages(volume, dir, virtual))
+    low = [name for name in sorted(scores) if scores[name] < threshold and name in content]
+    print(f"{len(low)} of {len(pages)} pages of Volume {volume} have a mean word confidence below {threshold}")
+    if len(low) == 0:
+        return None
+
+    #the library loaded here is limited before the workers are forked from this process, they set the limit again 
+    #when they start, so it is only kept while the backend loads 
+    previous = limit_threads() if jobs > 1 else os.environ.get('OMP_THREAD_LIMIT')
+    try:
+        start_backend(backend)
+    finally:
+        restore_threads(previous)
+    tesseract_version = engine.version()
+    backend, tesseract_cmd = engine.name, getattr(engine, 'tesseract_cmd', None)
+    if jobs > 1:
+        engine.close()
+        engine = None
+    if cache and cache_dir is None:
+        cache_dir = ocr_cache.CACHE_DIR
+
+    from parallel import map_pages
+    output_dir = os.path.join(os.getcwd(), "images", str(volume), "text")
+    tasks = [(volume, name, content[name], scores[name], list(psms), list(methods), cache_dir if cache else None, tesseract_version)
+             for name in low]
+    rows = []
+    for i, (name, best) in enumerate(map_pages(reocr_page, tasks, jobs, start_backend, (backend, tesseract_cmd, True)), start=1):
+        row = {'filename': name, 'conf_before': scores[name], 'conf_after': scores[name], 'psm': None, 'preprocessing': None}
+        if best is not None:
+            with open(os.path.join(output_dir, name), mode='w') as ocrf:
+                ocrf.write(best['text'])
+            pages[name] = best['words']
+            row.update(conf_after=best['conf'], psm=best['psm'], preprocessing=best['preprocessing'])
+        print(f"Processed {name.replace('.txt', '')}: {row['conf_before']:.1f} -> {row['conf_after']:.1f} ({i}/{len(tasks)})")
+        rows.append(row)
+
+    ocr_words.save_words(volume, pages)
+    df = pd.DataFrame(rows)
+    df.to_csv(os.path.join(os.getcwd(), "images", str(volume), f"{volume}_reocr.csv"), index=False)
+    print(f"Improved {int((df['conf_after'] > df['conf_before']).sum())} of {len(df)} pages")
+    return df
+
+def ocr_cropped_volume(volume, dir='cropped', virtual=False, jobs=1, backend='auto', cache=True, cache_dir=None, max_cache_mb=None, words=False,
+                       input_mode='color', dpi=300, source_dpi=SOURCE_DPI, only=None):
+    """
+    This function performs OCR on cropped images in a specified directory and saves the text output to files.
+
+    PARAMETERS:
+        volume (int or str): The volume identifier for the image files.
+        dir (str): The name of the directory containing cropped images (default is 'cropped').
+        virtual (bool): Crop the original images in memory with the boxes in the contour report, for 
+                        volumes cropped with write_crops=False (default is False).
+        jobs (int): The number of worker processes pages are spread across (default is 1). Each worker runs
+                    Tesseract with a single thread; with one job Tesseract uses its own threading.
+        backend (str): The OCR backend, 'tesserocr', 'pytesseract' or 'auto' (default is 'auto'), see start_backend.
+        cache (bool): Serve unchanged pages from the OCR cache and save new results to it (default is True).
+        cache_dir (str): The cache directory (default is None, which uses ocr_cache.CACHE_DIR).
+        max_cache_mb (float): The size cap of the cache, the least recently used entries are removed after the run
+                              (default is None, which uses ocr_cache.MAX_CACHE_MB).
+        words (bool): Also save the box and confidence of every word to {volume}_words.npz, see ocr_words and 
+                      reocr_low_confidence (default is False).
+        input_mode (str): 'color' to send the pages as they are, or 'binary' for single channel binarized pages 
+                          resampled to dpi, see prepare_input (default is 'color').
+        dpi (int): The resolution of 'binary' pages (default is 300).
+        source_dpi (int): The resolution the volume was scanned at (default is SOURCE_DPI).
+        only (list): Only OCR the pages with these text file names (default is None, every page).
+
+    Returns:
+        list: (text file name, cache key, cache hit) for each page read, or None if there was nothing to read.
+
+    Raises:
+        EnvironmentError: If the pytesseract backend is used and the Tesseract binary is not found.
+    """
+    # Load the backend here to report its version, with several jobs the workers load their own
+    global engine
+    #the library loaded here is limited before the workers are forked from this process, they set the limit again 
+    #when they start, so it is only kept while the backend loads 
+    previous = limit_threads() if jobs > 1 else os.environ.get('OMP_THREAD_LIMIT')
+    try:
+        start_backend(backend)
+    finally:
+        restore_threads(previous)
+    tesseract_version = engine.version()
+    backend, tesseract_cmd = engine.name, getattr(engine, 'tesseract_cmd', None)
+    if jobs > 1:
+        engine.close()
+        engine = None
     cwd = os.getcwd()
     cropped = os.path.join(cwd, "images", volume, dir) #cropped = f"{cwd}/images/{volume}/{dir}/" 
+    if virtual:
+        cropped = os.path.join(cwd, "images", volume, f"{volume}_contourreport.csv")
 
     print(f"Processing cropped images in: {cropped}")
     
     if not os.path.exists(cropped):
         print(f"Directory not found: {cropped}")
         return
-    content = [x for x in os.listdir(cropped) if '_crop.jpg' in x]
-    content.sort()
+    content = list_pages(volume, dir, virtual)
+    if only is not None:
+        only = set(only)
+        content = [(name, page) for name, page in content if name in only]
 
     if len(content) > 0:
         output_dir = f"{cwd}/images/{volume}/text/"
         if not os.path.exists(output_dir):
             os.makedirs(output_dir, exist_ok=True)
 
-        print(f"Starting OCR Batch for Volume {volume} with Tesseract {tesseract_version}")
-        for filename in content:
-            file = os.path.join(cropped, filename)
-            name = filename.replace('_crop.jpg', '.txt')
-            target = os.path.join(output_dir, name)
-            print(f"Processing {filename}...")
-
-            img = Image.open(file)
-            text = pytesseract.image_to_string(img)
-
-            with open(target, mode='w') as ocrf:
-                ocrf.write(text)
+        from parallel import map_pages
+        print(f"Starting OCR Batch for Volume {volume} with Tesseract {tesseract_version} through {backend} ({jobs} jobs)")
+        start = time.time()
+        if cache and cache_dir is None:
+            cache_dir = ocr_cache.CACHE_DIR
+        tasks = [(volume, name, page, output_dir, cache_dir if cache else None, tesseract_version, words, input_mode, dpi, source_dpi)
+                 for name, page in content]
+        initargs = (backend, tesseract_cmd, True)
+        results = []
+        pages = {}
+        for i, (name, key, hit, data) in enumerate(map_pages(ocr_page, tasks, jobs, start_backend, initargs), start=1):
+            print(f"Processed {name.replace('.txt', '')}{' (cached)' if hit else ''} ({i}/{len(tasks)})")
+            results.append((name, key, hit))
+            if words:
+                pages[name] = data
 
-        print(f"Finished OCR for Volume {volume}")
+        print(f"Finished OCR for Volume {volume} in {time.time() - start:.1f}s")
+        if words:
+            if only is not None:
+                #the pages not read again keep their words 
+                pages = {**ocr_words.load_words(volume), **pages}
+            print(f"Saving words to: {ocr_words.save_words(volume, pages)}")
+        if cache:
+            ocr_cache.cache_report(volume, results)
+            ocr_cache.prune(cache_dir, max_cache_mb or ocr_cache.MAX_CACHE_MB)
+        return results
     else:
         print(f"No cropped images found in {cropped}")
 
 if __name__ == "__main__":
-    get_tesseract_version()
     volume = input("Enter the volume number: ")
     ocr_cropped_volume(volume)
     
@@ -0,0 +1,128 @@
+import hashlib
+import os
+import tempfile
+import pandas as pd
+
+# the cache can be moved to a shared scratch volume by setting OCR_CACHE_DIR
+CACHE_DIR = os.environ.get('OCR_CACHE_DIR', os.path.join(os.getcwd(), "ocr_cache"))
+MAX_CACHE_MB = 20000
+
+def page_key(img, version, settings):
+    """
+    This function computes the cache key of a page: a hash of its pixels together with the Tesseract version
+    and the OCR settings, so a page is only served from the cache if OCR would read the same image the same way.
+
+    PARAMETERS:
+        img (PIL.Image): The page image as it is sent to OCR.
+        version (str): The Tesseract version.
+        settings (str): The OCR backend and its settings.
+
+    Returns:
+        str: The hex SHA-256 key.
+    """
+    h = hashlib.sha256()
+    h.update(f"{img.mode} {img.size} {version} {settings}\n".encode('utf-8'))
+    h.update(img.tobytes())
+    return h.hexdigest()
+
+def entry_path(cache_dir, key, ext='.txt'):
+    """
+    This function returns the file of a cache entry, '.txt' for the text of a page and '.tsv' for its words. 
+    Entries are spread over 256 directories named after the first two characters of the key, so no directory 
+    holds too many files.
+    """
+    return os.path.join(cache_dir, key[:2], f"{key}{ext}")
+
+def get(cache_dir, key, ext='.txt'):
+    """
+    This function reads the text of a page from the cache. A hit touches the entry, so prune removes the entries
+    that were used least recently first.
+
+    PARAMETERS:
+        cache_dir (str): The cache directory.
+        key (str): The key from page_key.
+        ext (str): The kind of entry, see entry_path (default is '.txt').
+
+    Returns:
+        str: The cached text, or None if the page is not in the cache.
+    """
+    path = entry_path(cache_dir, key, ext)
+    try:
+        with open(path, encoding='utf-8') as f:
+            text = f.read()
+        os.utime(path)
+        return text
+    except (FileNotFoundError, UnicodeDecodeError):
+        return None
+
+def put(cache_dir, key, text, ext='.txt'):
+    """
+    This function saves the text of a page to the cache. The entry is written to a temporary file and renamed,
+    so other processes sharing the cache never read a partial entry.
+
+    PARAMETERS:
+        cache_dir (str): The cache directory.
+        key (str): The key from page_key.
+        text (str): The OCR text.
+        ext (str): The kind of entry, see entry_path (default is '.txt').
+    """
+    path = entry_path(cache_dir, key, ext)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+def prune(cache_dir, max_mb=MAX_CACHE_MB):
+    """
+    This function keeps the cache under a size cap by removing the least recently used entries.
+
+    PARAMETERS:
+        cache_dir (str): The cache directory.
+        max_mb (float): The largest size of the cache in megabytes (default is MAX_CACHE_MB).
+
+    Returns:
+        tuple: The number of entries removed and the number of bytes freed.
+    """
+    entries = []
+    for root, _, files in os.walk(cache_dir):
+        for filename in files:
+            if filename.endswith(('.txt', '.tsv')):
+                try:
+                    stat = os.stat(os.path.join(root, filename))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, os.path.join(root, filename)))
+    total = sum(size for _, size, _ in entries)
+    limit = max_mb * 2**20
+    removed, freed = 0, 0
+    for _, size, path in sorted(entries):
+        if total - freed <= limit:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        removed += 1
+        freed += size
+    if removed > 0:
+        print(f"Pruned {removed} OCR cache entries ({freed / 2**20:.1f} MB) from {cache_dir}")
+    return removed, freed
+
+def cache_report(volume, results):
+    """
+    This function reports the cache hits and misses of an OCR run and saves them to {volume}_ocrcache.csv.
+
+    PARAMETERS:
+        volume (int or str): The volume identifier for the image files.
+        results (list): (text file name, key, hit) tuples, one per page.
+
+    Returns:
+        DataFrame: One row per page with its key and whether it was served from the cache.
+    """
+    df = pd.DataFrame(results, columns=['filename', 'key', 'hit'])
+    hits = int(df['hit'].sum())
+    print(f"OCR cache for Volume {volume}: {hits} hits, {len(df) - hits} misses")
+    csv_path = os.path.join(os.getcwd(), "images", str(volume), f"{volume}_ocrcache.csv")
+    df.to_csv(csv_path, index=False)
+    return df
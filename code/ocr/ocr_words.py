@@ -0,0 +1,151 @@
+import os
+import numpy as np
+import pandas as pd
+
+# the columns kept for every word, line counts the text lines of the page from 0
+WORD_COLUMNS = ['line', 'left', 'top', 'width', 'height', 'conf', 'text']
+INT_COLUMNS = ['line', 'left', 'top', 'width', 'height']
+
+def empty_words():
+    """
+    This function returns the word columns of a page without any words.
+    """
+    return {column: [] for column in WORD_COLUMNS}
+
+def parse_tesseract_tsv(tsv):
+    """
+    This function reads the words from Tesseract's TSV output. Only word rows are kept and the block, paragraph
+    and line numbers are replaced by one line number counted over the page.
+
+    PARAMETERS:
+        tsv (str): The TSV output of Tesseract.
+
+    Returns:
+        dict: The word columns, see WORD_COLUMNS.
+    """
+    words = empty_words()
+    lines = {}
+    for row in tsv.splitlines()[1:]:
+        fields = row.split('\t')
+        if len(fields) < 11 or fields[0] != '5':
+            continue
+        text = fields[11] if len(fields) > 11 else ''
+        line = lines.setdefault(tuple(fields[1:5]), len(lines))
+        words['line'].append(line)
+        for column, value in zip(INT_COLUMNS[1:], fields[6:10]):
+            words[column].append(int(value))
+        words['conf'].append(float(fields[10]))
+        words['text'].append(text)
+    return words
+
+def words_to_tsv(words):
+    """
+    This function writes the word columns of a page as TSV text, the form they are kept in the OCR cache.
+    """
+    rows = ['\t'.join(WORD_COLUMNS)]
+    for values in zip(*(words[column] for column in WORD_COLUMNS)):
+        rows.append('\t'.join(str(value) for value in values))
+    return '\n'.join(rows) + '\n'
+
+def tsv_to_words(tsv):
+    """
+    This function reads the word columns of a page written by words_to_tsv.
+    """
+    words = empty_words()
+    for row in tsv.splitlines()[1:]:
+        fields = row.split('\t', len(WORD_COLUMNS) - 1)
+        for column, value in zip(INT_COLUMNS, fields):
+            words[column].append(int(value))
+        words['conf'].append(float(fields[5]))
+        words['text'].append(fields[6] if len(fields) > 6 else '')
+    return words
+
+def page_confidence(words):
+    """
+    This function scores the OCR of a page with the mean confidence of its words. Empty words, and words that
+    Tesseract gives a negative confidence, are left out.
+
+    PARAMETERS:
+        words (dict): The word columns of the page.
+
+    Returns:
+        float: The mean confidence from 0 to 100, or NaN for a page without words.
+    """
+    conf = [c for c, text in zip(words['conf'], words['text']) if c >= 0 and text.strip()]
+    return float(np.mean(conf)) if conf else float('nan')
+
+def words_path(volume):
+    """
+    This function returns the path of the word file of a volume.
+    """
+    return os.path.join(os.getcwd(), "images", str(volume), f"{volume}_words.npz")
+
+def save_words(volume, pages):
+    """
+    This function saves the words of every page of a volume to {volume}_words.npz. Each column is one array over
+    all the words of the volume, with the page of each word as an index into the page names, and the text as
+    one UTF-8 buffer with the offset of each word. The file is replaced in one step.
+
+    PARAMETERS:
+        volume (int or str): The volume identifier for the image files.
+        pages (dict): The word columns of each page, keyed by text file name.
+
+    Returns:
+        str: The path of the word file.
+    """
+    names = sorted(pages)
+    counts = [len(pages[name]['text']) for name in names]
+    columns = {'names': np.array(names, dtype=str), 'page': np.repeat(np.arange(len(names), dtype=np.int32), counts)}
+    for column in INT_COLUMNS:
+        columns[column] = np.array([v for name in names for v in pages[name][column]], dtype=np.int32)
+    columns['conf'] = np.array([v for name in names for v in pages[name]['conf']], dtype=np.float32)
+    encoded = [text.encode('utf-8') for name in names for text in pages[name]['text']]
+    columns['text'] = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    columns['text_offsets'] = np.concatenate([[0], np.cumsum([len(text) for text in encoded], dtype=np.int64)])
+
+    path = words_path(volume)
+    with open(f"{path}.tmp", 'wb') as f:
+        np.savez_compressed(f, **columns)
+    os.replace(f"{path}.tmp", path)
+    return path
+
+def load_words(volume):
+    """
+    This function reads the word file of a volume.
+
+    PARAMETERS:
+        volume (int or str): The volume identifier for the image files.
+
+    Returns:
+        dict: The word columns of each page, keyed by text file name. Empty if the volume has no word file.
+    """
+    path = words_path(volume)
+    if not os.path.exists(path):
+        return {}
+    with np.load(path) as data:
+        columns = {key: data[key] for key in data.files}
+    text = columns['text'].tobytes()
+    offsets = columns['text_offsets']
+    pages = {name: empty_words() for name in columns['names']}
+    bounds = np.searchsorted(columns['page'], np.arange(len(columns['names']) + 1))
+    for i, name in enumerate(columns['names']):
+        start, stop = bounds[i], bounds[i + 1]
+        for column in INT_COLUMNS + ['conf']:
+            pages[name][column] = columns[column][start:stop].tolist()
+        pages[name]['text'] = [text[offsets[j]:offsets[j + 1]].decode('utf-8') for j in range(start, stop)]
+    return pages
+
+def word_table(volume):
+    """
+    This function reads the word file of a volume as a table, for example to look for pages or lines that OCR
+    read badly.
+
+    PARAMETERS:
+        volume (int or str): The volume identifier for the image files.
+
+    Returns:
+        DataFrame: One row per word with its page and the columns in WORD_COLUMNS.
+    """
+    frames = [pd.DataFrame(dict(words, page=name), columns=['page'] + WORD_COLUMNS)
+              for name, words in load_words(volume).items()]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=['page'] + WORD_COLUMNS)
@@ -0,0 +1,23 @@
+import multiprocessing
+
+def map_pages(func, tasks, jobs=1, initializer=None, initargs=()):
+    """
+    This function applies a per-page function to a list of tasks, in a pool of worker processes when 
+    jobs is greater than one. Results are yielded in the same order as the tasks.
+
+    Parameters:
+    func (function): A module level function taking a single task.
+    tasks (list): The tasks to process.
+    jobs (int, optional): The number of worker processes. Default is 1, which processes tasks in this process.
+    initializer (function, optional): A module level function run once in each worker process before its first task.
+    initargs (tuple, optional): The arguments passed to initializer.
+
+    Returns:
+    generator: The result of func for each task, in task order.
+    """
+    if jobs > 1:
+        with multiprocessing.Pool(jobs, initializer, initargs) as pool:
+            yield from pool.imap(func, tasks)
+    else:
+        for task in tasks:
+            yield func(task)
@@ -0,0 +1,162 @@
+import csv
+import json
+import os
+
+# a store is two files next to each other: <store>.jsonl holds the phrases of each law as one JSON list per line,
+# <store>.idx is a CSV index with the offset and length of each line, so the phrases of a law are read with one seek.
+# Both files are only appended to, a law that is saved again is indexed at its new offset and the old line is
+# left until the store is compacted
+INDEX_FIELDS = ['volume', 'lawnumber', 'offset', 'length', 'phrases']
+EXPLODED_STORE = f"{os.getcwd()}/data/exploded"
+FLAGGED_STORE = f"{os.getcwd()}/flagged/flagged"
+
+indexes = {}
+
+def law_key(volume, lawnumber):
+    """
+    This function returns the key a law is indexed under, so "12" and 12 find the same law.
+    """
+    lawnumber = str(lawnumber).strip()
+    return str(volume), str(int(lawnumber)) if lawnumber.isdigit() else lawnumber
+
+def save_phrases(store, laws):
+    """
+    This function appends the phrases of some laws to a store.
+
+    PARAMETERS:
+        store (str): The path of the store without an extension, e.g. EXPLODED_STORE.
+        laws (iterable): (volume, law number, phrases) for each law, phrases being a list of strings.
+
+    RETURNS:
+        int: The number of laws saved.
+    """
+    os.makedirs(os.path.dirname(store), exist_ok=True)
+    new_index = not os.path.exists(f"{store}.idx")
+    saved = 0
+    with open(f"{store}.jsonl", 'ab') as data, open(f"{store}.idx", 'a', newline='', encoding='utf-8') as index:
+        writer = csv.writer(index, lineterminator='\n')
+        if new_index:
+            writer.writerow(INDEX_FIELDS)
+        offset = data.seek(0, os.SEEK_END)
+        for volume, lawnumber, phrases in laws:
+            line = (json.dumps(list(phrases), ensure_ascii=False) + '\n').encode('utf-8')
+            data.write(line)
+            writer.writerow([*law_key(volume, lawnumber), offset, len(line), len(phrases)])
+            offset += len(line)
+            saved += 1
+    return saved
+
+def replace_phrases(store, laws):
+    """
+    This function writes a new store holding only the phrases of some laws, and replaces the old store with it
+    in one step, so laws saved by earlier runs are dropped.
+
+    PARAMETERS:
+        store (str): The path of the store without an extension.
+        laws (iterable): (volume, law number, phrases) for each law, see save_phrases. It may read the old store.
+
+    RETURNS:
+        int: The number of laws saved.
+    """
+    for ext in ('.jsonl', '.idx'):
+        if os.path.exists(f"{store}.tmp{ext}"):
+            os.remove(f"{store}.tmp{ext}")
+    saved = save_phrases(f"{store}.tmp", laws)
+    os.replace(f"{store}.tmp.jsonl", f"{store}.jsonl")
+    os.replace(f"{store}.tmp.idx", f"{store}.idx")
+    return saved
+
+def read_index(store):
+    """
+    This function reads the index of a store. The index is kept in memory until the store changes.
+
+    PARAMETERS:
+        store (str): The path of the store without an extension.
+
+    RETURNS:
+        dict: (offset, length) of the latest phrases of each law, keyed by law_key.
+    """
+    path = f"{store}.idx"
+    if not os.path.exists(path):
+        return {}
+    stat = os.stat(path)
+    cached = indexes.get(path)
+    if cached is not None and cached[0] == (stat.st_size, stat.st_mtime_ns):
+        return cached[1]
+    index = {}
+    with open(path, newline='', encoding='utf-8') as file:
+        for row in csv.DictReader(file):
+            index[(row['volume'], row['lawnumber'])] = (int(row['offset']), int(row['length']))
+    indexes[path] = ((stat.st_size, stat.st_mtime_ns), index)
+    return index
+
+def load_phrases(store, volume, lawnumber):
+    """
+    This function reads the phrases of one law from a store.
+
+    PARAMETERS:
+        store (str): The path of the store without an extension.
+        volume (str): The volume of the law.
+        lawnumber (int or str): The law number (chapter).
+
+    RETURNS:
+        list: The phrases of the law, or None if the law is not in the store.
+    """
+    entry = read_index(store).get(law_key(volume, lawnumber))
+    if entry is None:
+        return None
+    offset, length = entry
+    with open(f"{store}.jsonl", 'rb') as data:
+        data.seek(offset)
+        return json.loads(data.read(length).decode('utf-8'))
+
+def iter_phrases(store):
+    """
+    This function reads the latest phrases of every law in a store, in the order the laws were first saved.
+
+    RETURNS:
+        generator: (volume, law number, phrases) for each law.
+    """
+    index = read_index(store)
+    with open(f"{store}.jsonl", 'rb') as data:
+        for (volume, lawnumber), (offset, length) in index.items():
+            data.seek(offset)
+            yield volume, lawnumber, json.loads(data.read(length).decode('utf-8'))
+
+def compact(store):
+    """
+    This function rewrites a store with only the latest phrases of each law, freeing the space of laws that were
+    saved again. The store is replaced in one step.
+
+    RETURNS:
+        tuple: The number of laws kept and the number of bytes freed.
+    """
+    before = os.path.getsize(f"{store}.jsonl")
+    laws = replace_phrases(store, iter_phrases(store))
+    return laws, before - os.path.getsize(f"{store}.jsonl")
+
+def export_csv(store, path_format, column, lineterminator='\r\n'):
+    """
+    This function writes the phrases of every law in a store to one CSV file per law, the layout the phrases
+    were kept in before the store.
+
+    PARAMETERS:
+        store (str): The path of the store without an extension.
+        path_format (str): The path of each file, with {volume} and {lawnumber} fields.
+        column (str): The header of the phrase column.
+        lineterminator (str): The line ending of the files (default is CRLF, the csv module default).
+
+    RETURNS:
+        int: The number of files written.
+    """
+    written = 0
+    for volume, lawnumber, phrases in iter_phrases(store):
+        path = path_format.format(volume=volume, lawnumber=lawnumber)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file, lineterminator=lineterminator)
+            writer.writerow([column])
+            for phrase in phrases:
+                writer.writerow([phrase])
+        written += 1
+    return written
@@ -1,8 +1,21 @@
+import collections
 import csv
+import hashlib
+import itertools
+import json
 import os
 import nltk
 import pandas as pd
 
+import corpus
+import normalize
+import phrases
+from parallel import map_pages
+
+# abbreviations that end in a period inside a sentence of a statute, e.g. "Chap. 12" or "Code of Va., sec. 4"
+ABBREVIATIONS = ['chap', 'ch', 'sec', 'secs', 'subsec', 'va', 'art', 'cl', 'par', 'vol', 'pp']
+PUNKT_MODEL = f"{os.getcwd()}/data/punkt_statutes.json"
+
 
 
 def get_text():
@@ -42,69 +55,331 @@ def last8(x):
     return int(x[start:end])
 
 
-def tokenize_corpus():
+def volume_laws(volume):
+    """
+    This function reads the laws of a volume in law number order, from the corpus if its partition is up to date
+    with the law files and from the law files otherwise, see corpus.partition_current.
+
+    Parameter:
+        volume (str): The volume identifier.
+
+    Returns:
+        generator: (filename, law number, text) for each law.
+    """
+    if corpus.partition_current(volume):
+        for df in corpus.iter_corpus([volume], ['filename', 'lawnumber', 'lawtext']):
+            yield from zip(df['filename'], df['lawnumber'].tolist(), df['lawtext'])
+    else:
+        for filename, lawnumber, path in corpus.law_files(volume):
+            with open(path, 'r') as file:
+                yield filename, lawnumber, file.read()
+
+def statute_volumes():
+    """
+    This function lists the volumes that have laws, in the corpus or in law files.
+    """
+    return sorted(set(corpus.law_volumes()) | set(corpus.corpus_volumes()))
+
+def train_punkt(volumes=None, path=PUNKT_MODEL):
+    """
+    This function trains a Punkt sentence model on the statute corpus and adds the legal abbreviations in 
+    ABBREVIATIONS, then saves its parameters as JSON so the corpus only has to be read for training once.
+
+    Parameters:
+        volumes (list): The volumes to train on (default is None, every volume).
+        path (str): The model file (default is PUNKT_MODEL).
+
+    Returns:
+        PunktParameters: The trained parameters.
+    """
+    trainer = nltk.tokenize.punkt.PunktTrainer()
+    for volume in volumes or statute_volumes():
+        for _, _, text in volume_laws(volume):
+            trainer.train(normalize.normalized(text), finalize=False)
+    trainer.finalize_training()
+    params = trainer.get_params()
+    params.abbrev_types.update(ABBREVIATIONS)
+
+    model = punkt_model(params)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.tmp", 'w', encoding='utf-8') as file:
+        json.dump(model, file)
+    os.replace(f"{path}.tmp", path)
+    print(f"Trained sentence model with {len(params.abbrev_types)} abbreviations")
+    return params
+
+def load_punkt(path=PUNKT_MODEL, train=True):
+    """
+    This function loads the Punkt sentence model, training it first if it has not been saved.
+
+    Parameters:
+        path (str): The model file (default is PUNKT_MODEL).
+        train (bool): Train the model on the corpus if the file does not exist (default is True). Otherwise 
+                      an untrained model with only the legal abbreviations is used.
+
+    Returns:
+        PunktParameters: The model parameters.
+    """
+    if not os.path.exists(path):
+        if train:
+            return train_punkt(path=path)
+        params = nltk.tokenize.punkt.PunktParameters()
+        params.abbrev_types.update(ABBREVIATIONS)
+        return params
+    with open(path, encoding='utf-8') as file:
+        model = json.load(file)
+    params = nltk.tokenize.punkt.PunktParameters()
+    params.abbrev_types = set(model['abbrev_types'])
+    params.collocations = {tuple(pair) for pair in model['collocations']}
+    params.sent_starters = set(model['sent_starters'])
+    for word, context in model['ortho_context'].items():
+        params.ortho_context[word] = context
+    return params
+
+def punkt_model(params):
+    """
+    This function returns the Punkt parameters as plain lists and dicts, the form they are saved in. Words 
+    without an orthographic context are left out, tokenizing adds them to the parameters as it looks them up.
+    """
+    return {'abbrev_types': sorted(params.abbrev_types),
+            'collocations': sorted(params.collocations),
+            'sent_starters': sorted(params.sent_starters),
+            'ortho_context': {word: context for word, context in sorted(params.ortho_context.items()) if context}}
+
+def model_hash(params):
+    """
+    This function hashes the Punkt parameters and the version of the text normalization, so sentences split 
+    with another model or from differently normalized text are split again.
+    """
+    model = dict(punkt_model(params), normalize=normalize.NORMALIZE_VERSION)
+    return hashlib.sha1(json.dumps(model).encode('utf-8')).hexdigest()
+
+def law_hash(text):
+    """
+    This function hashes the text of a law, so a law is only split again when its text changes.
+    """
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+def sentence_id(volume, lawnumber, occurrence, sentence):
+    """
+    This function derives the id of a sentence from its content, so it does not change when other sentences 
+    or laws do. Repeats of the same sentence in a law are told apart by their occurrence.
+
+    Parameters:
+        volume (str): The volume of the law.
+        lawnumber (int): The law number.
+        occurrence (int): The number of times the same sentence came earlier in the law.
+        sentence (str): The sentence.
+
+    Returns:
+        int: A positive 63 bit id.
+    """
+    digest = hashlib.sha1(f"{volume}|{lawnumber}|{occurrence}|{sentence}".encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') >> 1
+
+tokenizer = None
+
+def start_tokenizer(params):
+    """
+    This function builds the sentence tokenizer of a worker process once, before it splits its first volume.
+    """
+    global tokenizer
+    tokenizer = nltk.tokenize.PunktSentenceTokenizer(params)
+
+def tokenize_volume(task):
+    """
+    This function splits the laws of a volume into sentences with the tokenizer from start_tokenizer.
+
+    Parameter:
+        task (tuple): The volume identifier and the hashes of the laws already split, keyed by filename. Laws 
+                      whose text still has the same hash are not split again.
+
+    Returns:
+        list: (filename, law number, hash, rows) for each law, in law order. rows holds [filename, volume,
+              law number, SID, sentence] for each sentence, or None if the law was not split again.
+    """
+    volume, known = task
+    laws = []
+    for filename, lawnumber, text in volume_laws(volume):
+        digest = law_hash(text)
+        if known.get(filename) == digest:
+            laws.append((filename, lawnumber, digest, None))
+            continue
+        occurrences = collections.Counter()
+        rows = []
+        for sentence in tokenizer.sentences_from_text(normalize.normalized(text)):
+            rows.append([filename, volume, lawnumber, sentence_id(volume, lawnumber, occurrences[sentence], sentence), sentence])
+            occurrences[sentence] += 1
+        laws.append((filename, lawnumber, digest, rows))
+    return laws
+
+def read_sentences(path):
+    """
+    This function reads a sentence file written by tokenize_corpus one volume at a time.
+
+    Parameters:
+        path (str): The sentence CSV file.
+
+    Returns:
+        generator: (volume, rows) for each volume in file order, where rows holds the [filename, volume, 
+                   law number, SID, sentence] rows of each law, keyed by filename.
+    """
+    with open(path, newline='', encoding='utf-8') as file:
+        reader = csv.reader(file)
+        next(reader)
+        for volume, rows in itertools.groupby((row[1:] for row in reader), key=lambda row: row[1]):
+            laws = {}
+            for row in rows:
+                laws.setdefault(row[0], []).append(row)
+            yield volume, laws
+
+def tokenize_corpus(volumes=None, jobs=1, params=None, output=None, incremental=False):
     """    
-    This function scans directories of law text files, tokenizes their content into sentences using NLTK's
-    PunktSentenceTokenizer, and compiles the results into a pandas DataFrame which is then saved as a CSV file.
+    This function splits the laws of every volume into sentences with one Punkt model trained on the statutes,
+    see load_punkt, and saves them to a CSV file. Volumes are split in a pool of worker processes and their 
+    sentences are written as each volume is done, in volume order. Sentence ids are derived from the sentences,
+    see sentence_id, so they do not depend on the number of workers or on changes to other laws.
+
+    The hash of every law is saved next to the sentences in <output>_laws.csv. In incremental mode only the laws
+    whose text changed since then are split again, the sentences of the other laws are copied from the previous
+    file, and the ids of sentences added and removed are saved to <output>_changes.csv, so only those have to be
+    classified again. Everything is split again if the sentence model changed.
+
+    Parameters:
+        volumes (list): The volumes to split (default is None, every volume). In incremental mode the other
+                        volumes are kept as they are.
+        jobs (int): The number of worker processes (default is 1, which splits the volumes in this process).
+        params (PunktParameters): The sentence model (default is None, load_punkt()).
+        output (str): The CSV file (default is data/corpus_sentences.csv).
+        incremental (bool): Only split the laws that changed (default is False).
+
+    Returns:
+        int: The number of sentences.
     """
-    #get path to directory containing law volumes
-    volumes = f"{os.getcwd()}/images/"
-    volumes = [file for file in os.listdir(volumes) if os.path.isdir(os.path.join(volumes, file))]
-    #volumes  = ['1875-76', '1962', '1965es']
+    selected = sorted(str(volume) for volume in volumes) if volumes else statute_volumes()
+    params = params or load_punkt()
+    model = model_hash(params)
+    output = output or f"{os.getcwd()}/data/corpus_sentences.csv"
+    base = os.path.splitext(output)[0]
+
+    #the laws split before, and the sentences of every volume in the previous file
+    known = {}
+    manifest = pd.DataFrame(columns=['filename', 'volume', 'lawnumber', 'sha1', 'sentences', 'model'])
+    if incremental and os.path.exists(output) and os.path.exists(f"{base}_laws.csv"):
+        manifest = pd.read_csv(f"{base}_laws.csv", dtype={'volume': str, 'sha1': str, 'model': str})
+        for row in manifest[manifest['model'] == model].itertuples():
+            known.setdefault(row.volume, {})[row.filename] = row.sha1
+        previous = read_sentences(output)
+    else:
+        incremental = False
+        previous = iter(())
+
     sid = 0
-    corpus_sentences = []
-    for volume in sorted(volumes):
-        laws_dir = f"{os.getcwd()}/images/{volume}/laws"
-        files = os.listdir(laws_dir)
-        filtered = [item for item in files if not item.startswith('preceedingmaterials')]
-        for filename in sorted(filtered, key=last8):
-            if not filename.startswith("preceeding"):
-                start = filename.index("law") + len("law")
-                end = filename.index(".", start)
-                lawnumber = int(filename[start:end])
-                file_url = f"{laws_dir}/{filename}"
-
-                if os.path.exists(file_url):
-                    with open(file_url, 'r') as file:
-                        text = file.read()
-                        text = text.replace('\n', ' ')
-                        tokenizer = nltk.tokenize.PunktSentenceTokenizer()
-                        sentences = tokenizer.sentences_from_text(text)
-                        for sentence in sentences:
+    laws = []
+    changes = []
+    old_volume, old_laws = next(previous, (None, {}))
+    tasks = [(volume, known.get(volume, {})) for volume in selected]
+    if jobs <= 1:
+        start_tokenizer(params)
+    results = zip(selected, map_pages(tokenize_volume, tasks, jobs, start_tokenizer, (params,)))
+    with open(f"{output}.tmp", 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file, lineterminator='\n')
+        writer.writerow(['', 'Filename', 'Volume', 'Law Number', 'SID', 'Sentence'])
+        for volume, split in itertools.chain(results, [(None, None)]):
+            #volumes of the previous file before this one were not split this time
+            while old_volume is not None and (volume is None or old_volume < volume):
+                keep = volumes is not None
+                for filename, rows in old_laws.items():
+                    if keep:
+                        for row in rows:
+                            writer.writerow([sid] + row)
                             sid += 1
-                            data = [filename, volume, lawnumber, sid, sentence]
-                            corpus_sentences.append(data)
-    laws_data = pd.DataFrame(corpus_sentences, columns=['Filename', 'Volume', 'Law Number', 'SID', 'Sentence'])
-    laws_data.to_csv(f"{os.getcwd()}/data/corpus_sentences.csv")
+                    else:
+                        changes += [[row[3], filename, old_volume, row[2], 'removed'] for row in rows]
+                if keep:
+                    laws += manifest[manifest['volume'] == old_volume].values.tolist()
+                old_volume, old_laws = next(previous, (None, {}))
+            if volume is None:
+                break
+            if old_volume == volume:
+                split_before = old_laws
+                old_volume, old_laws = next(previous, (None, {}))
+            else:
+                split_before = {}
 
+            written = 0
+            for filename, lawnumber, digest, rows in split:
+                before = split_before.pop(filename, [])
+                if rows is None:
+                    rows = before
+                elif incremental:
+                    old_ids = {row[3] for row in before}
+                    new_ids = {str(row[3]) for row in rows}
+                    changes += [[row[3], filename, volume, lawnumber, 'removed'] for row in before if row[3] not in new_ids]
+                    changes += [[row[3], filename, volume, lawnumber, 'added'] for row in rows if str(row[3]) not in old_ids]
+                for row in rows:
+                    writer.writerow([sid] + row)
+                    sid += 1
+                written += len(rows)
+                laws.append([filename, volume, lawnumber, digest, len(rows), model])
+            #laws that are no longer in the volume
+            for filename, rows in split_before.items():
+                changes += [[row[3], filename, volume, row[2], 'removed'] for row in rows]
+            print(f"Split Volume {volume}: {written} sentences")
+    os.replace(f"{output}.tmp", output)
 
+    laws = pd.DataFrame(laws, columns=manifest.columns)
+    laws.to_csv(f"{base}_laws.csv.tmp", index=False)
+    os.replace(f"{base}_laws.csv.tmp", f"{base}_laws.csv")
+    if incremental:
+        changes = pd.DataFrame(changes, columns=['SID', 'Filename', 'Volume', 'Law Number', 'Change'])
+        changes.to_csv(f"{base}_changes.csv", index=False)
+        print(f"{(changes['Change'] == 'added').sum()} sentences added and {(changes['Change'] == 'removed').sum()} removed")
+    return sid
 
-def iterator():
-    """
-    This function reads the identified laws and checks if their corresponding text files exist. It splits the text
-    of each law into sentences, saving the results into individual CSV files.
+
+
+def explode_law(row):
     """
+    This function splits the normalized text of an identified law into sentences at every period.
 
-    data = get_text()
-    for row in data:
+    Parameters:
+    row (dict): The row of the law in the identified laws CSV file.
 
-        file_path = f"{os.getcwd()}/images/{row['Volume']}/laws/VAactsofassembly_{row['Volume']}_law{row['Chapter']}.txt"
-        output_path = f"{os.getcwd()}/data/exploded/VAactsofassembly_{row['Volume']}_law{row['Chapter']}_exploded.csv"
+    Returns:
+    tuple: The volume, chapter and sentences of the law, or None if its text file does not exist.
+    """
+    file_path = f"{os.getcwd()}/images/{row['Volume']}/laws/VAactsofassembly_{row['Volume']}_law{row['Chapter']}.txt"
 
-        if os.path.exists(file_path):
-            with open(file_path, 'r') as file:
-                text = file.read()
-                text = text.replace('\n', '')
-                sentences = text.split('. ')
+    if os.path.exists(file_path):
+        with open(file_path, 'r') as file:
+            text = normalize.normalized(file.read())
+            return row['Volume'], row['Chapter'], text.split('. ')
 
-                with open(output_path, 'w', newline='') as file:
-                    writer = csv.writer(file)
-                    writer.writerow(['phrase'])
-                    for sentence in sentences:
-                        writer.writerow([sentence])
+    print(f"The file {os.path.basename(file_path)} does not exist.")
+    return None
 
-        else:
-            print(f"The file {os.path.basename(file_path)} does not exist.")
+def iterator(export=False):
+    """
+    This function reads the identified laws and checks if their corresponding text files exist. It splits the text
+    of each law into sentences and saves them to the exploded phrase store, see phrases.py. The store is written
+    again on every run, so it only holds the laws identified now.
+
+    Parameters:
+    export (bool): Also write the sentences of each law to its own CSV file in data/exploded (default is False).
+    """
+    laws = map(explode_law, get_text())
+    phrases.replace_phrases(phrases.EXPLODED_STORE, (law for law in laws if law is not None))
+    if export:
+        export_dir = f"{os.getcwd()}/data/exploded"
+        path_format = f"{export_dir}/VAactsofassembly_{{volume}}_law{{lawnumber}}_exploded.csv"
+        #files of laws that are no longer identified are removed, so the folder matches the store 
+        current = {path_format.format(volume=volume, lawnumber=lawnumber) for volume, lawnumber in phrases.read_index(phrases.EXPLODED_STORE)}
+        if os.path.isdir(export_dir):
+            for file in os.listdir(export_dir):
+                if file.endswith('_exploded.csv') and f"{export_dir}/{file}" not in current:
+                    os.remove(f"{export_dir}/{file}")
+        phrases.export_csv(phrases.EXPLODED_STORE, path_format, 'phrase')
 
 def split_text(volume):
     """
@@ -157,4 +432,5 @@ def split_text(volume):
     laws_data.sort_values(by='Law Number')
     laws_data.to_csv(f"{volume_dir}/{volume}_lawtitles.csv")
 
-tokenize_corpus()
+if __name__ == "__main__":
+    tokenize_corpus(jobs=os.cpu_count(), incremental=True)
@@ -0,0 +1,202 @@
+import os
+import sqlite3
+import time
+import pandas as pd
+
+# the stages of the pipeline in the order they run. The first four are run on individual pages, the last three on
+# a whole volume (gather on every volume at once), but all of them are recorded for each page
+STAGES = ['crop', 'outliers', 'ocr', 'qc', 'break_laws', 'titles', 'gather']
+PAGE_STAGES = ['crop', 'outliers', 'ocr', 'qc']
+
+# a page is pending until its stage has run, then done, failed (an error that is worth retrying), or
+# issue (the stage ran but the page needs to be looked at, e.g. a crop error or outlier, so it is not retried)
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+ISSUE = 'issue'
+
+DB_PATH = os.environ.get('PIPELINE_STATE_DB', os.path.join(os.getcwd(), "pipeline_state.db"))
+
+def connect(path=None):
+    """
+    This function opens the state store, creating it if it does not exist. The store is a SQLite database in
+    write-ahead log mode, so several processes can update it while others read it.
+
+    Parameters:
+    path (str, optional): The database file. Default is DB_PATH, which can be set with PIPELINE_STATE_DB.
+
+    Returns:
+    sqlite3.Connection: The connection.
+    """
+    conn = sqlite3.connect(path or DB_PATH, timeout=60)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""CREATE TABLE IF NOT EXISTS pages (
+                        volume TEXT NOT NULL,
+                        page TEXT NOT NULL,
+                        stage TEXT NOT NULL,
+                        status TEXT NOT NULL,
+                        attempts INTEGER NOT NULL DEFAULT 0,
+                        error TEXT,
+                        updated REAL,
+                        PRIMARY KEY (volume, page, stage))""")
+    conn.commit()
+    return conn
+
+def page_id(filename):
+    """
+    This function returns the id a page is recorded under, the name of its image without the extension, so an
+    image, its crop and its text file all map to the same page.
+    """
+    name = os.path.basename(filename)
+    return name.rsplit('.', 1)[0].replace('_crop', '')
+
+def register_pages(conn, volume, pages):
+    """
+    This function adds pages to the store as pending in every stage. Pages that are already recorded keep their status.
+
+    Parameters:
+    conn (sqlite3.Connection): The state store.
+    volume (str): The volume of the pages.
+    pages (list): The page ids, see page_id.
+
+    Returns:
+    None
+    """
+    with conn:
+        conn.executemany("INSERT OR IGNORE INTO pages (volume, page, stage, status, updated) VALUES (?, ?, ?, ?, ?)",
+                         [(str(volume), page, stage, PENDING, time.time()) for page in pages for stage in STAGES])
+
+def set_status(conn, volume, pages, stage, status, error=None):
+    """
+    This function records the result of a stage for some pages. A page that is done or an issue in a stage has
+    every later stage set back to pending, because their output was made from the earlier result.
+
+    Parameters:
+    conn (sqlite3.Connection): The state store.
+    volume (str): The volume of the pages.
+    pages (list): The page ids.
+    stage (str): The stage, one of STAGES.
+    status (str): DONE, FAILED, ISSUE or PENDING.
+    error (str, optional): What went wrong, for FAILED and ISSUE. Default is None.
+
+    Returns:
+    None
+    """
+    now = time.time()
+    later = STAGES[STAGES.index(stage) + 1:]
+    with conn:
+        #attempts counts the failures in a row, any other result starts it again 
+        conn.executemany("""UPDATE pages SET status = ?, error = ?, updated = ?, 
+                            attempts = CASE WHEN ? = ? THEN attempts + 1 ELSE 0 END
+                            WHERE volume = ? AND page = ? AND stage = ?""",
+                         [(status, error, now, status, FAILED, str(volume), page, stage) for page in pages])
+        if status in (DONE, ISSUE) and later:
+            conn.executemany(f"""UPDATE pages SET status = ?, attempts = 0, error = NULL, updated = ?
+                                 WHERE volume = ? AND page = ? AND stage IN ({','.join('?' * len(later))}) AND status != ?""",
+                             [(PENDING, now, str(volume), page, *later, PENDING) for page in pages])
+
+def pending(conn, volume, stage, max_attempts=3):
+    """
+    This function lists the pages of a volume that a stage still has to run on: pages that are pending, or failed
+    fewer than max_attempts times, and are done in the stage before.
+
+    Parameters:
+    conn (sqlite3.Connection): The state store.
+    volume (str): The volume.
+    stage (str): The stage, one of STAGES.
+    max_attempts (int, optional): The number of times a failed page is tried. Default is 3.
+
+    Returns:
+    list: The page ids in page order.
+    """
+    query = """SELECT s.page FROM pages s
+               WHERE s.volume = ? AND s.stage = ? AND (s.status = ? OR (s.status = ? AND s.attempts < ?))"""
+    args = [str(volume), stage, PENDING, FAILED, max_attempts]
+    if stage != STAGES[0]:
+        query += """ AND EXISTS (SELECT 1 FROM pages p WHERE p.volume = s.volume AND p.page = s.page
+                                 AND p.stage = ? AND p.status = ?)"""
+        args += [STAGES[STAGES.index(stage) - 1], DONE]
+    return [row[0] for row in conn.execute(query + " ORDER BY s.page", args)]
+
+def blocked(conn, volume, stage, max_attempts=3):
+    """
+    This function counts the pages of a volume that could still reach a stage, because an earlier stage still has
+    to run on them. Pages stopped by an issue, or that failed max_attempts times, will not reach it and are not 
+    counted. Volume stages wait until this is zero.
+    """
+    return len({page for earlier in STAGES[:STAGES.index(stage)] for page in pending(conn, volume, earlier, max_attempts)})
+
+def volumes(conn):
+    """
+    This function lists the volumes in the store.
+    """
+    return [row[0] for row in conn.execute("SELECT DISTINCT volume FROM pages ORDER BY volume")]
+
+def page_table(conn, volume=None):
+    """
+    This function reads the store as a table.
+
+    Parameters:
+    conn (sqlite3.Connection): The state store.
+    volume (str, optional): Only read this volume. Default is None, every volume.
+
+    Returns:
+    DataFrame: One row per page and stage.
+    """
+    query = "SELECT volume, page, stage, status, attempts, error, updated FROM pages"
+    if volume is None:
+        return pd.read_sql_query(query, conn)
+    return pd.read_sql_query(query + " WHERE volume = ?", conn, params=[str(volume)])
+
+def volume_summary(conn):
+    """
+    This function summarises the store with one row per volume and, for each stage, the share of pages done
+    along with the number of failed and issue pages.
+
+    Parameters:
+    conn (sqlite3.Connection): The state store.
+
+    Returns:
+    DataFrame: The summary, indexed by volume.
+    """
+    df = page_table(conn)
+    if len(df) == 0:
+        return pd.DataFrame()
+    counts = df.groupby(['volume', 'stage', 'status']).size().unstack(fill_value=0)
+    summary = pd.DataFrame(index=sorted(df['volume'].unique()))
+    summary['pages'] = df[df['stage'] == STAGES[0]].groupby('volume').size()
+    for stage in STAGES:
+        stage_counts = counts.xs(stage, level='stage').reindex(summary.index, fill_value=0)
+        done = stage_counts.get(DONE, 0) / summary['pages']
+        summary[stage] = done.map(lambda share: f"{share:.1%}")
+    for status in (FAILED, ISSUE):
+        summary[status] = df[df['status'] == status].groupby('volume')['page'].nunique().reindex(summary.index, fill_value=0)
+    summary.index.name = 'volume'
+    return summary
+
+def import_volume(conn, volume):
+    """
+    This function records the pages of a volume that was processed before the state store existed, from the
+    files it left behind: the crop manifest for crop and outliers and the text folder for OCR. The text stages
+    after OCR leave nothing per page that shows they ran, so they stay pending.
+
+    Parameters:
+    conn (sqlite3.Connection): The state store.
+    volume (str): The volume.
+
+    Returns:
+    None
+    """
+    from crop import read_manifest
+    volume_dir = os.path.join(os.getcwd(), "images", str(volume))
+    manifest = read_manifest(os.path.join(volume_dir, f"{volume}_cropmanifest.csv"))
+    pages = {page_id(filename): row for filename, row in manifest.items()}
+    text_dir = os.path.join(volume_dir, "text")
+    texts = {page_id(f) for f in os.listdir(text_dir) if f.endswith('.txt')} if os.path.isdir(text_dir) else set()
+    register_pages(conn, volume, sorted(set(pages) | texts))
+    for page, row in pages.items():
+        set_status(conn, volume, [page], 'crop', ISSUE if row['error'] else DONE, 'crop error' if row['error'] else None)
+        if not row['error']:
+            set_status(conn, volume, [page], 'outliers', ISSUE if row['outlier'] else DONE, 'outlier' if row['outlier'] else None)
+    cropped = [page for page in sorted(texts) if page in pages and not (pages[page]['error'] or pages[page]['outlier'])]
+    set_status(conn, volume, cropped, 'ocr', DONE)
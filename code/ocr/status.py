@@ -1,5 +1,6 @@
 import sys, os
 import pandas as pd
+import state
 
 
 
@@ -21,7 +22,14 @@ def volume_data(volume):
     cwd = os.getcwd()
 
     pages = [x for x in os.listdir(f"{cwd}/images/{volume}/originals") if '.jpg' in x]
-    cropped = [x for x in os.listdir(f"{cwd}/images/{volume}/cropped") if '.jpg' in x]
+    if os.path.exists(f"{cwd}/images/{volume}/cropped"):
+        cropped = [x for x in os.listdir(f"{cwd}/images/{volume}/cropped") if '.jpg' in x]
+    else:
+        # volumes cropped without writing images only have their crop boxes in the contour report
+        report = pd.read_csv(f"{cwd}/images/{volume}/{volume}_contourreport.csv")
+        cropped = report[~report['error'].astype(bool)] if 'error' in report.columns else report
+        if 'outlier' in cropped.columns:
+            cropped = cropped[~cropped['outlier'].astype(bool)]
     issues_dir = f"{cwd}/images/{volume}/issues"
     if os.path.exists(issues_dir):
         issues = len([x for x in os.listdir(issues_dir) if '.jpg' in x])
@@ -42,9 +50,18 @@ def prepare_report():
     """
     This function prints a report of the volume processing status, including
     the number of pages, percentage of cropped images, and the number of issues for each volume.
+    When the pipeline state store exists, the report shows the share of pages done in every stage 
+    from the store instead, see state.volume_summary.
     
     The report is presented as a DataFrame and printed to the console.
     """
+    if os.path.exists(state.DB_PATH):
+        conn = state.connect()
+        report = state.volume_summary(conn)
+        conn.close()
+        print(report.to_string())
+        return
+
     cwd = os.getcwd()
     dir = f"{cwd}/images"
     volumes = os.listdir(dir)
@@ -53,7 +70,8 @@ def prepare_report():
     stats_dict = {}
     for i, volume in enumerate(volumes):
         dir = f"{cwd}/images/{volume}"
-        if os.path.exists(f"{cwd}/images/{volume}/cropped") and os.path.isdir(f"{cwd}/images/{volume}"):
+        cropped = os.path.exists(f"{cwd}/images/{volume}/cropped") or os.path.exists(f"{cwd}/images/{volume}/{volume}_contourreport.csv")
+        if cropped and os.path.isdir(f"{cwd}/images/{volume}"):
 
             pages, progress, issues = volume_data(volume)
             stats_dict[i] = {
@@ -0,0 +1,138 @@
+import os
+import random
+import time
+import cv2
+import numpy as np
+import pandas as pd
+from crop import volList, refine_bbox, StreamingOutliers
+from parallel import map_pages
+from crop_functions import PageAnalysis, contour_table, main_bbox
+
+
+def sweep_page(path, dil_iters, x_buffers):
+    """
+    This function finds the crop box of one page for every dil_iter and x_buffer setting of a sweep.
+    The page is read, converted and thresholded once. The dilations are computed in increasing order, each one
+    carried on from the previous setting, and the main bounding box, which does not depend on x_buffer,
+    is found once per dil_iter.
+
+    Parameters:
+    path (str): The image file path.
+    dil_iters (list): The dilation iteration counts to try.
+    x_buffers (list): The horizontal buffers to try.
+
+    Returns:
+    dict: (dil_iter, x_buffer) keys mapped to x1, y1, x2, y2, error tuples.
+    """
+    img = cv2.imread(path)
+    boxes = {}
+    page = None
+    for dil_iter in sorted(dil_iters):
+        page = PageAnalysis(img, dil_iter) if page is None else page.dilated_to(dil_iter)
+        contours, hierarchy = page.contours()
+        c_df = contour_table(img, contours, hierarchy)
+        try:
+            x1, x2, y1, y2 = main_bbox(img, c_df, 0)
+            error = False
+        except:
+            x1, x2, y1, y2 = 0, 0, 0, 0
+            error = True
+        for x_buffer in x_buffers:
+            if error:
+                boxes[(dil_iter, x_buffer)] = (0, 0, 0, 0, True)
+            else:
+                boxes[(dil_iter, x_buffer)] = refine_bbox(page, path, x1 - x_buffer, y1, x2 + x_buffer, y2)
+    return boxes
+
+def _sweep_page_task(task):
+    """
+    This function unpacks a task tuple for sweep_page so it can be sent to a worker process.
+    """
+    return sweep_page(*task)
+
+def setting_stats(boxes, previous=None):
+    """
+    This function summarises the crop boxes of the sample pages for one setting.
+
+    Parameters:
+    boxes (list): x1, y1, x2, y2, error tuples, one per sample page.
+    previous (list, optional): The boxes of the same pages at the previous dil_iter, to measure how far they moved.
+
+    Returns:
+    dict: The error rate, the outlier rate, the median absolute deviation of each coordinate across pages,
+          and the mean shift from the previous setting.
+    """
+    coords = ["x1", "y1", "x2", "y2"]
+    ok = [box for box in boxes if not box[4]]
+    stats = {'pages': len(boxes), 'error_rate': 1 - len(ok) / len(boxes) if boxes else 0.0}
+    outliers = StreamingOutliers(coords)
+    rows = [{f"bbox_{coord}": box[i] for i, coord in enumerate(coords)} for box in ok]
+    for row in rows:
+        outliers.add(row)
+    stats['outlier_rate'] = np.mean([outliers.is_outlier(outliers.scores(row)) for row in rows]) if rows else np.nan
+    for i, coord in enumerate(coords):
+        values = np.array([box[i] for box in ok])
+        stats[f"mad_{coord}"] = np.median(np.abs(values - np.median(values))) if len(values) > 0 else np.nan
+    if previous is not None:
+        moved = [np.abs(np.subtract(a[:4], b[:4])).mean() for a, b in zip(boxes, previous) if not (a[4] or b[4])]
+        stats['shift'] = np.mean(moved) if moved else np.nan
+    else:
+        stats['shift'] = np.nan
+    return stats
+
+def sweep(volume, dil_iters=(18, 24, 27, 30), x_buffers=(10, 20), y_buffers=(5, 20, 30), sample=30, seed=0, jobs=1):
+    """
+    This function tries a grid of crop parameters on a random sample of pages from a volume and reports how stable
+    the crop boxes are for each setting, to help choose dil_iter, x_buffer and y_buffer for the volume.
+    The results are saved to {volume}_sweep.csv, sorted with the most stable settings first.
+
+    The grid costs about one crop pass over the sample: see sweep_page for the work that is shared between settings.
+    y_buffer is passed to main_bbox but does not change the box it returns, so every y_buffer shares the boxes of
+    its dil_iter and x_buffer.
+
+    Parameters:
+    volume (str): The volume number used to locate images and save output.
+    dil_iters (list): The dilation iteration counts to try.
+    x_buffers (list): The horizontal buffers to try.
+    y_buffers (list): The vertical buffers to try.
+    sample (int): The number of pages to sample from the volume. Default is 30.
+    seed (int): The random seed for the sample, so repeated sweeps use the same pages. Default is 0.
+    jobs (int): Number of worker processes the sample pages are spread across. Default is 1.
+
+    Returns:
+    DataFrame: One row per setting with the statistics from setting_stats.
+    """
+    path_list, volume = volList(volume)
+    path_list.sort()
+    pages = sorted(random.Random(seed).sample(path_list, min(sample, len(path_list))))
+    if len(pages) == 0:
+        print(f"No pages to sample for volume {volume}")
+        return None
+
+    start = time.time()
+    tasks = [(path, list(dil_iters), list(x_buffers)) for path in pages]
+    results = list(map_pages(_sweep_page_task, tasks, jobs))
+    print(f"Swept {len(dil_iters) * len(x_buffers) * len(y_buffers)} settings on {len(pages)} pages in {time.time() - start:.1f}s")
+
+    rows = []
+    for x_buffer in x_buffers:
+        previous = None
+        for dil_iter in sorted(dil_iters):
+            boxes = [result[(dil_iter, x_buffer)] for result in results]
+            stats = setting_stats(boxes, previous)
+            previous = boxes
+            for y_buffer in y_buffers:
+                rows.append(dict({'dil_iter': dil_iter, 'x_buffer': x_buffer, 'y_buffer': y_buffer}, **stats))
+    df = pd.DataFrame(rows)
+    df['mad_mean'] = df[["mad_x1", "mad_y1", "mad_x2", "mad_y2"]].mean(axis=1)
+    df = df.sort_values(['error_rate', 'outlier_rate', 'mad_mean']).reset_index(drop=True)
+
+    csv_path = f"{os.getcwd()}/images/{volume}/{volume}_sweep.csv"
+    print(f"Saving CSV to: {csv_path}")
+    df.to_csv(csv_path, index=False)
+    print(df.to_string())
+    return df
+
+if __name__ == "__main__":
+    volume = input("Enter the volume number: ")
+    sweep(volume)
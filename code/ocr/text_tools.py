@@ -1,5 +1,7 @@
 import json
 import re
+import collections
+import multiprocessing
 
 import shutil
 import sys, os, pathlib
@@ -9,37 +11,34 @@ import numpy as np
 import pandas as pd
 import csv
 
+import corpus
+import normalize
+import phrases
 
-def compile_flagged_laws(volume, lawnumber):
+
+def compile_flagged_laws(volume, lawnumber, export=False):
     """
     This function reads a specific law text file from a given volume and law number 
-    Then, it removes line breaks and hypens and splits the text into sentences and saves
-    them into a csv file. 
+    Then, it normalizes the text, see normalize.py, and splits it into sentences and saves
+    them to the flagged phrase store, see phrases.py.
     
     PARAMETERS: 
         volume (str): The volume id of the laws
         lawnumber(int) : The law number within the volume 
+        export (bool): Also save the sentences to a csv file in flagged/ (default is False)
     """
     cwd = os.getcwd()
     path = f"{cwd}/images/{volume}/laws/VAactsofassembly_{volume}_law{lawnumber}.txt"
-    lines = []
     with open(path, 'r', encoding="utf-8") as file:
-        for line in file:
-            # Remove hyphens at end of line
-            line = line.rstrip('-')
-            # Remove line breaks
-            line = line.replace('\n', ' ')
-            # Add line to list
-            lines.append(line)
-        # Join lines into a single string
-        text = ' '.join(lines)
+        # Join hyphenated words and lines into a single string
+        text = normalize.normalized(file.read())
         # Split text at every period
         sentences = text.split('. ')
-        # Create DataFrame from list of sentences
+    phrases.save_phrases(phrases.FLAGGED_STORE, [(volume, lawnumber, sentences)])
+    if export:
         df = pd.DataFrame(sentences, columns=['Sentence'])
-        #saves df 
-    save = f"{cwd}/flagged/VAacts_exploded_{volume}_law{lawnumber}.csv"
-    df.to_csv(save, index=False, encoding="utf-8")
+        save = f"{cwd}/flagged/VAacts_exploded_{volume}_law{lawnumber}.csv"
+        df.to_csv(save, index=False, encoding="utf-8")
 
 
 def merge_txt_save(volume):
@@ -61,46 +60,22 @@ def merge_txt_save(volume):
             with open(f, "rb") as infile:
                 outfile.write(infile.read())
 
-def gather_laws():
+def gather_laws(volumes=None, to_csv=False):
     """
-    This function gathers all law text files from the images directory across all volumes, extracts 
-    volume and law numbers, and saves the combined data into a CSV file.
+    This function gathers all law text files from the images directory across all volumes and saves them, with
+    their volumes and law numbers, to the corpus: one Parquet file per volume, see corpus.py. Volumes are 
+    written one at a time, so the laws of the whole corpus are never held in memory at once. The laws are
+    also normalized for the tools that split them into sentences, see normalize.py.
+    
+    PARAMETERS:
+        volumes (list): The volumes to gather (default is None, every volume with laws).
+        to_csv (bool): Also save the laws to aggregate_laws.csv (default is False). Without pyarrow only the CSV is saved.
     
     Outputs:
-        Saves a CSV file with filenames, volumes, law numbers, and the corresponding law texts.
+        Saves the corpus with filenames, volumes, law numbers, and the corresponding law texts.
     """
-    cwd = os.getcwd()
-    search = f"{cwd}/images/**/laws/*.txt"
-    files = glob.glob(search, recursive=True)
-
-    csv_path = f"{cwd}/aggregate_laws.csv"
-
-    data = []
-    fields = ['filename', 'volume', 'lawnumber', 'lawtext']
-
-    # Save the DataFrame to a CSV file, encoded as UTF-8
-
-    for file in files:
-        filename = os.path.basename(file)
-        if not filename.startswith("preceeding"):
-            #extract volume from filename of laws, igoring content before first law in volume
-            start = filename.index("_") + 1
-            end = filename.index("_", start)
-            volume = filename[start:end]
-
-            #extract law number
-            start = filename.index("law") + len("law")
-            end = filename.index(".", start)
-            lawnumber = int(filename[start:end])
-            with open(file, 'r', encoding="utf-8") as law:
-                lawtext = law.read()
-                data.append({"filename": filename, "volume": volume, "lawnumber": lawnumber, "lawtext": lawtext})
-
-
-    sorted_data = sorted(data, key=lambda x: (x['volume'], x['lawnumber']))
-    df = pd.DataFrame(sorted_data, columns=fields)
-
-    df.to_csv(csv_path, index=False, encoding="utf-8")
+    corpus.write_corpus(volumes, csv_path=corpus.CORPUS_CSV if to_csv else None)
+    normalize.normalize_laws(volumes)
 
 
 
@@ -171,37 +146,119 @@ def qc_regex():
     return chap_law_header
 
 
-def qc_process(volume = False):
+def qc_matcher(patterns=None):
+    """
+    This function compiles the chapter header variants into one pattern that finds all of them in a single pass
+    over a line. Longer variants are tried first, and a variant that contains a variant listed before it is left 
+    out, as the earlier one is always replaced first, so the result is the same as replacing the variants one 
+    after another in their listed order.
+    
+    PARAMETERS:
+        patterns (list, optional): The variants to replace. Uses qc_regex() by default
+    
+    RETURNS:
+        re.Pattern: The compiled pattern.
+    """
+    if patterns is None:
+        patterns = qc_regex()
+    kept = [pattern for i, pattern in enumerate(patterns) if not any(earlier in pattern for earlier in patterns[:i])]
+    kept = sorted(set(kept), key=len, reverse=True)
+    return re.compile('|'.join(re.escape(pattern) for pattern in kept))
+
+QC_MATCHER = qc_matcher()
+
+def qc_file(path, matcher=QC_MATCHER, replacement="Chap."):
+    """
+    This function corrects the chapter headers of one text file. The corrected lines are streamed to a temporary 
+    file that replaces the original in one step, and only if something was corrected.
+    
+    PARAMETERS:
+        path (str): The text file.
+        matcher (re.Pattern, optional): The compiled variants, see qc_matcher
+        replacement (str, optional): The text each variant is replaced with. "Chap." by default
+    
+    RETURNS:
+        collections.Counter: The number of substitutions made for each variant.
+    """
+    counts = collections.Counter()
+    def substitute(match):
+        counts[match.group()] += 1
+        return replacement
+    
+    tmp = f"{path}.tmp"
+    with open(path) as infile, open(tmp, 'w') as outfile:
+        for line in infile:
+            outfile.write(matcher.sub(substitute, line))
+    if counts:
+        os.replace(tmp, path)
+    else:
+        os.remove(tmp)
+    return counts
+
+def qc_process(volume = False, files = None):
     """
     This function processes and corrects OCR errors in text files by replacing various incorrect chapter 
-    header patterns with the standardized term "Chap.".
+    header patterns with the standardized term "Chap.". The number of substitutions made for each variant 
+    is printed and saved to {volume}_qcreport.csv in the volume directory.
     
     PARAMETERS:
         volume (str, optional): The volume identifier to process specific volume text files. 
                                 Processes all directories by default
+        files (list, optional): Only process these text files of the directory. Processes every file by default
     
     RETURNS:
+        collections.Counter: The number of substitutions made for each variant.
         Corrected text files with standardized chapter headers.
     """
     target_dir = f"{os.getcwd()}/process"
+    report_path = f"{os.getcwd()}/process_qcreport.csv"
     if volume:
         target_dir = f"{os.getcwd()}/images/{volume}/text"
-    files = os.listdir(target_dir)
-    lines = []
+        report_path = f"{os.getcwd()}/images/{volume}/{volume}_qcreport.csv"
+    if files is None:
+        files = sorted(os.listdir(target_dir))
+    counts = collections.Counter()
     for file in files:
-        print(file)
-        path = f"{target_dir}/{file}"
         if pathlib.Path(file).suffix == '.txt':
-            with open(path) as infile:
-                for line in infile:
-                    for pattern in qc_regex():
-                        line = line.replace(pattern, "Chap.")
-                    lines.append(line)
-            with open(path, 'w') as outfile:
-                for line in lines:
-                    outfile.write(line)
-        lines = []
-    print("Processed OCR Corrections")
+            counts.update(qc_file(f"{target_dir}/{file}"))
+    report = pd.DataFrame(counts.most_common(), columns=['variant', 'substitutions'])
+    report.to_csv(report_path, index=False)
+    print(f"Processed OCR Corrections: {sum(counts.values())} substitutions in {len(files)} files")
+    if len(report) > 0:
+        print(report.to_string(index=False))
+    return counts
+
+def _qc_volume_task(volume):
+    """
+    This function runs qc_process on a volume in a worker process and returns the volume with its counts.
+    """
+    return volume, qc_process(volume)
+
+def qc_volumes(volumes=None, jobs=1):
+    """
+    This function corrects the chapter headers of several volumes, in a pool of worker processes when jobs is 
+    greater than one, and saves the substitutions of every variant in every volume to qc_report.csv.
+    
+    PARAMETERS:
+        volumes (list, optional): The volumes to process. Every volume with a text folder by default
+        jobs (int, optional): The number of volumes processed at the same time. 1 by default
+    
+    RETURNS:
+        DataFrame: The number of substitutions for each volume and variant.
+    """
+    cwd = os.getcwd()
+    if volumes is None:
+        volumes = sorted(v for v in os.listdir(f"{cwd}/images") if os.path.isdir(f"{cwd}/images/{v}/text"))
+    if jobs > 1:
+        with multiprocessing.Pool(jobs) as pool:
+            results = pool.map(_qc_volume_task, volumes)
+    else:
+        results = [_qc_volume_task(volume) for volume in volumes]
+    rows = [(volume, variant, count) for volume, counts in results for variant, count in counts.items()]
+    report = pd.DataFrame(rows, columns=['volume', 'variant', 'substitutions'])
+    report.to_csv(f"{cwd}/qc_report.csv", index=False)
+    print(report.groupby('variant')['substitutions'].sum().sort_values(ascending=False).to_string())
+    return report
 
 def comp_issues():
     """
@@ -223,29 +280,106 @@ def comp_issues():
                 #issues.append(filepath)
                 shutil.copy(filepath, f"../../issues/{file}")
 
+# chapter headers that start a law, "Chap. ##." before 1950 and "CHAPTER ##" on a line of its own after
+PRE_1950_LAW = re.compile(r"Chap\. \d+(\,|\.)", re.IGNORECASE)
+POST_1950_LAW = re.compile(r"CHAPTER\s*(\d+)\s*\n", re.IGNORECASE)
+LAW_NUMBER = re.compile(r'\d+')
+TITLE_HEADER = re.compile(r"CHAPTER\s+(\d+)", re.IGNORECASE)
+
+def law_title(para):
+    """
+    This function finds the law number and title in the first paragraph of a law.
+    
+    PARAMETERS:
+        para (str): The lines of the first paragraph joined with spaces.
+    
+    RETURNS:
+        list: The law number, or "Unknown" if the paragraph has no chapter header, and the title.
+    """
+    lawmatch = TITLE_HEADER.search(para)
+    if lawmatch:
+        numbermatch = LAW_NUMBER.search(lawmatch.group())
+        return [numbermatch.group(), para[numbermatch.end()+2:]]
+    # Use the whole paragraph if no match
+    return ["Unknown", para]
+
+class LawWriter:
+    """
+    This class appends lines to one law file and collects the first paragraph of the law as they go by, split
+    into lines the same way reading the finished file back would split them, so the title is known without 
+    reading the file again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.para = []
+        self.partial = ''
+        self.title_done = False
+
+    def write(self, line):
+        if self.file is None:
+            self.file = open(self.path, mode='a')
+        self.file.write(line)
+        if not self.title_done:
+            #a page can end without a line break, its last line then runs on into the next line written
+            text = self.partial + line
+            self.partial = ''
+            if text.endswith('\n'):
+                self.add_title_line(text)
+            else:
+                self.partial = text
+
+    def add_title_line(self, line):
+        cleaned = line.rstrip('\n')
+        if cleaned == '':
+            self.title_done = True
+        else:
+            self.para.append(cleaned)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def title(self):
+        if not self.title_done and self.partial:
+            self.add_title_line(self.partial)
+            self.partial = ''
+        return law_title(' '.join(self.para))
+
 def break_laws(volume):
     """
     This function splits large text files into individual law text files based on specific patterns for chapter headers.
     The function handles volumes before and after 1950 differently due to variations in chapter header formats.
+    The law titles are found in the same pass and saved as extract_titles would save them.
+
+    The laws are written to a temporary folder that replaces the laws folder once the volume is done, so running
+    it again gives the same files instead of appending to the old ones. Only the law being written is kept open,
+    a law that continues after another one is opened again to append to it.
     
     PARAMETERS:
         volume (str): The volume id of the text files.
     
     RETURNS:
-        Creates individual law text files and a CSV file mapping pages to law numbers.
+        Creates individual law text files, a CSV file mapping pages to law numbers and a CSV file of law titles.
     """
     text_dir = f"{os.getcwd()}/images/{volume}/text"
     target_dir = f"{os.getcwd()}/images/{volume}/laws"
     volume_dir = f"{os.getcwd()}/images/{volume}"
-    if not os.path.exists(target_dir):
-        os.mkdir(target_dir)
+    tmp_dir = f"{target_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.mkdir(tmp_dir)
     files = os.listdir(text_dir)
     files.sort()
+    # Determine the correct pattern based on the volume year
+    pattern = PRE_1950_LAW if int(volume) < 1950 else POST_1950_LAW
 
     data = []
     lawnumber = "preceeding"
-    target = f"{target_dir}/preceedingmaterials_{volume}.txt"
-    numbermatch = False
+    target = f"preceedingmaterials_{volume}.txt"
+    writers = {}
+    writer = None
 
     for file in files:
         path = f"{text_dir}/{file}"
@@ -256,21 +390,11 @@ def break_laws(volume):
 
             with open(path) as infile:
                 for line in infile:
-                    # Determine the correct pattern based on the volume year
-                    if int(volume) < 1950:
-                        # Pattern match for pre-1950 volumes using phrase "Chap. ##."
-                        pattern = re.compile(r"Chap\. \d+(\,|\.)", re.IGNORECASE)
-                    else:
-                        # Pattern match for post-1950 volumes using phrase "CHAPTER. ##."
-                        pattern = re.compile(r"CHAPTER\s*(\d+)\s*\n", re.IGNORECASE)
-
                     lawmatch = pattern.search(line)
                     if lawmatch:
-                        numberpattern = re.compile(r'\d+')
-                        numbermatch = numberpattern.search(lawmatch.group())
+                        numbermatch = LAW_NUMBER.search(lawmatch.group())
                         lawnumber = numbermatch.group()
-                        filename = f"VAactsofassembly_{volume}_law{lawnumber}.txt"
-                        target = f"{target_dir}/{filename}"
+                        target = f"VAactsofassembly_{volume}_law{lawnumber}.txt"
                         data.append([pageid, lawnumber])
                     else:
                         if new:
@@ -278,18 +402,45 @@ def break_laws(volume):
                     new = False
 
                     # Append the line to the appropriate law file
-                    with open(target, mode='a') as law:
-                        law.write(line)
-
-    # Save the page and law number mapping to a CSV file
+                    if writer is None or writer.path != f"{tmp_dir}/{target}":
+                        if writer is not None:
+                            writer.close()
+                        writer = writers.setdefault(target, LawWriter(f"{tmp_dir}/{target}"))
+                    writer.write(line)
+    if writer is not None:
+        writer.close()
+
+    # Swap the new laws in, then save the page and law number mapping and the titles to CSV files
+    #a run that stopped during the swap leaves laws.old behind, which the rename below cannot replace 
+    shutil.rmtree(f"{target_dir}.old", ignore_errors=True)
+    if os.path.exists(target_dir):
+        os.replace(target_dir, f"{target_dir}.old")
+    os.replace(tmp_dir, target_dir)
+    shutil.rmtree(f"{target_dir}.old", ignore_errors=True)
     laws_data = pd.DataFrame(data, columns=['Page', 'Law Number'])
-    laws_data.to_csv(f"{volume_dir}/{volume}_lawpages.csv")
+    laws_data.to_csv(f"{volume_dir}/{volume}_lawpages.csv.tmp")
+    os.replace(f"{volume_dir}/{volume}_lawpages.csv.tmp", f"{volume_dir}/{volume}_lawpages.csv")
+    save_titles(volume, [law.title() for law in writers.values()])
     print("Processed Laws")
 
+def save_titles(volume, laws):
+    """
+    This function saves the law numbers and titles of a volume to {volume}_lawtitles.csv.
+    
+    PARAMETERS:
+        volume (str): The volume id of the text files.
+        laws (list): The [law number, title] of each law file.
+    """
+    volume_dir = f"{os.getcwd()}/images/{volume}"
+    laws_data = pd.DataFrame(laws, columns=['Law Number', 'Law Title'])
+    laws_data.to_csv(f"{volume_dir}/{volume}_lawtitles.csv.tmp")
+    os.replace(f"{volume_dir}/{volume}_lawtitles.csv.tmp", f"{volume_dir}/{volume}_lawtitles.csv")
+
 def extract_titles(volume):
     """
     This function gathers law titles from individual law text files based on chapter headers and content,
-    and saves the law numbers and titles into a CSV file.
+    and saves the law numbers and titles into a CSV file. break_laws already saves the titles of the laws it
+    writes, this is for law files that were split some other way.
     
     PARAMETERS:
         volume (str): The volume id of the text files.
@@ -299,14 +450,12 @@ def extract_titles(volume):
     """
     #define directories for law files and folder
     laws_dir = f"{os.getcwd()}/images/{volume}/laws"
-    volume_dir = f"{os.getcwd()}/images/{volume}"
-    files = os.listdir(laws_dir)
+    files = sorted(os.listdir(laws_dir))
 
     laws = []
     for file in files:
         print(file)
         para = []
-        data = []
         path = f"{laws_dir}/{file}"
         if pathlib.Path(file).suffix == '.txt':
             with open(path) as infile:
@@ -316,25 +465,6 @@ def extract_titles(volume):
                         para.append(cleaned)
                     if cleaned == '':
                         break
-        para = ' '.join(para)
-        #pattern to find chapter headers indicating the start of a law 
-        pattern = re.compile(r"CHAPTER\s+(\d+)", re.IGNORECASE)
-        lawmatch = pattern.search(para)
-
-        if lawmatch:
-            numberpattern = re.compile(r'\d+')
-            numbermatch = numberpattern.search(lawmatch.group())
-            lawnumber = numbermatch.group()
-            posend = numbermatch.end()
-            title = para[posend+2:]
-        else:
-            title = para  # Use the whole paragraph if no match
-            lawnumber = "Unknown"  # Assign a default value for the law number
-
-        data = [lawnumber, title]
-        laws.append(data)
-
-    laws_data = pd.DataFrame(laws, columns=['Law Number', 'Law Title'])
-    laws_data.sort_values(by='Law Number')
-    laws_data.to_csv(f"{volume_dir}/{volume}_lawtitles.csv")
+        laws.append(law_title(' '.join(para)))
 
+    save_titles(volume, laws)
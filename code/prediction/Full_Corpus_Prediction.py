@@ -1,9 +1,11 @@
 import os
+import sys
 import transformers
 from datasets import Dataset
 import pandas as pd
 from transformers import pipeline
 import cuda 
+from dedup import cluster_sentences, sentence_hash
 
 """
     We used this script to predict on the entire corpus. The corpus contained 445,824 sentences after cleaning,
@@ -24,9 +26,9 @@ index1 = int(sys.argv[2])
 index2 = int(sys.argv[3])
 
 # # Load the corpus CSV file into a DataFrame
-df = pd.read_csv('newfullcorpus_2024.csv')
-df.drop(columns = 'Unnamed: 0', inplace=True)
-df = df.iloc[index1:index2 + 1] # This specifies the indexed sentences in the corpus. 
+corpus = pd.read_csv('newfullcorpus_2024.csv')
+corpus.drop(columns = 'Unnamed: 0', inplace=True)
+df = corpus.iloc[index1:index2 + 1].copy() # This specifies the indexed sentences in the corpus. 
 #The +1 is a very important addition as it guarantees the last sentence in the index is included in the indexing.
 
 # Initialize the UVA finetuned model and tokenizer inference pipeline for text classification
@@ -35,9 +37,34 @@ nlp = pipeline("sentiment-analysis", model="UVAJC_Final_bertmodel", tokenizer="U
 # Define the name of the text column in your CSV
 text_column = 'Sentence'  
 
-# Perform inference and add the inferred labels to a new column. The Model Jim_Crow column creates a parallel column with 0 and 1 
+# Sentences that are the same once normalized are classified once. The clusters of the whole corpus are made once with
+# `python dedup.py newfullcorpus_2024.csv` so every batch classifies a cluster from the same sentence; without them
+# the clusters of this batch are made here. Clusters are joined to the sentences by the hash of their text, so a 
+# cluster file made from another version of the corpus stops the batch instead of giving sentences the wrong label.
+texts = corpus[text_column].fillna('').astype(str)
+hashes = texts.map(sentence_hash)
+df['Hash'] = hashes.iloc[index1:index2 + 1].to_numpy()
+if os.path.exists('sentence_clusters.csv'):
+    clusters = pd.read_csv('sentence_clusters.csv', usecols=['hash', 'representative'])
+    representative = clusters.drop_duplicates('hash').set_index('hash')['representative']
+    missing = ~df['Hash'].isin(representative.index)
+    if missing.any():
+        raise ValueError(f"{int(missing.sum())} sentences of this batch are not in sentence_clusters.csv, "
+                         f"run dedup.py on newfullcorpus_2024.csv again")
+    df['Cluster'] = df['Hash'].map(representative)
+else:
+    clusters = cluster_sentences(texts.iloc[index1:index2 + 1].tolist())
+    df['Cluster'] = df['Hash'].to_numpy()[clusters['cluster'].to_numpy()]
 
-df['Inferred_Label'] = df[text_column].apply(lambda x: nlp(x)[0]['label'])
+# Perform inference on the first sentence of each cluster and copy the label to the other sentences. 
+# The Model Jim_Crow column creates a parallel column with 0 and 1 
+representatives = df['Cluster'].unique()
+sentence_of = dict(zip(hashes, texts))
+if not all(cluster in sentence_of for cluster in representatives):
+    raise ValueError("sentence_clusters.csv has representatives that are not in newfullcorpus_2024.csv, run dedup.py again")
+print(f"Classifying {len(representatives)} clusters for {len(df)} sentences ({1 - len(representatives) / len(df):.1%} saved)")
+labels = [result['label'] for result in nlp([sentence_of[cluster] for cluster in representatives], batch_size=32)]
+df['Inferred_Label'] = df['Cluster'].map(dict(zip(representatives, labels)))
 df['Model Jim_Crow'] = df['Inferred_Label'].apply(lambda x: 1 if x == 'jim_crow' else 0)
 
 
@@ -0,0 +1,206 @@
+import argparse
+import hashlib
+import os
+import re
+import numpy as np
+import pandas as pd
+
+"""
+    Session laws repeat a lot of text: enacting clauses, "This act shall be in force..." and the same amendments.
+    This script groups the sentences of the corpus into clusters of sentences that are the same once normalized,
+    so the model only has to classify one sentence of each cluster and the label is copied to the others.
+
+    Near duplicates can also be found, with MinHash over character shingles and locality sensitive hashing (LSH)
+    on bands of the signatures, but they are only reported: a near duplicate can differ in a single word that
+    changes its meaning ("white" or "colored"), so it is classified on its own and never inherits a label.
+"""
+
+SHINGLE = 5
+NUM_PERM = 64
+BANDS = 8
+THRESHOLD = 0.9
+NONWORD = re.compile(r"[^a-z0-9 ]+")
+SPACES = re.compile(r"\s+")
+
+def normalize_sentence(sentence):
+    """
+    This function reduces a sentence to the form it is compared in: lower case letters, digits and single spaces.
+    """
+    sentence = NONWORD.sub(' ', str(sentence).lower())
+    return SPACES.sub(' ', sentence).strip()
+
+def minhash_signatures(texts, num_perm=NUM_PERM, shingle=SHINGLE, seed=0, chunk_grams=2000000):
+    """
+    This function computes the MinHash signature of each text over its character shingles. Every shingle is
+    packed into an integer and hashed with num_perm multiply-shift hash functions, and the signature holds the
+    smallest hash of each function. Texts are hashed in chunks of about chunk_grams shingles to bound memory.
+
+    Parameters:
+    texts (list): The normalized texts.
+    num_perm (int): The number of hash functions. Default is NUM_PERM.
+    shingle (int): The length of the shingles in bytes, up to 7. Default is SHINGLE.
+    seed (int): The seed of the hash functions. Default is 0.
+    chunk_grams (int): The number of shingles hashed at once. Default is 2,000,000.
+
+    Returns:
+    tuple: The signatures (uint32 array, one row per text) and a boolean array of the texts long enough to have shingles.
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 2**63, num_perm, dtype=np.uint64) | np.uint64(1)
+    b = rng.integers(0, 2**63, num_perm, dtype=np.uint64)
+    encoded = [text.encode('utf-8') for text in texts]
+    grams = np.array([max(len(text) - shingle + 1, 0) for text in encoded], dtype=np.int64)
+    signatures = np.full((len(texts), num_perm), np.iinfo(np.uint32).max, dtype=np.uint32)
+
+    start = 0
+    while start < len(texts):
+        #take texts until the chunk holds chunk_grams shingles
+        stop = start + max(1, int(np.searchsorted(np.cumsum(grams[start:]), chunk_grams)))
+        stop = min(stop, len(texts))
+        rows = np.arange(start, stop)[grams[start:stop] > 0]
+        if len(rows) > 0:
+            buffer = np.frombuffer(b''.join(encoded[i] for i in rows), dtype=np.uint8).astype(np.uint64)
+            lengths = np.array([len(encoded[i]) for i in rows], dtype=np.int64)
+            offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+            counts = grams[rows]
+            segments = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            positions = np.repeat(offsets, counts) + np.arange(counts.sum()) - np.repeat(segments, counts)
+            values = np.zeros(len(positions), dtype=np.uint64)
+            for j in range(shingle):
+                values = (values << np.uint64(8)) | buffer[positions + j]
+            for p in range(num_perm):
+                hashed = (values * a[p] + b[p]) >> np.uint64(32)
+                signatures[rows, p] = np.minimum.reduceat(hashed, segments).astype(np.uint32)
+        start = stop
+    return signatures, grams > 0
+
+def sentence_hash(sentence):
+    """
+    This function returns the hash a sentence is kept under in the cluster file, so the clusters are joined to
+    the corpus by their text rather than by their position.
+    """
+    return hashlib.sha1(str(sentence).encode('utf-8')).hexdigest()
+
+def lsh_clusters(signatures, valid, bands=BANDS, threshold=THRESHOLD):
+    """
+    This function groups texts whose signatures agree on every row of at least one band. A text only joins a
+    cluster if its signature agrees on at least a threshold share of all rows, an estimate of the Jaccard 
+    similarity of their shingles, with the signature of the first text of the cluster itself. Clusters are not
+    joined to each other, so texts that are each similar to the next do not chain into one cluster.
+
+    Parameters:
+    signatures (numpy.ndarray): The MinHash signatures, see minhash_signatures.
+    valid (numpy.ndarray): The texts that have shingles, the others are not joined to anything.
+    bands (int): The number of bands, which must divide the signature length. Default is BANDS.
+    threshold (float): The smallest estimated similarity of texts that are joined. Default is THRESHOLD.
+
+    Returns:
+    numpy.ndarray: The cluster of each text, as the index of the first text of the cluster.
+    """
+    parents = np.arange(len(signatures))
+    #texts that other texts have joined, they stay the first text of their cluster 
+    joined = np.zeros(len(signatures), dtype=bool)
+    candidates = np.flatnonzero(valid)
+    rows = signatures.shape[1] // bands
+    for band in range(bands):
+        keys = np.ascontiguousarray(signatures[candidates, band * rows:(band + 1) * rows]).view(np.dtype((np.void, rows * 4))).ravel()
+        _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+        shared = counts[inverse] > 1
+        if not shared.any():
+            continue
+        order = np.argsort(inverse[shared], kind='stable')
+        members = candidates[shared][order]
+        buckets = inverse[shared][order]
+        bounds = np.flatnonzero(np.diff(buckets)) + 1
+        for bucket in np.split(members, bounds):
+            bucket = np.sort(bucket)
+            for j, other in enumerate(bucket[1:], start=1):
+                if parents[other] != other or joined[other]:
+                    continue
+                roots = np.unique(parents[bucket[:j]])
+                similar = roots[(signatures[roots] == signatures[other]).mean(axis=1) >= threshold]
+                if len(similar) > 0:
+                    parents[other] = similar[0]
+                    joined[similar[0]] = True
+    return parents
+
+def cluster_sentences(sentences, near=False, num_perm=NUM_PERM, bands=BANDS, threshold=THRESHOLD):
+    """
+    This function groups sentences that are the same once normalized, see normalize_sentence. If near is set,
+    the near duplicates of each sentence are found as well, see lsh_clusters, but they keep their own cluster.
+
+    Parameters:
+    sentences (list): The sentences.
+    near (bool): Also find near duplicates. Default is False.
+    num_perm, bands, threshold: The MinHash and LSH settings, see minhash_signatures and lsh_clusters.
+
+    Returns:
+    DataFrame: One row per sentence with its cluster, the position of the first sentence of the cluster, which
+    is the one classified, its near cluster, the position of the first sentence it is a near duplicate of, and
+    how it joined its cluster: 'representative', 'exact' or, for the first sentence of a cluster that is a near
+    duplicate of another cluster, 'near'.
+    """
+    normalized = [normalize_sentence(sentence) for sentence in sentences]
+    codes, uniques = pd.factorize(pd.Series(normalized, dtype=object))
+    #the first sentence with each normalized text
+    first = np.full(len(uniques), len(codes), dtype=np.int64)
+    np.minimum.at(first, codes, np.arange(len(codes)))
+
+    near_clusters = np.arange(len(uniques))
+    if near and len(uniques) > 1:
+        signatures, valid = minhash_signatures(list(uniques), num_perm=num_perm)
+        near_clusters = lsh_clusters(signatures, valid, bands=bands, threshold=threshold)
+    #uniques are in order of their first sentence, so the first text of a near cluster has its first sentence
+    cluster = first[codes]
+    near_cluster = first[near_clusters][codes]
+
+    positions = np.arange(len(codes))
+    match = np.where(cluster != positions, 'exact', np.where(near_cluster != positions, 'near', 'representative'))
+    return pd.DataFrame({'cluster': cluster, 'near_cluster': near_cluster, 'match': match})
+
+def savings_report(clusters, output=None):
+    """
+    This function reports how much inference the clusters save.
+
+    Parameters:
+    clusters (DataFrame): The clusters, see cluster_sentences.
+    output (str, optional): A CSV file to save the report to. Default is None.
+
+    Returns:
+    dict: The number of sentences, clusters, exact duplicates, clusters that are near duplicates of another, 
+    which are still classified, and the share of inference saved.
+    """
+    sentences = len(clusters)
+    counts = clusters['match'].value_counts()
+    report = {'sentences': sentences,
+              'clusters': int(counts.get('representative', 0) + counts.get('near', 0)),
+              'exact_duplicates': int(counts.get('exact', 0)),
+              'near_duplicates': int(counts.get('near', 0))}
+    report['inference_saved'] = 1 - report['clusters'] / sentences if sentences else 0.0
+    print(f"{report['sentences']} sentences in {report['clusters']} clusters "
+          f"({report['exact_duplicates']} exact duplicates, {report['near_duplicates']} clusters near duplicates of another), "
+          f"{report['inference_saved']:.1%} of inference saved")
+    if output:
+        pd.DataFrame([report]).to_csv(output, index=False)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Group the sentences of the corpus into clusters of duplicates.")
+    parser.add_argument("corpus", nargs="?", default='newfullcorpus_2024.csv')
+    parser.add_argument("--column", default='Sentence')
+    parser.add_argument("--output", default='sentence_clusters.csv')
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    parser.add_argument("--near", action='store_true', help="also report near duplicates, they are still classified on their own")
+    args = parser.parse_args()
+    corpus = pd.read_csv(args.corpus, usecols=lambda column: column in (args.column, 'SID'))
+    sentences = corpus[args.column].fillna('').astype(str).tolist()
+    clusters = cluster_sentences(sentences, near=args.near, threshold=args.threshold)
+    #the prediction joins the clusters to the corpus by the hash of each sentence and of its representative
+    hashes = np.array([sentence_hash(sentence) for sentence in sentences], dtype=object)
+    clusters.insert(0, 'hash', hashes)
+    clusters.insert(1, 'representative', hashes[clusters['cluster'].to_numpy()])
+    if 'SID' in corpus.columns:
+        clusters.insert(0, 'SID', corpus['SID'].to_numpy())
+    clusters.to_csv(args.output, index=False)
+    savings_report(clusters, f"{os.path.splitext(args.output)[0]}_savings.csv")